@@ -0,0 +1,153 @@
+"""
+Local activity pre-filter for skipping model calls on quiet footage.
+
+Before frames are sent to the model, the sampled frames are checked for
+activity with vectorized frame-difference energy on small grayscale
+thumbnails. Two signals are measured: the share of pixels that change
+between consecutive frames, and the share that deviate from the clip's
+median background, which catches objects that stay put for a while. Clips
+below the camera profile's threshold are classified as static, and the
+analyzer returns a "no activity" result without calling the model.
+"""
+import os
+import json
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from frame_selection import make_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Pre-filter is off by default (override per request with prefilter=true/false)
+ACTIVITY_PREFILTER = os.environ.get('ACTIVITY_PREFILTER', 'false').lower() in ('1', 'true', 'yes')
+DEFAULT_CAMERA_PROFILE = os.environ.get('CAMERA_PROFILE', 'default')
+
+# Optional JSON file with extra or overriding profiles: {"gate-cam": {"pixel_threshold": 30, ...}}
+CAMERA_PROFILES_FILE = os.environ.get('CAMERA_PROFILES_FILE')
+
+# Thumbnail width for activity measurement; wider than the motion-selection
+# thumbnails so that small or distant subjects still cover a few pixels
+ACTIVITY_THUMBNAIL_WIDTH = 160
+
+# pixel_threshold: grayscale change (0-255) for a pixel to count as changed
+# min_changed_fraction: share of changed pixels in any frame for the clip to count as active
+CAMERA_PROFILES = {
+    'default': {'pixel_threshold': 25, 'min_changed_fraction': 0.005},
+    'indoor': {'pixel_threshold': 18, 'min_changed_fraction': 0.002},
+    # Foliage, clouds and rain move constantly outdoors
+    'outdoor': {'pixel_threshold': 35, 'min_changed_fraction': 0.01},
+    # Low-light sensor noise
+    'night': {'pixel_threshold': 40, 'min_changed_fraction': 0.01},
+}
+
+
+def load_camera_profiles(path: Optional[str] = CAMERA_PROFILES_FILE) -> Dict[str, Dict[str, float]]:
+    """Return the built-in camera profiles merged with those in ``path``."""
+    profiles = {name: dict(settings) for name, settings in CAMERA_PROFILES.items()}
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            for name, settings in json.load(f).items():
+                profiles[name] = {**profiles.get(name, CAMERA_PROFILES['default']), **settings}
+    return profiles
+
+
+_profiles = load_camera_profiles()
+
+
+def resolve_camera_profile(name: Optional[str] = None) -> Tuple[str, Dict[str, float]]:
+    """
+    Return ``(name, thresholds)`` for a camera profile.
+
+    Raises:
+        ValueError: If the profile does not exist
+    """
+    name = (name or DEFAULT_CAMERA_PROFILE).strip().lower()
+    if name not in _profiles:
+        raise ValueError(f"Unknown camera_profile '{name}'. Use one of: {', '.join(sorted(_profiles))}")
+    return name, _profiles[name]
+
+
+def measure_activity_thumbnails(thumbnails: np.ndarray, profile: Optional[str] = None) -> Dict[str, Any]:
+    """Classify a (N, H, W) grayscale thumbnail stack as static or active."""
+    name, thresholds = resolve_camera_profile(profile)
+    pixel_threshold = thresholds['pixel_threshold']
+    min_fraction = thresholds['min_changed_fraction']
+
+    count = len(thumbnails)
+    if count < 2:
+        # A single frame says nothing about activity; never skip on it
+        return {'profile': name, 'static': False, 'frames_checked': count, 'activity_score': None,
+                'threshold': min_fraction}
+
+    thumbnails = thumbnails.astype(np.float32, copy=False)
+    changed = (np.abs(np.diff(thumbnails, axis=0)) > pixel_threshold).mean(axis=(1, 2))
+    background = np.median(thumbnails, axis=0)
+    deviation = (np.abs(thumbnails - background) > pixel_threshold).mean(axis=(1, 2))
+    score = float(max(changed.max(), deviation.max()))
+
+    return {
+        'profile': name,
+        'static': score < min_fraction,
+        'frames_checked': count,
+        'activity_score': round(score, 5),
+        'max_changed_fraction': round(float(changed.max()), 5),
+        'max_background_deviation': round(float(deviation.max()), 5),
+        'threshold': min_fraction
+    }
+
+
+def measure_activity(frames: List[np.ndarray], profile: Optional[str] = None) -> Dict[str, Any]:
+    """Classify decoded BGR frames as static or active."""
+    return measure_activity_thumbnails(make_thumbnails(frames, ACTIVITY_THUMBNAIL_WIDTH), profile)
+
+
+def no_activity_result(activity: Dict[str, Any], frames_available: int) -> Dict[str, Any]:
+    """Analysis result returned instead of a model call for a static clip."""
+    # How clearly the clip is below the activity threshold
+    confidence = 1.0 - min(1.0, (activity.get('activity_score') or 0.0) / activity['threshold'])
+    return {
+        'has_anomaly': False,
+        'confidence_score': round(confidence, 3),
+        'anomaly_type': 'No activity detected',
+        'detected_frames': [],
+        'timestamps': [],
+        'description': (f"No activity detected in the sampled frames (camera profile "
+                        f"'{activity['profile']}'); the model was not called."),
+        'recommendations': 'No special recommendations',
+        'analysis_metadata': {
+            'frames_analyzed': 0,
+            'total_frames_available': frames_available,
+            'model_used': None,
+            'prefilter': activity
+        }
+    }
+
+
+class PrefilterStats:
+    """Thread-safe counters of pre-filter decisions in this process."""
+
+    def __init__(self):
+        self.checked = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def record(self, static: bool):
+        with self._lock:
+            self.checked += 1
+            if static:
+                self.skipped += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled_by_default': ACTIVITY_PREFILTER,
+                'checked': self.checked,
+                'skipped_model_calls': self.skipped,
+                'skip_rate': round(self.skipped / self.checked, 4) if self.checked else 0.0
+            }
+
+
+prefilter_stats = PrefilterStats()
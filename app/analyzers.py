@@ -0,0 +1,101 @@
+"""
+Analyzer backend interface and factory.
+
+The application talks to an analyzer through ``VideoAnalyzer``; the backend
+is chosen with the ANALYZER_BACKEND environment variable:
+
+- ``azure``: Azure OpenAI (``AzureAIVideoAnalyzer``), the default
+- ``fake``: in-process stand-in for load testing and benchmarks
+  (``FakeVideoAnalyzer``), which never calls Azure
+"""
+import os
+import logging
+from typing import List, Dict, Any, Optional, Callable
+
+from activity_filter import prefilter_stats, no_activity_result
+from frame_encoding import EncodedFrame
+from metrics import MODEL_CALLS
+
+logger = logging.getLogger(__name__)
+
+ANALYZER_BACKENDS = ('azure', 'fake')
+
+
+class VideoAnalyzer:
+    """Interface implemented by all analyzer backends."""
+
+    backend = None
+    deployment_name = None
+    deployment_pool = None
+
+    def analyze_frames(self, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict) -> Dict[str, Any]:
+        """
+        Analyze video frames for anomalies.
+
+        Args:
+            frames: Encoded frames (JPEG bytes with frame number, timestamp and detail level)
+            anomaly_prompt: User-specified anomaly types to detect
+            video_info: Video metadata information
+
+        Returns:
+            Dictionary containing analysis results
+        """
+        raise NotImplementedError
+
+    def analyze_frames_streaming(self, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict,
+                                 on_partial: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        Analyze video frames, calling ``on_partial`` with result fields as they are generated.
+
+        Backends that cannot stream return the complete result without partial updates.
+        """
+        return self.analyze_frames(frames, anomaly_prompt, video_info)
+
+    def test_connection(self) -> Dict[str, Any]:
+        """Test the connection to the model service."""
+        raise NotImplementedError
+
+    def prefilter_result(self, frames: List[EncodedFrame], video_info: Dict) -> Optional[Dict[str, Any]]:
+        """
+        Return a "no activity" result, without calling the model, for frames the pre-filter found static.
+
+        ``video_info['activity']`` is set at frame extraction when the
+        activity pre-filter is enabled; without it every call goes ahead.
+        """
+        activity = video_info.get('activity')
+        if not activity:
+            return None
+        prefilter_stats.record(activity['static'])
+        if activity['static']:
+            MODEL_CALLS.labels(outcome='skipped').inc()
+            return no_activity_result(activity, len(frames))
+        return None
+
+    def client_stats(self) -> Dict[str, Any]:
+        """Rate limiting, retry and coalescing counters of the model client, if available."""
+        client = getattr(self, 'client', None)
+        return client.stats() if hasattr(client, 'stats') else {}
+
+    def deployment_stats(self) -> Optional[Dict[str, Any]]:
+        """Per-deployment health and counters when calls are spread over a deployment pool."""
+        return self.deployment_pool.stats() if self.deployment_pool is not None else None
+
+
+def get_analyzer_backend() -> str:
+    """Return the configured analyzer backend name."""
+    backend = os.environ.get('ANALYZER_BACKEND', 'azure').strip().lower()
+    if backend not in ANALYZER_BACKENDS:
+        raise ValueError(f"Unsupported ANALYZER_BACKEND '{backend}'. Use one of: {', '.join(ANALYZER_BACKENDS)}")
+    return backend
+
+
+def create_analyzer(backend: str = None) -> VideoAnalyzer:
+    """Create the analyzer for ``backend`` (default: ANALYZER_BACKEND)."""
+    backend = backend or get_analyzer_backend()
+    if backend == 'fake':
+        from fake_analyzer import FakeVideoAnalyzer
+        logger.info("Using fake analyzer backend - no Azure OpenAI calls will be made")
+        return FakeVideoAnalyzer()
+
+    from azure_ai_analyzer import AzureAIVideoAnalyzer
+    return AzureAIVideoAnalyzer()
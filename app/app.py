@@ -1,14 +1,29 @@
 import os
+import time
 import secrets
-from flask import Flask, request, render_template, jsonify, send_from_directory
+from flask import Flask, Response, request, render_template, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-import cv2
-import base64
-import tempfile
-import json
+import queue
 import logging
-from azure_ai_analyzer import AzureAIVideoAnalyzer
+import threading
+from analyzers import create_analyzer, get_analyzer_backend
+from result_cache import create_result_cache, build_cache_key, FileHashMemo
+from video_pipeline import (extract_frames_for_request, parse_options, parse_flag, build_sampling_settings,
+                            VIDEO_EXTENSIONS, is_video_file)
+from long_video import analyze_long_video, LONG_VIDEO_CONCURRENCY
+from upload_ingest import init_streaming_ingest, claim_upload
+from job_queue import create_job_manager, job_status_view, JobQueueFullError, FINISHED_STATUSES
+from batch import (run_batch, iter_ndjson, resolve_input_paths, collect_video_files, BATCH_MAX_FILES,
+                   BATCH_INPUT_DIR)
+from activity_filter import prefilter_stats
+from memory_budget import decode_budget
+from video_probe import check_video, preprobe_videos, probe_cache, VideoRejectedError
+from frame_store import create_frame_store, build_store_key, warm_frame_store
+from metrics import (timed, observe_stage, record_extraction, pop_analysis_timings, render_metrics,
+                     REQUESTS, FIRST_VERDICT_SECONDS, METRICS_CONTENT_TYPE)
+from stream_monitor import (create_stream_manager, validate_stream_source, parse_stream_settings, format_sse,
+                            StreamLimitError)
 
 # Load environment variables
 load_dotenv()
@@ -24,12 +39,20 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(16))
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))  # 50MB
 
+# Spool uploads straight into UPLOAD_FOLDER while hashing them
+init_streaming_ingest(app)
+
 # Allowed video extensions
-ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+ALLOWED_EXTENSIONS = VIDEO_EXTENSIONS
 
 # Validate Azure OpenAI configuration
 def validate_azure_config():
     """Validate Azure OpenAI configuration before initializing."""
+    if os.environ.get('AZURE_OPENAI_DEPLOYMENTS'):
+        # A deployment pool brings its own endpoints; it is validated when the analyzer loads it
+        logger.info("✅ Using the Azure OpenAI deployment pool from AZURE_OPENAI_DEPLOYMENTS")
+        return True
+    
     required_vars = {
         'AZURE_OPENAI_ENDPOINT': os.environ.get('AZURE_OPENAI_ENDPOINT'),
         'AZURE_OPENAI_DEPLOYMENT_NAME': os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-4-vision-preview')
@@ -54,72 +77,48 @@ def validate_azure_config():
     logger.info("✅ Azure OpenAI configuration validated")
     return True
 
-# Initialize Azure AI analyzer with validation
+# Initialize the analyzer backend (Azure OpenAI unless ANALYZER_BACKEND=fake)
 try:
-    if not validate_azure_config():
+    analyzer_backend = get_analyzer_backend()
+    if analyzer_backend == 'azure' and not validate_azure_config():
         logger.warning("⚠️ Running with incomplete Azure OpenAI configuration - some features may not work")
         ai_analyzer = None
     else:
-        ai_analyzer = AzureAIVideoAnalyzer()
-        logger.info("✅ Azure AI analyzer initialized successfully")
+        ai_analyzer = create_analyzer(analyzer_backend)
+        logger.info(f"✅ {analyzer_backend} analyzer initialized successfully")
 except Exception as e:
-    logger.error(f"❌ Failed to initialize Azure AI analyzer: {e}")
+    logger.error(f"❌ Failed to initialize AI analyzer: {e}")
+    analyzer_backend = os.environ.get('ANALYZER_BACKEND', 'azure')
     ai_analyzer = None
 
-def allowed_file(filename):
-    """Check if the file extension is allowed."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Analysis result cache keyed on video content, prompt and sampling settings
+result_cache = create_result_cache()
+file_hashes = FileHashMemo()
 
-def extract_frames_from_video(video_path, max_frames=10):
-    """Extract frames from video for analysis."""
-    frames = []
-    cap = cv2.VideoCapture(video_path)
-    
-    if not cap.isOpened():
-        raise ValueError("Cannot open video file")
-    
-    # Get video properties
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    duration = total_frames / fps if fps > 0 else 0
-    
-    # Calculate frame intervals for sampling
-    if total_frames <= max_frames:
-        frame_interval = 1
-    else:
-        frame_interval = total_frames // max_frames
-    
-    frame_count = 0
-    extracted_count = 0
-    
-    while cap.isOpened() and extracted_count < max_frames:
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        if frame_count % frame_interval == 0:
-            # Convert frame to base64
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_b64 = base64.b64encode(buffer).decode('utf-8')
-            frames.append({
-                'frame_number': frame_count,
-                'timestamp': frame_count / fps if fps > 0 else 0,
-                'image_data': frame_b64
-            })
-            extracted_count += 1
-            
-        frame_count += 1
-    
-    cap.release()
-    
-    return frames, {
-        'total_frames': total_frames,
-        'fps': fps,
-        'duration': duration,
-        'extracted_frames': len(frames)
-    }
+# Demo videos are probed once at startup, so demo requests are validated from the probe cache
+DEMO_VIDEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'videos')
+if os.environ.get('PREPROBE_DEMO_VIDEOS', 'true').lower() in ('1', 'true', 'yes'):
+    preprobe_videos(DEMO_VIDEO_DIR, file_hashes)
+
+# Sampled frames of known videos, so prompt-only variations skip decoding
+frame_store = create_frame_store()
+if frame_store is not None and os.environ.get('FRAME_STORE_WARM', 'true').lower() in ('1', 'true', 'yes'):
+    # Frames for the default request settings; other settings are stored on first use
+    warm_frame_store(frame_store, DEMO_VIDEO_DIR, file_hashes, build_sampling_settings(parse_options({})))
 
+# Background job manager for asynchronous analysis requests
+job_manager = create_job_manager()
 
+# Live stream monitors running in this process
+stream_monitors = create_stream_manager()
+
+def allowed_file(filename):
+    """Check if the file extension is allowed."""
+    return is_video_file(filename)
+
+def unique_upload_filename(filename):
+    """Prefix a (secured) filename so concurrent uploads of the same name do not collide."""
+    return f"{int(time.time())}_{secrets.token_hex(4)}_{filename}"
 
 @app.route('/')
 def index():
@@ -136,16 +135,150 @@ def config_status():
     """Configuration status page."""
     return render_template('config-status.html')
 
-def analyze_video_file(filepath, anomaly_prompt, is_demo=False):
-    """Common function to analyze video file."""
+def request_flag(name):
+    """Read a boolean flag from the request form or query string."""
+    return parse_flag(request.values, name)
+
+def wants_async():
+    """Check whether the client asked for asynchronous (job-based) processing."""
+    return request_flag('async')
+
+def wants_stream():
+    """Check whether the client asked for progress and partial results as server-sent events."""
+    return request_flag('stream')
+
+def parse_analysis_options():
+    """Collect per-request analysis options from the form or query string."""
+    return parse_options(request.values)
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def analysis_event_stream(func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` in a thread and yield its progress as server-sent events.
+    
+    Events are ``progress`` (stage and fraction), ``partial`` (result fields
+    as the model generates them) and finally ``result``, which carries the
+    same body as the JSON response plus its ``status_code``. The analysis
+    finishes (and is cached) even if the client disconnects.
+    """
+    events = queue.Queue()
+    
+    def run():
+        try:
+            result, status_code = func(*args, progress_callback=lambda stage, progress: events.put(
+                                           ('progress', {'stage': stage, 'progress': progress})),
+                                       partial_callback=lambda fields: events.put(('partial', fields)),
+                                       **kwargs)
+        except Exception as e:
+            result, status_code = {'error': f'Video processing failed: {str(e)}'}, 500
+        events.put(('result', dict(result, status_code=status_code)))
+    
+    threading.Thread(target=run, name='analysis-stream', daemon=True).start()
+    while True:
+        event, data = events.get()
+        yield format_sse(data, event=event)
+        if event == 'result':
+            return
+
+def stream_analysis_events(func, *args, **kwargs):
+    """Server-sent events response for ``analysis_event_stream``."""
+    return Response(analysis_event_stream(func, *args, **kwargs), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
+def submit_analysis_job(func, *args, kind, cleanup_path=None, **kwargs):
+    """Queue an analysis job and build the 202 response with polling URLs."""
+    try:
+        job_id = job_manager.submit(func, *args, kind=kind, cleanup_path=cleanup_path, **kwargs)
+    except JobQueueFullError as e:
+        if cleanup_path and os.path.exists(cleanup_path):
+            os.remove(cleanup_path)
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/jobs/{job_id}',
+        'result_url': f'/jobs/{job_id}/result'
+    }), 202
+
+def probe_request_video(filepath, endpoint, timings=None):
+    """
+    Validate a video from its headers before it is queued or decoded.
+
+    Raises:
+        VideoRejectedError: If the video is unreadable, unsupported or over the limits
+    """
+    try:
+        with timed('probe', timings):
+            return check_video(filepath, file_hashes.hash(filepath))
+    except VideoRejectedError as e:
+        logger.info(f"Rejected video {filepath}: {e}")
+        REQUESTS.labels(endpoint=endpoint, outcome='rejected').inc()
+        raise
+
+def extract_request_frames(filepath, sampling_settings, probe=None, is_demo=False, timings=None):
+    """
+    Extract frames for a request, reusing the frame store for known videos.
+
+    Returns:
+        Tuple of (window count, frames, video info, frame store status or None)
+    """
+    store_key = None
+    if frame_store is not None and frame_store.applies_to(is_demo):
+        with timed('frame_store', timings):
+            store_key = build_store_key(file_hashes.hash(filepath), sampling_settings)
+            stored = frame_store.get(store_key)
+        if stored is not None:
+            return stored + ('hit',)
+    
+    window_count, frames, video_info = extract_frames_for_request(filepath, sampling_settings, probe)
+    record_extraction(video_info, timings)
+    if store_key is None:
+        return window_count, frames, video_info, None
+    frame_store.put(store_key, window_count, frames, video_info)
+    return window_count, frames, video_info, 'miss'
+
+def analyze_video_file(filepath, anomaly_prompt, is_demo=False, options=None, progress_callback=None,
+                       timings=None, probe=None, partial_callback=None):
+    """
+    Common function to analyze video file.
+    
+    With a ``partial_callback`` the model response is streamed and the
+    callback receives result fields (``has_anomaly`` first) as they arrive.
+    """
+    def report(stage, progress):
+        if progress_callback is not None:
+            progress_callback(stage, progress)
+    
+    def verdict_known(mode):
+        if 'first_verdict' not in timings:
+            timings['first_verdict'] = round(time.perf_counter() - started, 4)
+            FIRST_VERDICT_SECONDS.labels(mode=mode).observe(timings['first_verdict'])
+    
+    def on_partial(fields):
+        if 'has_anomaly' in fields:
+            verdict_known('stream')
+        partial_callback(fields)
+    
+    def finish(result, status_code, outcome):
+        observe_stage('total', time.perf_counter() - started, timings)
+        REQUESTS.labels(endpoint='demo' if is_demo else 'upload', outcome=outcome).inc()
+        if options.get('timings'):
+            result['timings'] = timings
+        return result, status_code
+    
+    options = options or {}
+    sampling_settings = build_sampling_settings(options)
+    # Per-request stage timings, e.g. {'upload': 0.8, 'decode': 1.2, 'model_call': 4.1}
+    timings = dict(timings or {})
+    started = time.perf_counter()
+    
     try:
-        # Extract frames from video
-        logger.info(f"Processing video: {filepath}")
-        frames, video_info = extract_frames_from_video(filepath)
-        
         # Analyze with Azure AI
         if ai_analyzer is None:
-            return {
+            return finish({
                 'error': 'Azure AI analyzer not properly configured. Please check Azure OpenAI configuration.',
                 'config_help': {
                     'required_vars': [
@@ -155,34 +288,88 @@ def analyze_video_file(filepath, anomaly_prompt, is_demo=False):
                     ],
                     'example_endpoint': 'https://your-resource-name.openai.azure.com/'
                 }
-            }, 500
+            }, 500, 'error')
         
-        logger.info("Starting video analysis with Azure AI Foundry")
-        analysis_result = ai_analyzer.analyze_frames(frames, anomaly_prompt, video_info)
+        # Repeated videos with the same prompt and settings are served from the cache
+        cache_key = None
+        if result_cache is not None:
+            report('checking_cache', 0.05)
+            with timed('cache_lookup', timings):
+                cache_key = build_cache_key(file_hashes.hash(filepath), anomaly_prompt,
+                                            ai_analyzer.deployment_name, sampling_settings)
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Result cache hit for {filepath}")
+                cached['prompt_used'] = anomaly_prompt
+                cached['cache'] = {'status': 'hit'}
+                return finish(cached, 200, 'cache_hit')
         
-        # Clean up the uploaded file (but not demo files)
-        if not is_demo and os.path.exists(filepath):
-            os.remove(filepath)
+        # Extract frames from video
+        logger.info(f"Processing video: {filepath}")
+        report('extracting_frames', 0.1)
+        window_count, frames, video_info, store_status = extract_request_frames(filepath, sampling_settings, probe,
+                                                                                is_demo, timings)
         
-        logger.info("Video analysis completed successfully")
-        return {
+        logger.info("Starting video analysis with Azure AI Foundry")
+        report('analyzing', 0.4)
+        with timed('analysis', timings):
+            if window_count > 1:
+                analysis_result = analyze_long_video(ai_analyzer, frames, anomaly_prompt, video_info,
+                                                     window_count, max_concurrency=LONG_VIDEO_CONCURRENCY)
+            elif partial_callback is not None:
+                analysis_result = ai_analyzer.analyze_frames_streaming(frames, anomaly_prompt, video_info, on_partial)
+            else:
+                analysis_result = ai_analyzer.analyze_frames(frames, anomaly_prompt, video_info)
+        if 'error' not in analysis_result:
+            verdict_known('buffered')
+        # Model call stages are reported with the request timings rather than in the cached result
+        pop_analysis_timings(analysis_result, timings)
+        
+        result = {
             'success': True,
             'video_info': video_info,
             'analysis': analysis_result,
             'prompt_used': anomaly_prompt
-        }, 200
+        }
+        
+        # Only cache successful model responses
+        if cache_key is not None and 'error' not in analysis_result:
+            result_cache.set(cache_key, result)
+        result['cache'] = {'status': 'miss' if cache_key is not None else 'disabled'}
+        if store_status is not None:
+            result['frame_store'] = {'status': store_status}
+        
+        logger.info("Video analysis completed successfully")
+        return finish(result, 200, 'error' if 'error' in analysis_result else 'success')
         
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
-        # Clean up the uploaded file in case of error (but not demo files)
+        return finish({'error': f'Video processing failed: {str(e)}'}, 500, 'error')
+    
+    finally:
+        # Clean up the uploaded file (but not demo files)
         if not is_demo and os.path.exists(filepath):
             os.remove(filepath)
-        return {'error': f'Video processing failed: {str(e)}'}, 500
+
+def analyze_demo_file(demo_filepath, demo_video, anomaly_prompt, options=None, progress_callback=None,
+                      timings=None, probe=None, partial_callback=None):
+    """Analyze a demo video and tag the result with the demo used."""
+    result, status_code = analyze_video_file(demo_filepath, anomaly_prompt, is_demo=True, options=options,
+                                             progress_callback=progress_callback, timings=timings,
+                                             probe=probe, partial_callback=partial_callback)
+    
+    # Add demo video info to result
+    if 'success' in result and result['success']:
+        result['demo_video_used'] = demo_video
+    
+    return result, status_code
 
 @app.route('/upload', methods=['POST'])
 def upload_video():
     """Handle video upload and analysis."""
     try:
+        # Accessing request.files reads (and spools) the whole request body
+        upload_started = time.perf_counter()
         # Check if video file is present
         if 'video' not in request.files:
             return jsonify({'error': 'No video file selected'}), 400
@@ -196,18 +383,44 @@ def upload_video():
         if not anomaly_prompt:
             return jsonify({'error': 'Please enter the anomaly types to detect'}), 400
         
+        try:
+            options = parse_analysis_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         if file and allowed_file(file.filename):
             # Save the uploaded file
             filename = secure_filename(file.filename)
-            # Add timestamp to avoid filename conflicts
-            import time
-            timestamp = str(int(time.time()))
-            filename = f"{timestamp}_{filename}"
+            # Add timestamp and a random token to avoid filename conflicts
+            filename = unique_upload_filename(filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            # The body was already spooled and hashed while it was parsed;
+            # claiming it is a rename, not a copy
+            file_hash = claim_upload(file, filepath)
+            if file_hash is not None:
+                file_hashes.remember(filepath, file_hash)
+            timings = {}
+            observe_stage('upload', time.perf_counter() - upload_started, timings)
+            
+            # Reject unreadable, unsupported or oversized videos before any decoding
+            try:
+                probe = probe_request_video(filepath, 'upload', timings)
+            except VideoRejectedError as e:
+                os.remove(filepath)
+                return jsonify({'error': str(e)}), e.status_code
+            
+            if wants_stream():
+                return stream_analysis_events(analyze_video_file, filepath, anomaly_prompt, is_demo=False,
+                                              options=options, timings=timings, probe=probe)
+            
+            if wants_async():
+                return submit_analysis_job(analyze_video_file, filepath, anomaly_prompt,
+                                           kind='upload', cleanup_path=filepath, options=options,
+                                           timings=timings, probe=probe)
             
             # Analyze the video
-            result, status_code = analyze_video_file(filepath, anomaly_prompt, is_demo=False)
+            result, status_code = analyze_video_file(filepath, anomaly_prompt, is_demo=False, options=options,
+                                                     timings=timings, probe=probe)
             return jsonify(result), status_code
         
         else:
@@ -238,39 +451,247 @@ def analyze_demo_video():
         if not allowed_file(demo_video):
             return jsonify({'error': 'Invalid demo video format'}), 400
         
+        try:
+            options = parse_analysis_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         logger.info(f"Analyzing demo video: {demo_video}")
         
-        # Analyze the demo video
-        result, status_code = analyze_video_file(demo_filepath, anomaly_prompt, is_demo=True)
+        timings = {}
+        try:
+            probe = probe_request_video(demo_filepath, 'demo', timings)
+        except VideoRejectedError as e:
+            return jsonify({'error': str(e)}), e.status_code
         
-        # Add demo video info to result
-        if 'success' in result and result['success']:
-            result['demo_video_used'] = demo_video
+        if wants_stream():
+            return stream_analysis_events(analyze_demo_file, demo_filepath, demo_video, anomaly_prompt,
+                                          options=options, timings=timings, probe=probe)
         
+        if wants_async():
+            return submit_analysis_job(analyze_demo_file, demo_filepath, demo_video, anomaly_prompt,
+                                       kind='demo', options=options, timings=timings, probe=probe)
+        
+        # Analyze the demo video
+        result, status_code = analyze_demo_file(demo_filepath, demo_video, anomaly_prompt, options=options,
+                                                timings=timings, probe=probe)
         return jsonify(result), status_code
             
     except Exception as e:
         return jsonify({'error': f'Demo video analysis failed: {str(e)}'}), 500
 
+@app.route('/batch', methods=['POST'])
+def batch_analyze():
+    """Analyze many videos with one prompt, streaming one NDJSON line per video."""
+    anomaly_prompt = request.values.get('anomaly_prompt', '').strip()
+    uploads = [f for f in request.files.getlist('videos') if f and f.filename]
+    paths = [p.strip() for p in request.values.getlist('paths') if p.strip()]
+    
+    if not uploads and not paths:
+        return jsonify({'error': 'No videos selected. Upload files as "videos" or list server-side "paths"'}), 400
+    
+    if not anomaly_prompt:
+        return jsonify({'error': 'Please enter the anomaly types to detect'}), 400
+    
+    if ai_analyzer is None:
+        return jsonify({'error': 'Azure AI analyzer not properly configured. Please check Azure OpenAI configuration.'}), 500
+    
+    try:
+        options = parse_analysis_options()
+        files = collect_video_files(resolve_input_paths(paths)) if paths else []
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    unsupported = [f.filename for f in uploads if not allowed_file(f.filename)]
+    if unsupported:
+        return jsonify({'error': f"Unsupported file format: {', '.join(unsupported)}"}), 400
+    
+    if len(files) + len(uploads) > BATCH_MAX_FILES:
+        return jsonify({'error': f'A batch can contain at most {BATCH_MAX_FILES} videos'}), 400
+    
+    labels = [os.path.relpath(path, os.path.realpath(BATCH_INPUT_DIR)) for path in files]
+    owned = set()
+    for file in uploads:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_upload_filename(secure_filename(file.filename)))
+        file_hash = claim_upload(file, filepath)
+        if file_hash is not None:
+            file_hashes.remember(filepath, file_hash)
+        files.append(filepath)
+        labels.append(file.filename)
+        owned.add(filepath)
+    
+    logger.info(f"Starting batch of {len(files)} videos")
+    results = run_batch(files, anomaly_prompt, ai_analyzer, options, labels=labels, owned=owned,
+                        result_cache=result_cache, file_hashes=file_hashes)
+    return Response(iter_ndjson(results), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report status and progress of an analysis job."""
+    job = job_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found'}), 404
+    
+    status = job_status_view(job)
+    status['result_url'] = f'/jobs/{job_id}/result'
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Return the result of a finished analysis job."""
+    job = job_manager.get_job(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found'}), 404
+    
+    if job['status'] not in FINISHED_STATUSES:
+        # Not ready yet - tell the client to keep polling
+        return jsonify(job_status_view(job)), 202
+    
+    result = job.get('result') or {'error': job.get('error') or 'Job failed'}
+    return jsonify(result), job.get('status_code') or 500
+
+def stream_monitoring_disabled():
+    """Response for /streams requests when monitors cannot run in this process."""
+    return jsonify({
+        'error': 'Stream monitoring is disabled. Monitors live in the process that started them, '
+                 'so run a single worker (GUNICORN_WORKERS=1) with STREAM_MONITORING=true to use them.'
+    }), 503
+
+@app.route('/streams', methods=['POST'])
+def start_stream_monitor():
+    """Start continuous anomaly monitoring of a live stream."""
+    if not stream_monitors.enabled:
+        return stream_monitoring_disabled()
+    
+    anomaly_prompt = request.values.get('anomaly_prompt', '').strip()
+    demo_video = request.values.get('demo_video', '').strip()
+    
+    if not anomaly_prompt:
+        return jsonify({'error': 'Please enter the anomaly types to detect'}), 400
+    
+    if ai_analyzer is None:
+        return jsonify({'error': 'Azure AI analyzer not properly configured. Please check Azure OpenAI configuration.'}), 500
+    
+    try:
+        if demo_video:
+            # A demo video played in a loop stands in for a camera
+            source = os.path.join('app', 'static', 'videos', os.path.basename(demo_video))
+            if not allowed_file(demo_video) or not os.path.exists(source):
+                return jsonify({'error': f'Demo video {demo_video} not found'}), 404
+        else:
+            source = validate_stream_source(request.values.get('source', ''))
+        settings = parse_stream_settings(request.values)
+        options = parse_analysis_options()
+        settings['encoding'] = options['encoding']
+        settings['camera_profile'] = options['camera_profile']
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        monitor = stream_monitors.start(source, anomaly_prompt, ai_analyzer, **settings)
+    except StreamLimitError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify({
+        'success': True,
+        'monitor_id': monitor.monitor_id,
+        'status': monitor.state,
+        'status_url': f'/streams/{monitor.monitor_id}',
+        'events_url': f'/streams/{monitor.monitor_id}/events'
+    }), 201
+
+@app.route('/streams')
+def list_stream_monitors():
+    """List the stream monitors running in this process."""
+    if not stream_monitors.enabled:
+        return stream_monitoring_disabled()
+    return jsonify({'streams': [monitor.status() for monitor in stream_monitors.list()]})
+
+@app.route('/streams/<monitor_id>')
+def stream_monitor_status(monitor_id):
+    """Report state, buffer and backpressure counters of a stream monitor."""
+    if not stream_monitors.enabled:
+        return stream_monitoring_disabled()
+    monitor = stream_monitors.get(monitor_id)
+    if monitor is None:
+        return jsonify({'error': f'Stream {monitor_id} not found'}), 404
+    return jsonify(monitor.status())
+
+@app.route('/streams/<monitor_id>', methods=['DELETE'])
+def stop_stream_monitor(monitor_id):
+    """Stop a stream monitor."""
+    if not stream_monitors.enabled:
+        return stream_monitoring_disabled()
+    monitor = stream_monitors.remove(monitor_id)
+    if monitor is None:
+        return jsonify({'error': f'Stream {monitor_id} not found'}), 404
+    return jsonify({'success': True, 'stream': monitor.status()})
+
+@app.route('/streams/<monitor_id>/events')
+def stream_monitor_events(monitor_id):
+    """Server-sent events with one analysis result per window."""
+    if not stream_monitors.enabled:
+        return stream_monitoring_disabled()
+    monitor = stream_monitors.get(monitor_id)
+    if monitor is None:
+        return jsonify({'error': f'Stream {monitor_id} not found'}), 404
+    
+    # Reconnecting EventSource clients resume after the last event they saw
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+    
+    return Response(monitor.event_stream(last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for container deployment."""
+    # A deployment pool configures endpoints, keys and deployments per entry
+    pool_configured = bool(os.environ.get('AZURE_OPENAI_DEPLOYMENTS'))
     config_status = {
-        'azure_openai_endpoint': bool(os.environ.get('AZURE_OPENAI_ENDPOINT')),
-        'azure_openai_api_key': bool(os.environ.get('AZURE_OPENAI_API_KEY')),
-        'azure_openai_deployment': bool(os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME')),
+        'azure_openai_endpoint': pool_configured or bool(os.environ.get('AZURE_OPENAI_ENDPOINT')),
+        'azure_openai_api_key': pool_configured or bool(os.environ.get('AZURE_OPENAI_API_KEY')),
+        'azure_openai_deployment': pool_configured or bool(os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME')),
         'ai_analyzer_initialized': ai_analyzer is not None
     }
+    deployments = ai_analyzer.deployment_stats() if ai_analyzer is not None else None
     
-    overall_status = 'healthy' if all(config_status.values()) else 'degraded'
+    if analyzer_backend == 'azure':
+        overall_status = 'healthy' if all(config_status.values()) else 'degraded'
+    else:
+        # Non-Azure backends (e.g. the load-testing fake) need no Azure configuration
+        overall_status = 'healthy' if ai_analyzer is not None else 'degraded'
+    message = 'All systems operational' if overall_status == 'healthy' else 'Some configuration missing'
+    if deployments is not None and deployments['healthy'] == 0:
+        # Every deployment of the pool is cooling down after 429s or errors
+        overall_status = 'degraded'
+        message = 'All model deployments are cooling down'
     
     return jsonify({
         'status': overall_status,
         'service': 'video-anomaly-detector',
+        'analyzer_backend': analyzer_backend,
         'configuration': config_status,
-        'message': 'All systems operational' if overall_status == 'healthy' else 'Some configuration missing'
+        'result_cache': result_cache.stats() if result_cache is not None else None,
+        'model_client': ai_analyzer.client_stats() if ai_analyzer is not None else None,
+        'deployments': deployments,
+        'stream_monitors': (sum(1 for monitor in stream_monitors.list() if not monitor.stopped)
+                            if stream_monitors.enabled else None),
+        'prefilter': prefilter_stats.to_dict(),
+        'decode_memory': decode_budget.stats(),
+        'video_probe': probe_cache.stats(),
+        'frame_store': frame_store.stats() if frame_store is not None else None,
+        'message': message
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: per-stage latency, frame counts, payload sizes, token usage and model call outcomes."""
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
+
 @app.route('/test-connection')
 def test_azure_connection():
     """Test Azure AI connection."""
@@ -0,0 +1,411 @@
+"""
+ASGI entry point for video anomaly detection.
+
+Serves ``/upload``, ``/analyze-demo`` and ``/test-connection`` natively on
+asyncio: model calls go through ``AsyncAzureAIVideoAnalyzer`` on a shared
+connection pool, and CPU-bound OpenCV decoding runs in a process pool, so
+one container can keep hundreds of analyses in flight. All other routes
+(pages, jobs, health) are served by the Flask app through a WSGI adapter.
+
+Run with:
+    uvicorn asgi:app --app-dir app --host 0.0.0.0 --port 8080
+"""
+import os
+import time
+import asyncio
+import logging
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartParser, MultiPartException
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, Mount
+from werkzeug.utils import secure_filename
+
+import app as flask_module
+from async_analyzer import create_async_analyzer
+from long_video import analyze_long_video_async, LONG_VIDEO_CONCURRENCY
+from result_cache import build_cache_key
+from frame_store import build_store_key
+from video_pipeline import parse_options, parse_flag, build_sampling_settings, extract_frames_for_request
+from metrics import (timed, observe_stage, record_extraction, pop_analysis_timings, REQUESTS,
+                     FIRST_VERDICT_SECONDS)
+from video_probe import VideoRejectedError
+from upload_ingest import HashingSpoolFile
+from decoders import register_decode_processes
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for OpenCV decoding (default: one per CPU)
+DECODE_PROCESSES = int(os.environ.get('DECODE_PROCESSES', 0)) or os.cpu_count() or 1
+
+# Created in the lifespan handler so they belong to the serving process and loop
+state = {'analyzer': None, 'decode_pool': None}
+
+
+class UploadTooLargeError(MultiPartException):
+    """Raised while parsing when a multipart body grows past its size limit."""
+
+
+class SpoolingMultiPartParser(MultiPartParser):
+    """
+    Multipart parser that writes file parts straight into ``HashingSpoolFile``
+    spools in the upload folder, so handlers claim them by rename instead of
+    copying the body a second time.
+
+    Part data is counted as it arrives and parsing stops with
+    ``UploadTooLargeError`` past ``max_bytes``, which also covers chunked
+    bodies that carry no Content-Length.
+
+    Relies on ``MultiPartParser`` internals (``_current_part`` and
+    ``_files_to_close_on_error``) as of the pinned starlette==0.36.3;
+    re-check this class when upgrading Starlette.
+    """
+
+    def __init__(self, headers, stream, directory: str, max_bytes: Optional[int] = None, **kwargs):
+        super().__init__(headers, stream, **kwargs)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.spools = []
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self.received += end - start
+        if self.max_bytes and self.received > self.max_bytes:
+            raise UploadTooLargeError('Uploaded file is too large')
+        super().on_part_data(data, start, end)
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        upload = self._current_part.file
+        if upload is not None:
+            # Swap out the (still empty) SpooledTemporaryFile Starlette just created
+            self._files_to_close_on_error.pop().close()
+            spool = HashingSpoolFile(self.directory)
+            self.spools.append(spool)
+            self._files_to_close_on_error.append(spool)
+            upload.file = spool
+
+    def discard_unclaimed(self):
+        """Remove spooled files that no handler claimed."""
+        for spool in self.spools:
+            spool.discard()
+
+
+def _remove(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+async def analyze_video_file_async(filepath, anomaly_prompt, is_demo=False, options=None, file_hash=None,
+                                   probe=None, timings=None):
+    """
+    Asyncio counterpart of ``app.analyze_video_file``; returns (result, status_code).
+
+    Records the same request counters and stage timings, and returns the
+    timings when the request asked for them.
+    """
+    def finish(result, status_code, outcome):
+        observe_stage('total', time.perf_counter() - started, timings)
+        REQUESTS.labels(endpoint='demo' if is_demo else 'upload', outcome=outcome).inc()
+        if options.get('timings'):
+            result['timings'] = timings
+        return result, status_code
+
+    analyzer = state['analyzer']
+    options = options or {}
+    sampling_settings = build_sampling_settings(options)
+    result_cache = flask_module.result_cache
+    frame_store = flask_module.frame_store
+    use_store = frame_store is not None and frame_store.applies_to(is_demo)
+    timings = dict(timings or {})
+    started = time.perf_counter()
+
+    try:
+        if analyzer is None:
+            return finish({
+                'error': 'Azure AI analyzer not properly configured. Please check Azure OpenAI configuration.'
+            }, 500, 'error')
+
+        # Repeated videos with the same prompt and settings are served from the cache
+        cache_key = None
+        if result_cache is not None or use_store:
+            if file_hash is None:
+                file_hash = await run_in_threadpool(flask_module.file_hashes.hash, filepath)
+            else:
+                flask_module.file_hashes.remember(filepath, file_hash)
+        if result_cache is not None:
+            with timed('cache_lookup', timings):
+                cache_key = build_cache_key(file_hash, anomaly_prompt, analyzer.deployment_name, sampling_settings)
+                cached = await run_in_threadpool(result_cache.get, cache_key)
+            if cached is not None:
+                cached['prompt_used'] = anomaly_prompt
+                cached['cache'] = {'status': 'hit'}
+                return finish(cached, 200, 'cache_hit')
+
+        # Known videos (by default the demos) reuse their stored frames
+        store_key = build_store_key(file_hash, sampling_settings) if use_store else None
+        stored = None
+        if store_key:
+            with timed('frame_store', timings):
+                stored = await run_in_threadpool(frame_store.get, store_key)
+        if stored is not None:
+            window_count, frames, video_info = stored
+        else:
+            # Decode in a worker process so the event loop stays free for model I/O
+            loop = asyncio.get_running_loop()
+            window_count, frames, video_info = await loop.run_in_executor(
+                state['decode_pool'], extract_frames_for_request, filepath, sampling_settings, probe)
+            record_extraction(video_info, timings)
+            if store_key:
+                await run_in_threadpool(frame_store.put, store_key, window_count, frames, video_info)
+
+        with timed('analysis', timings):
+            if window_count > 1:
+                analysis_result = await analyze_long_video_async(analyzer, frames, anomaly_prompt, video_info,
+                                                                 window_count, max_concurrency=LONG_VIDEO_CONCURRENCY)
+            else:
+                analysis_result = await analyzer.analyze_frames_async(frames, anomaly_prompt, video_info)
+        if 'error' not in analysis_result:
+            timings['first_verdict'] = round(time.perf_counter() - started, 4)
+            FIRST_VERDICT_SECONDS.labels(mode='buffered').observe(timings['first_verdict'])
+        # Model call stages are reported with the request timings rather than in the cached result
+        pop_analysis_timings(analysis_result, timings)
+
+        result = {
+            'success': True,
+            'video_info': video_info,
+            'analysis': analysis_result,
+            'prompt_used': anomaly_prompt
+        }
+
+        # Only cache successful model responses
+        if cache_key is not None and 'error' not in analysis_result:
+            await run_in_threadpool(result_cache.set, cache_key, result)
+        result['cache'] = {'status': 'miss' if cache_key is not None else 'disabled'}
+        if store_key:
+            result['frame_store'] = {'status': 'hit' if stored is not None else 'miss'}
+        return finish(result, 200, 'error' if 'error' in analysis_result else 'success')
+
+    except Exception as e:
+        logger.error(f"Error processing video: {str(e)}")
+        return finish({'error': f'Video processing failed: {str(e)}'}, 500, 'error')
+
+    finally:
+        # Clean up the uploaded file (but not demo files)
+        if not is_demo:
+            await run_in_threadpool(_remove, filepath)
+
+
+def _queue_job(func, *args, kind, cleanup_path=None, **kwargs):
+    """Queue a background job on the Flask app's job manager (async=true requests)."""
+    try:
+        job_id = flask_module.job_manager.submit(func, *args, kind=kind, cleanup_path=cleanup_path, **kwargs)
+    except flask_module.JobQueueFullError as e:
+        _remove(cleanup_path)
+        return JSONResponse({'error': str(e)}, status_code=503)
+    return JSONResponse({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/jobs/{job_id}',
+        'result_url': f'/jobs/{job_id}/result'
+    }, status_code=202)
+
+
+def _stream_events(func, *args, **kwargs) -> StreamingResponse:
+    """
+    Stream progress and partial results as server-sent events (stream=true requests).
+
+    Streaming uses the Flask app's analyzer and runs in a thread; the
+    generator is iterated in Starlette's thread pool.
+    """
+    return StreamingResponse(flask_module.analysis_event_stream(func, *args, **kwargs),
+                             media_type='text/event-stream', headers=flask_module.SSE_HEADERS)
+
+
+async def upload_video(request):
+    """Handle video upload and analysis."""
+    filepath = None
+    parser = None
+    upload_started = time.perf_counter()
+    try:
+        max_length = flask_module.app.config['MAX_CONTENT_LENGTH']
+        if int(request.headers.get('content-length', 0)) > max_length:
+            return JSONResponse({'error': 'Uploaded file is too large'}, status_code=413)
+
+        if request.headers.get('content-type', '').startswith('multipart/form-data'):
+            parser = SpoolingMultiPartParser(request.headers, request.stream(),
+                                             flask_module.app.config['UPLOAD_FOLDER'], max_bytes=max_length)
+            try:
+                form = await parser.parse()
+            except UploadTooLargeError as e:
+                return JSONResponse({'error': e.message}, status_code=413)
+            except MultiPartException as e:
+                return JSONResponse({'error': e.message}, status_code=400)
+        else:
+            form = await request.form()
+        values = {**request.query_params, **{k: v for k, v in form.items() if isinstance(v, str)}}
+        file = form.get('video')
+        anomaly_prompt = (values.get('anomaly_prompt') or '').strip()
+
+        if file is None or isinstance(file, str) or not file.filename:
+            return JSONResponse({'error': 'No video file selected'}, status_code=400)
+
+        if not anomaly_prompt:
+            return JSONResponse({'error': 'Please enter the anomaly types to detect'}, status_code=400)
+
+        try:
+            options = parse_options(values)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        if not flask_module.allowed_file(file.filename):
+            return JSONResponse({'error': 'Unsupported file format. Please upload MP4, AVI, MOV, MKV or WEBM video files'},
+                                status_code=400)
+
+        filename = flask_module.unique_upload_filename(secure_filename(file.filename))
+        filepath = os.path.join(flask_module.app.config['UPLOAD_FOLDER'], filename)
+        await run_in_threadpool(file.file.claim, filepath)
+        file_hash = file.file.sha256
+        flask_module.file_hashes.remember(filepath, file_hash)
+        timings = {}
+        observe_stage('upload', time.perf_counter() - upload_started, timings)
+
+        # Reject unreadable, unsupported or oversized videos before any decoding
+        try:
+            probe = await run_in_threadpool(flask_module.probe_request_video, filepath, 'upload', timings)
+        except VideoRejectedError as e:
+            return JSONResponse({'error': str(e)}, status_code=e.status_code)
+
+        if parse_flag(values, 'stream'):
+            # analyze_video_file owns the file from here and removes it
+            path, filepath = filepath, None
+            return _stream_events(flask_module.analyze_video_file, path, anomaly_prompt, is_demo=False,
+                                  options=options, timings=timings, probe=probe)
+
+        if parse_flag(values, 'async'):
+            path, filepath = filepath, None
+            return _queue_job(flask_module.analyze_video_file, path, anomaly_prompt,
+                              kind='upload', cleanup_path=path, options=options, timings=timings, probe=probe)
+
+        # analyze_video_file_async owns the file from here and removes it
+        path, filepath = filepath, None
+        result, status_code = await analyze_video_file_async(path, anomaly_prompt, is_demo=False,
+                                                             options=options, file_hash=file_hash, probe=probe,
+                                                             timings=timings)
+        return JSONResponse(result, status_code=status_code)
+
+    except Exception as e:
+        return JSONResponse({'error': f'Upload failed: {str(e)}'}, status_code=500)
+
+    finally:
+        _remove(filepath)
+        if parser is not None:
+            await run_in_threadpool(parser.discard_unclaimed)
+
+
+async def analyze_demo_video(request):
+    """Handle demo video analysis."""
+    try:
+        form = await request.form()
+        values = {**request.query_params, **{k: v for k, v in form.items() if isinstance(v, str)}}
+        demo_video = (values.get('demo_video') or '').strip()
+        anomaly_prompt = (values.get('anomaly_prompt') or '').strip()
+
+        if not demo_video:
+            return JSONResponse({'error': 'No demo video selected'}, status_code=400)
+
+        if not anomaly_prompt:
+            return JSONResponse({'error': 'Please enter the anomaly types to detect'}, status_code=400)
+
+        # Validate demo video file exists
+        demo_filepath = os.path.join('app', 'static', 'videos', demo_video)
+        if not os.path.exists(demo_filepath):
+            return JSONResponse({'error': f'Demo video {demo_video} not found'}, status_code=404)
+
+        # Validate file extension
+        if not flask_module.allowed_file(demo_video):
+            return JSONResponse({'error': 'Invalid demo video format'}, status_code=400)
+
+        try:
+            options = parse_options(values)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        timings = {}
+        try:
+            probe = await run_in_threadpool(flask_module.probe_request_video, demo_filepath, 'demo', timings)
+        except VideoRejectedError as e:
+            return JSONResponse({'error': str(e)}, status_code=e.status_code)
+
+        if parse_flag(values, 'stream'):
+            return _stream_events(flask_module.analyze_demo_file, demo_filepath, demo_video, anomaly_prompt,
+                                  options=options, timings=timings, probe=probe)
+
+        if parse_flag(values, 'async'):
+            return _queue_job(flask_module.analyze_demo_file, demo_filepath, demo_video, anomaly_prompt,
+                              kind='demo', options=options, timings=timings, probe=probe)
+
+        result, status_code = await analyze_video_file_async(demo_filepath, anomaly_prompt, is_demo=True,
+                                                             options=options, probe=probe, timings=timings)
+        if result.get('success'):
+            result['demo_video_used'] = demo_video
+        return JSONResponse(result, status_code=status_code)
+
+    except Exception as e:
+        return JSONResponse({'error': f'Demo video analysis failed: {str(e)}'}, status_code=500)
+
+
+async def test_azure_connection(request):
+    """Test Azure AI connection."""
+    analyzer = state['analyzer']
+    if analyzer is None:
+        return JSONResponse({
+            'success': False,
+            'error': 'Azure AI analyzer not initialized',
+            'help': 'Please check Azure OpenAI configuration in .env file'
+        }, status_code=500)
+    return JSONResponse(await analyzer.test_connection_async())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    os.makedirs(flask_module.app.config['UPLOAD_FOLDER'], exist_ok=True)
+    try:
+        state['analyzer'] = create_async_analyzer(flask_module.analyzer_backend)
+        logger.info("✅ Async analyzer initialized successfully")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize async analyzer: {e}")
+        state['analyzer'] = None
+
+    # Spawned (not forked) workers avoid inheriting the event loop and client threads
+    register_decode_processes(DECODE_PROCESSES)
+    state['decode_pool'] = ProcessPoolExecutor(max_workers=DECODE_PROCESSES,
+                                               mp_context=multiprocessing.get_context('spawn'))
+    logger.info(f"Started {DECODE_PROCESSES} decode worker processes")
+    try:
+        yield
+    finally:
+        if state['analyzer'] is not None:
+            await state['analyzer'].aclose()
+        state['decode_pool'].shutdown(wait=True)
+        flask_module.stream_monitors.shutdown()
+        flask_module.job_manager.shutdown(wait=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/upload', upload_video, methods=['POST']),
+        Route('/analyze-demo', analyze_demo_video, methods=['POST']),
+        Route('/test-connection', test_azure_connection, methods=['GET']),
+        # Everything else is served by the Flask app
+        Mount('/', app=WSGIMiddleware(flask_module.app)),
+    ],
+    lifespan=lifespan
+)
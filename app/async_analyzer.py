@@ -0,0 +1,155 @@
+"""
+Asyncio variant of the Azure AI video analyzer.
+
+Built on ``AsyncAzureOpenAI`` with one shared HTTP connection pool, so a
+single process can keep many model calls in flight without a thread per
+call. Prompt construction and result parsing are shared with
+``AzureAIVideoAnalyzer``. A deployment pool (AZURE_OPENAI_DEPLOYMENTS) gets
+one connection pool per deployment.
+"""
+import os
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional
+
+import httpx
+from openai import AsyncAzureOpenAI
+
+from azure_ai_analyzer import AzureAIVideoAnalyzer
+from deployment_pool import AsyncDeploymentPool, Deployment
+from frame_encoding import EncodedFrame
+from metrics import timed, MODEL_CALLS
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent model calls per process, and connection pool size
+ASYNC_MAX_CONCURRENT_CALLS = int(os.environ.get('ASYNC_MAX_CONCURRENT_CALLS', 200))
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 100))
+
+
+class AsyncAzureAIVideoAnalyzer(AzureAIVideoAnalyzer):
+    """Azure AI Foundry video analyzer using the asyncio OpenAI client."""
+
+    def __init__(self, max_concurrent_calls: int = ASYNC_MAX_CONCURRENT_CALLS):
+        self.max_concurrent_calls = max_concurrent_calls
+        self._semaphore = None
+        super().__init__()
+
+    @staticmethod
+    def _create_http_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=ASYNC_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(120.0, connect=10.0)
+        )
+
+    def _create_client(self):
+        """Create an ``AsyncAzureOpenAI`` client on a shared, bounded connection pool."""
+        max_retries = int(os.environ.get('AZURE_OPENAI_MAX_RETRIES', 5))
+        if self.deployments:
+            # The pool fails over and retries itself, so each deployment's client makes one attempt
+            self.deployment_pool = AsyncDeploymentPool([
+                Deployment(config['name'], config['endpoint'], config['deployment'],
+                           AsyncAzureOpenAI(api_key=config['api_key'], api_version=self.api_version,
+                                            azure_endpoint=config['endpoint'],
+                                            http_client=self._create_http_client(), max_retries=0),
+                           weight=config['weight'])
+                for config in self.deployments
+            ], max_retries=max_retries)
+            return self.deployment_pool
+        # The SDK's built-in retries honor Retry-After on 429/5xx
+        return AsyncAzureOpenAI(
+            api_key=self.api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint,
+            http_client=self._create_http_client(),
+            max_retries=max_retries
+        )
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created on first use so it belongs to the serving event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_calls)
+        return self._semaphore
+
+    async def analyze_frames_async(self, frames: List[EncodedFrame], anomaly_prompt: str,
+                                   video_info: Dict) -> Dict[str, Any]:
+        """
+        Analyze video frames for anomalies without blocking the event loop.
+
+        Args:
+            frames: Encoded frames (JPEG bytes with frame number, timestamp and detail level)
+            anomaly_prompt: User-specified anomaly types to detect
+            video_info: Video metadata information
+
+        Returns:
+            Dictionary containing analysis results
+        """
+        if not self.client:
+            raise RuntimeError("Azure OpenAI client is not initialized")
+
+        skipped = self.prefilter_result(frames, video_info)
+        if skipped is not None:
+            return skipped
+
+        timings = {}
+        try:
+            with timed('build_request', timings):
+                request_kwargs, max_frames_for_analysis = self._build_analysis_request(frames, anomaly_prompt,
+                                                                                       video_info)
+            async with self.semaphore:
+                with timed('model_call', timings):
+                    response = await self.client.chat.completions.create(**request_kwargs)
+            with timed('parse', timings):
+                result = self._parse_analysis_response(response, anomaly_prompt, max_frames_for_analysis, len(frames))
+            MODEL_CALLS.labels(outcome='success').inc()
+            result['analysis_metadata']['timings'] = timings
+            return result
+        except Exception as e:
+            logger.error(f"Error during video analysis: {e}")
+            MODEL_CALLS.labels(outcome='error').inc()
+            return self._create_error_result(str(e))
+
+    async def test_connection_async(self) -> Dict[str, Any]:
+        """Test the connection to Azure OpenAI service."""
+        try:
+            if not self.client:
+                return {'success': False, 'error': 'Client not initialized'}
+
+            response = await self.client.chat.completions.create(
+                model=self.deployment_name,
+                messages=[{
+                    "role": "user",
+                    "content": "你好，请回复'连接测试成功'"
+                }],
+                max_tokens=50,
+                temperature=0.1
+            )
+            return {
+                'success': True,
+                'response': response.choices[0].message.content,
+                'model': self.deployment_name,
+                'endpoint': self.endpoint
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'endpoint': self.endpoint
+            }
+
+    async def aclose(self):
+        """Close the shared connection pool."""
+        if self.client is not None:
+            await self.client.close()
+
+
+def create_async_analyzer(backend: Optional[str] = None) -> AsyncAzureAIVideoAnalyzer:
+    """Create the asyncio analyzer for ``backend`` (default: ANALYZER_BACKEND)."""
+    from analyzers import get_analyzer_backend
+    backend = backend or get_analyzer_backend()
+    if backend == 'fake':
+        from fake_analyzer import AsyncFakeVideoAnalyzer
+        return AsyncFakeVideoAnalyzer()
+    return AsyncAzureAIVideoAnalyzer()
@@ -1,19 +1,66 @@
 """
 Azure AI Foundry integration module for video anomaly detection.
+
+Results are requested as JSON. Where the API version supports structured
+outputs the request carries the result's JSON schema, so the model cannot
+return free text; older API versions fall back to best-effort parsing.
+``analyze_frames_streaming`` streams the completion and reports each
+top-level result field as soon as it has been generated. With
+AZURE_OPENAI_DEPLOYMENTS set, calls are spread over a pool of deployments
+(see ``deployment_pool``).
 """
 import os
 import json
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from openai import AzureOpenAI
 from azure.identity import DefaultAzureCredential, ClientSecretCredential
-import base64
+from analyzers import VideoAnalyzer
+from frame_encoding import EncodedFrame
+from resilient_client import ResilientChatClient
+from deployment_pool import DeploymentPool, Deployment, load_deployment_configs
+from partial_json import IncrementalObjectParser
+from metrics import timed, record_usage, usage_dict, MODEL_CALLS, PAYLOAD_BYTES
 
 logger = logging.getLogger(__name__)
 
-class AzureAIVideoAnalyzer:
+RESPONSE_FORMATS = ('auto', 'json_schema', 'json_object', 'text')
+
+# Result format requested from the model; auto uses json_schema where the API version supports it
+RESPONSE_FORMAT = os.environ.get('AZURE_OPENAI_RESPONSE_FORMAT', 'auto').lower()
+if RESPONSE_FORMAT not in RESPONSE_FORMATS:
+    logger.warning(f"Unknown AZURE_OPENAI_RESPONSE_FORMAT '{RESPONSE_FORMAT}', using auto")
+    RESPONSE_FORMAT = 'auto'
+
+# First Azure OpenAI API versions with structured outputs and with usage in streamed responses
+STRUCTURED_OUTPUTS_API_VERSION = '2024-08-01-preview'
+STREAM_USAGE_API_VERSION = '2024-09-01-preview'
+
+# Schema of an analysis result; fields are generated in this order, verdict first
+ANALYSIS_RESULT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'has_anomaly': {'type': 'boolean'},
+        'confidence_score': {'type': 'number'},
+        'anomaly_type': {'type': 'string'},
+        'severity': {'type': 'string', 'enum': ['low', 'medium', 'high']},
+        'detected_frames': {'type': 'array', 'items': {'type': 'integer'}},
+        'timestamps': {'type': 'array', 'items': {'type': 'number'}},
+        'description': {'type': 'string'},
+        'evidence': {'type': 'string'},
+        'recommendations': {'type': 'string'},
+        'false_positive_risk': {'type': 'number'}
+    },
+    'required': ['has_anomaly', 'confidence_score', 'anomaly_type', 'severity', 'detected_frames', 'timestamps',
+                 'description', 'evidence', 'recommendations', 'false_positive_risk'],
+    'additionalProperties': False
+}
+
+class AzureAIVideoAnalyzer(VideoAnalyzer):
     """Azure AI Foundry video analyzer using GPT-4V."""
     
+    backend = 'azure'
+    
     def __init__(self):
         """Initialize the Azure AI client."""
         self.api_key = os.environ.get('AZURE_OPENAI_API_KEY')
@@ -26,9 +73,29 @@ class AzureAIVideoAnalyzer:
         self.client_id = os.environ.get('AZURE_CLIENT_ID')
         self.client_secret = os.environ.get('AZURE_CLIENT_SECRET')
         
+        # Optional pool of deployments taking the place of the single endpoint
+        self.deployments = load_deployment_configs()
+        if self.deployments:
+            self.endpoint = ', '.join(dict.fromkeys(config['endpoint'] for config in self.deployments))
+            # Names the pool in cache keys and results; each request goes to one deployment
+            self.deployment_name = (os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME')
+                                    or self.deployments[0]['deployment'])
+        
         self.client = None
+        self.deployment_pool = None
         self._initialize_client()
     
+    def _api_version_at_least(self, version: str) -> bool:
+        """Whether the configured API version is ``version`` or newer (versions are dated)."""
+        return self.api_version[:10] >= version[:10]
+    
+    @property
+    def response_format(self) -> str:
+        """Result format requested from the model: json_schema, json_object or text."""
+        if RESPONSE_FORMAT != 'auto':
+            return RESPONSE_FORMAT
+        return 'json_schema' if self._api_version_at_least(STRUCTURED_OUTPUTS_API_VERSION) else 'text'
+    
     def _initialize_client(self):
         """Initialize the Azure OpenAI client with appropriate authentication."""
         try:
@@ -43,7 +110,7 @@ class AzureAIVideoAnalyzer:
                     "Azure OpenAI deployment name is required. Please set AZURE_OPENAI_DEPLOYMENT_NAME environment variable."
                 )
             
-            if not self.api_key:
+            if not self.api_key and not self.deployments:
                 raise ValueError(
                     "Azure OpenAI API key is required. Please set AZURE_OPENAI_API_KEY environment variable."
                 )
@@ -51,12 +118,7 @@ class AzureAIVideoAnalyzer:
             logger.info(f"Initializing Azure OpenAI client with endpoint: {self.endpoint}")
             logger.info(f"Using deployment: {self.deployment_name}")
             
-            # Use API key authentication only for now
-            self.client = AzureOpenAI(
-                api_key=self.api_key,
-                api_version=self.api_version,
-                azure_endpoint=self.endpoint
-            )
+            self.client = self._create_client()
             logger.info("Initialized Azure OpenAI client with API key authentication")
         except Exception as e:
             logger.error(f"Failed to initialize Azure OpenAI client: {e}")
@@ -66,12 +128,34 @@ class AzureAIVideoAnalyzer:
             logger.error("- AZURE_OPENAI_DEPLOYMENT_NAME should be set to your model deployment name")
             raise
     
-    def analyze_frames(self, frames: List[Dict], anomaly_prompt: str, video_info: Dict) -> Dict[str, Any]:
+    def _create_client(self):
+        """Create the chat completions client for the validated configuration."""
+        # Use API key authentication only for now. Retries are handled by
+        # ResilientChatClient (rate limiting, Retry-After, coalescing).
+        if self.deployments:
+            self.deployment_pool = DeploymentPool([
+                Deployment(config['name'], config['endpoint'], config['deployment'],
+                           AzureOpenAI(api_key=config['api_key'], api_version=self.api_version,
+                                       azure_endpoint=config['endpoint'], max_retries=0),
+                           weight=config['weight'])
+                for config in self.deployments
+            ])
+            logger.info(f"Routing over {len(self.deployments)} deployments "
+                        f"({self.deployment_pool.routing}): {', '.join(config['name'] for config in self.deployments)}")
+            return ResilientChatClient.from_env(self.deployment_pool)
+        return ResilientChatClient.from_env(AzureOpenAI(
+            api_key=self.api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.endpoint,
+            max_retries=0
+        ))
+    
+    def analyze_frames(self, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict) -> Dict[str, Any]:
         """
         Analyze video frames for anomalies using Azure OpenAI GPT-4V.
         
         Args:
-            frames: List of frame data with base64 encoded images
+            frames: Encoded frames (JPEG bytes with frame number, timestamp and detail level)
             anomaly_prompt: User-specified anomaly types to detect
             video_info: Video metadata information
             
@@ -81,69 +165,169 @@ class AzureAIVideoAnalyzer:
         if not self.client:
             raise RuntimeError("Azure OpenAI client is not initialized")
         
+        # Quiet footage gets a local "no activity" result instead of a model call
+        skipped = self.prefilter_result(frames, video_info)
+        if skipped is not None:
+            return skipped
+        
+        timings = {}
         try:
-            # Construct the analysis prompt
-            system_prompt = self._create_analysis_prompt(anomaly_prompt, video_info)
-            
-            # Prepare message content with frames
-            content = [{"type": "text", "text": system_prompt}]
-            
-            # Add frames (limit to avoid token limits)
-            max_frames_for_analysis = min(len(frames), 10)
-            for i, frame in enumerate(frames[:max_frames_for_analysis]):
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{frame['image_data']}",
-                        "detail": "high"  # Use high detail for better analysis
-                    }
-                })
-                
-                # Add frame context
-                content.append({
-                    "type": "text",
-                    "text": f"Frame {i+1}/{max_frames_for_analysis} - Timestamp: {frame['timestamp']:.2f}s"
-                })
+            with timed('build_request', timings):
+                request_kwargs, max_frames_for_analysis = self._build_analysis_request(frames, anomaly_prompt, video_info)
             
             # Make the API call
-            response = self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[{
-                    "role": "user",
-                    "content": content
-                }],
-                max_tokens=2000,
-                temperature=0.1,  # Low temperature for consistent analysis
-                top_p=0.9
-            )
+            with timed('model_call', timings):
+                response = self.client.chat.completions.create(**request_kwargs)
             
-            # Parse the response
-            result_text = response.choices[0].message.content
-            logger.info(f"Received analysis result: {result_text[:200]}...")
+            with timed('parse', timings):
+                result = self._parse_analysis_response(response, anomaly_prompt, max_frames_for_analysis, len(frames))
+            MODEL_CALLS.labels(outcome='success').inc()
+            result['analysis_metadata']['timings'] = timings
+            return result
             
-            # Try to parse as JSON
-            try:
-                result = json.loads(result_text)
-                # Validate required fields
-                result = self._validate_analysis_result(result)
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.warning(f"Failed to parse JSON result: {e}, using fallback format")
-                result = self._create_fallback_result(result_text, anomaly_prompt)
+        except Exception as e:
+            logger.error(f"Error during video analysis: {e}")
+            MODEL_CALLS.labels(outcome='error').inc()
+            return self._create_error_result(str(e))
+    
+    def analyze_frames_streaming(self, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict,
+                                 on_partial: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        Analyze video frames like ``analyze_frames``, streaming the completion.
+        
+        ``on_partial`` is called with each batch of top-level result fields
+        (e.g. ``{'has_anomaly': True}``) as soon as their values have been
+        generated. The return value is the same validated result.
+        """
+        if not self.client:
+            raise RuntimeError("Azure OpenAI client is not initialized")
+        
+        skipped = self.prefilter_result(frames, video_info)
+        if skipped is not None:
+            return skipped
+        
+        timings = {}
+        try:
+            with timed('build_request', timings):
+                request_kwargs, max_frames_for_analysis = self._build_analysis_request(frames, anomaly_prompt,
+                                                                                       video_info, stream=True)
             
-            # Add metadata
-            result['analysis_metadata'] = {
-                'frames_analyzed': max_frames_for_analysis,
-                'total_frames_available': len(frames),
-                'model_used': self.deployment_name,
-                'api_version': self.api_version
-            }
+            parser = IncrementalObjectParser()
+            usage = None
+            with timed('model_call', timings):
+                for chunk in self.client.chat.completions.create(**request_kwargs):
+                    # With include_usage the last chunk carries the usage and no choices
+                    usage = getattr(chunk, 'usage', None) or usage
+                    for choice in chunk.choices or []:
+                        content = getattr(choice.delta, 'content', None)
+                        fields = parser.feed(content) if content else None
+                        if fields:
+                            on_partial(fields)
             
+            with timed('parse', timings):
+                result = self._build_result(parser.text, usage, anomaly_prompt, max_frames_for_analysis, len(frames))
+            MODEL_CALLS.labels(outcome='success').inc()
+            result['analysis_metadata']['timings'] = timings
             return result
-            
+        
         except Exception as e:
-            logger.error(f"Error during video analysis: {e}")
+            logger.error(f"Error during streamed video analysis: {e}")
+            MODEL_CALLS.labels(outcome='error').inc()
             return self._create_error_result(str(e))
     
+    def _build_analysis_request(self, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict,
+                                stream: bool = False):
+        """Build the chat completions arguments; returns (kwargs, number of frames sent)."""
+        # Construct the analysis prompt
+        system_prompt = self._create_analysis_prompt(anomaly_prompt, video_info)
+        
+        # Prepare message content with frames
+        content = [{"type": "text", "text": system_prompt}]
+        
+        # Add frames (limit to avoid token limits)
+        max_frames_for_analysis = min(len(frames), 10)
+        for i, frame in enumerate(frames[:max_frames_for_analysis]):
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    # Base64 is only produced here, for the frames actually sent
+                    "url": frame.data_url(),
+                    # High detail unless the encoding settings chose otherwise
+                    "detail": frame.detail
+                }
+            })
+            
+            # Add frame context
+            content.append({
+                "type": "text",
+                "text": f"Frame {i+1}/{max_frames_for_analysis} - Timestamp: {frame.timestamp:.2f}s"
+            })
+        
+        PAYLOAD_BYTES.observe(sum(frame.base64_size for frame in frames[:max_frames_for_analysis]))
+        
+        request_kwargs = dict(
+            model=self.deployment_name,
+            messages=[{
+                "role": "user",
+                "content": content
+            }],
+            max_tokens=2000,
+            temperature=0.1,  # Low temperature for consistent analysis
+            top_p=0.9
+        )
+        if self.response_format == 'json_schema':
+            request_kwargs['response_format'] = {
+                'type': 'json_schema',
+                'json_schema': {'name': 'anomaly_analysis', 'strict': True, 'schema': ANALYSIS_RESULT_SCHEMA}
+            }
+        elif self.response_format == 'json_object':
+            request_kwargs['response_format'] = {'type': 'json_object'}
+        if stream:
+            request_kwargs['stream'] = True
+            if self._api_version_at_least(STREAM_USAGE_API_VERSION):
+                # Sent as extra_body: older openai SDKs lack the stream_options argument
+                request_kwargs['extra_body'] = {'stream_options': {'include_usage': True}}
+        return request_kwargs, max_frames_for_analysis
+    
+    def _parse_analysis_response(self, response, anomaly_prompt: str, frames_analyzed: int,
+                                 frames_available: int) -> Dict[str, Any]:
+        """Parse a chat completion into a validated analysis result."""
+        message = response.choices[0].message
+        if getattr(message, 'refusal', None):
+            raise ValueError(f"Model refused the request: {message.refusal}")
+        return self._build_result(message.content, getattr(response, 'usage', None), anomaly_prompt,
+                                  frames_analyzed, frames_available)
+    
+    def _build_result(self, result_text: str, usage, anomaly_prompt: str, frames_analyzed: int,
+                      frames_available: int) -> Dict[str, Any]:
+        """Turn the model's result text into a validated analysis result with metadata."""
+        logger.info(f"Received analysis result: {result_text[:200]}...")
+        
+        # Try to parse as JSON
+        try:
+            result = json.loads(result_text)
+            # Validate required fields
+            result = self._validate_analysis_result(result)
+        except (json.JSONDecodeError, KeyError) as e:
+            if self.response_format == 'json_schema':
+                # Schema-constrained output only fails to parse when it was cut short
+                raise ValueError(f"Model returned incomplete structured output: {e}")
+            logger.warning(f"Failed to parse JSON result: {e}, using fallback format")
+            result = self._create_fallback_result(result_text, anomaly_prompt)
+        
+        # Add metadata
+        record_usage(usage)
+        result['analysis_metadata'] = {
+            'frames_analyzed': frames_analyzed,
+            'total_frames_available': frames_available,
+            'model_used': self.deployment_name,
+            'api_version': self.api_version,
+            'response_format': self.response_format,
+            'usage': usage_dict(usage)
+        }
+        
+        return result
+    
     def _create_analysis_prompt(self, anomaly_prompt: str, video_info: Dict) -> str:
         """Create the analysis prompt for GPT-4V."""
         return f"""You are a professional surveillance video anomaly detection AI expert. Please analyze the following video frame sequence to detect whether there are user-specified anomalous situations.
@@ -0,0 +1,332 @@
+"""
+Batch analysis of many videos with one anomaly prompt.
+
+Videos flow through a two-stage pipeline: frames are decoded in a process
+pool, then model calls run on threads. Every model call in the process
+takes a slot from one global concurrency limit, whichever batch it belongs
+to. At most ``max_in_flight`` videos are between admission and result at
+any time, so only their frames are held in memory however many files the
+batch contains. Results are produced in completion order, one dict per
+video, and written as NDJSON.
+
+Command line:
+    python app/batch.py /data/night-clips --prompt "intrusion, fire" > results.ndjson
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from frame_encoding import EncodedFrame
+from decoders import register_decode_processes
+from video_pipeline import is_video_file, build_sampling_settings, extract_frames_for_request
+from video_probe import check_video, VideoRejectedError
+from long_video import analyze_long_video, LONG_VIDEO_CONCURRENCY
+from result_cache import build_cache_key
+from metrics import record_extraction, pop_analysis_timings
+
+logger = logging.getLogger(__name__)
+
+# Decode worker processes (default: one per CPU) and model calls in flight per process
+BATCH_DECODE_WORKERS = int(os.environ.get('BATCH_DECODE_WORKERS', 0)) or os.cpu_count() or 1
+BATCH_MAX_CONCURRENT_CALLS = int(os.environ.get('BATCH_MAX_CONCURRENT_CALLS', 8))
+
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+
+# Server-side directory that /batch may read ``paths`` from (unset: uploads only)
+BATCH_INPUT_DIR = os.environ.get('BATCH_INPUT_DIR')
+
+# Shared by every batch in this process
+_call_slots = threading.BoundedSemaphore(BATCH_MAX_CONCURRENT_CALLS)
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+class ConcurrencyLimitedAnalyzer:
+    """Analyzer wrapper that takes a slot from ``slots`` for every model call."""
+
+    def __init__(self, analyzer, slots: threading.Semaphore):
+        self.analyzer = analyzer
+        self.slots = slots
+
+    def analyze_frames(self, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict) -> Dict[str, Any]:
+        with self.slots:
+            return self.analyzer.analyze_frames(frames, anomaly_prompt, video_info)
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+
+def get_decode_pool() -> ProcessPoolExecutor:
+    """Return the process-wide decode pool, creating it on first use."""
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            # Spawned workers do not inherit the server's threads or client connections
+            register_decode_processes(BATCH_DECODE_WORKERS)
+            _decode_pool = ProcessPoolExecutor(max_workers=BATCH_DECODE_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _decode_pool
+
+
+def shutdown_decode_pool():
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is not None:
+            _decode_pool.shutdown(wait=True, cancel_futures=True)
+            _decode_pool = None
+
+
+def collect_video_files(paths: Iterable[str], recursive: bool = False) -> List[str]:
+    """
+    Expand files and directories into a sorted list of video files.
+
+    Raises:
+        ValueError: If a path does not exist
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, name) for name in names if is_video_file(name))
+            else:
+                files.extend(os.path.join(path, name) for name in os.listdir(path)
+                             if is_video_file(name) and os.path.isfile(os.path.join(path, name)))
+        elif os.path.isfile(path):
+            if is_video_file(path):
+                files.append(path)
+        else:
+            raise ValueError(f"Path not found: {path}")
+    return sorted(files)
+
+
+def resolve_input_paths(paths: Iterable[str], input_dir: Optional[str] = BATCH_INPUT_DIR) -> List[str]:
+    """
+    Resolve client-supplied paths against ``input_dir``, rejecting anything outside it.
+
+    Raises:
+        ValueError: If server-side paths are disabled or a path escapes ``input_dir``
+    """
+    if not input_dir:
+        raise ValueError("Server-side paths are disabled; set BATCH_INPUT_DIR or upload the videos")
+    root = os.path.realpath(input_dir)
+    resolved = []
+    for path in paths:
+        full_path = os.path.realpath(os.path.join(root, path))
+        if full_path != root and not full_path.startswith(root + os.sep):
+            raise ValueError(f"Path is outside the batch input directory: {path}")
+        resolved.append(full_path)
+    return resolved
+
+
+def _analyze(analyzer, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict, window_count: int) -> Dict:
+    if window_count > 1:
+        return analyze_long_video(analyzer, frames, anomaly_prompt, video_info, window_count,
+                                  max_concurrency=LONG_VIDEO_CONCURRENCY)
+    return analyzer.analyze_frames(frames, anomaly_prompt, video_info)
+
+
+def run_batch(files: List[str], anomaly_prompt: str, analyzer, options: Optional[Dict[str, Any]] = None,
+              labels: Optional[List[str]] = None, owned: Optional[set] = None,
+              decode_pool: Optional[ProcessPoolExecutor] = None,
+              call_slots: Optional[threading.Semaphore] = None,
+              max_in_flight: Optional[int] = None,
+              result_cache=None, file_hashes=None) -> Iterator[Dict[str, Any]]:
+    """
+    Analyse ``files`` with one prompt and yield a result per video as it completes.
+
+    Args:
+        files: Video paths
+        anomaly_prompt: User-specified anomaly types to detect
+        analyzer: Analyzer providing ``analyze_frames``
+        options: Per-request analysis options (see ``video_pipeline.parse_options``)
+        labels: Names reported for each file (default: the paths)
+        owned: Paths to delete once processed (e.g. uploaded files)
+        decode_pool: Process pool for decoding (default: the shared pool)
+        call_slots: Semaphore limiting concurrent model calls (default: the process-wide limit)
+        max_in_flight: Videos decoded or analysed at once (bounds memory)
+        result_cache: Optional result cache, shared with the single-video endpoints
+        file_hashes: ``FileHashMemo`` used to build cache keys
+
+    Yields:
+        Result dicts with ``index``, ``file`` and ``success``, in completion order
+    """
+    settings = build_sampling_settings(options or {})
+    labels = labels or list(files)
+    owned = set(owned or ())
+    decode_pool = decode_pool or get_decode_pool()
+    limited = ConcurrencyLimitedAnalyzer(analyzer, call_slots or _call_slots)
+    max_in_flight = max_in_flight or (BATCH_DECODE_WORKERS + BATCH_MAX_CONCURRENT_CALLS)
+
+    analysis_pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='batch-analysis')
+    queue = iter(enumerate(files))
+    in_flight = {}
+    remaining = set(range(len(files)))
+
+    def finish(index, started, **fields):
+        remaining.discard(index)
+        path = files[index]
+        if path in owned and os.path.exists(path):
+            os.remove(path)
+        result = {'index': index, 'file': labels[index]}
+        result.update(fields)
+        # Same record schema for fresh results, cache hits and failures
+        result['prompt_used'] = anomaly_prompt
+        result['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        return result
+
+    try:
+        exhausted = False
+        while in_flight or not exhausted:
+            # Admit videos up to the in-flight limit
+            while not exhausted and len(in_flight) < max_in_flight:
+                item = next(queue, None)
+                if item is None:
+                    exhausted = True
+                    break
+                index, path = item
+                started = time.perf_counter()
+                cache_key = None
+                try:
+                    file_hash = file_hashes.hash(path) if file_hashes is not None else None
+                    # Unreadable, unsupported or oversized videos fail here, before taking a decode slot
+                    probe = check_video(path, file_hash)
+                    if result_cache is not None and file_hash is not None:
+                        cache_key = build_cache_key(file_hash, anomaly_prompt,
+                                                    analyzer.deployment_name, settings)
+                        cached = result_cache.get(cache_key)
+                        if cached is not None:
+                            yield finish(index, started, success=True, video_info=cached.get('video_info'),
+                                         analysis=cached.get('analysis'), cache={'status': 'hit'})
+                            continue
+                    future = decode_pool.submit(extract_frames_for_request, path, settings, probe)
+                except VideoRejectedError as e:
+                    yield finish(index, started, success=False, error=str(e))
+                    continue
+                except Exception as e:
+                    yield finish(index, started, success=False, error=f'Video processing failed: {e}')
+                    continue
+                in_flight[future] = ('decode', index, started, cache_key, None)
+
+            if not in_flight:
+                continue
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index, started, cache_key, video_info = in_flight.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    logger.error(f"Batch {stage} failed for {labels[index]}: {e}")
+                    yield finish(index, started, success=False, error=f'Video processing failed: {e}')
+                    continue
+
+                if stage == 'decode':
+                    window_count, frames, video_info = outcome
+                    record_extraction(video_info)
+                    analysis_future = analysis_pool.submit(_analyze, limited, frames, anomaly_prompt,
+                                                           video_info, window_count)
+                    in_flight[analysis_future] = ('analysis', index, started, cache_key, video_info)
+                    continue
+
+                pop_analysis_timings(outcome)
+                result = {'success': True, 'video_info': video_info, 'analysis': outcome,
+                          'prompt_used': anomaly_prompt}
+                if cache_key is not None and 'error' not in outcome:
+                    result_cache.set(cache_key, result)
+                yield finish(index, started, success=True, video_info=video_info, analysis=outcome,
+                             cache={'status': 'miss' if cache_key is not None else 'disabled'})
+    finally:
+        # Reached early when the consumer stops reading (e.g. the client disconnected)
+        for future in in_flight:
+            future.cancel()
+        analysis_pool.shutdown(wait=False, cancel_futures=True)
+        for index in remaining:
+            path = files[index]
+            if path in owned and os.path.exists(path):
+                os.remove(path)
+
+
+def iter_ndjson(results: Iterable[Dict[str, Any]], summary: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """Serialise batch results as NDJSON lines, ending with a summary line (also filled into ``summary``)."""
+    started = time.perf_counter()
+    summary = summary if summary is not None else {}
+    summary.update({'videos': 0, 'succeeded': 0, 'failed': 0, 'anomalies': 0})
+    for result in results:
+        summary['videos'] += 1
+        analysis = result.get('analysis') or {}
+        if result.get('success') and 'error' not in analysis:
+            summary['succeeded'] += 1
+            summary['anomalies'] += 1 if analysis.get('has_anomaly') else 0
+        else:
+            summary['failed'] += 1
+        yield json.dumps(result, ensure_ascii=False) + '\n'
+    summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    yield json.dumps({'summary': summary}, ensure_ascii=False) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse many videos with one anomaly prompt (NDJSON output).')
+    parser.add_argument('paths', nargs='+', help='Video files or directories')
+    parser.add_argument('--prompt', required=True, help='Anomaly types to detect')
+    parser.add_argument('--output', '-o', help='Write NDJSON here instead of stdout')
+    parser.add_argument('--recursive', '-r', action='store_true', help='Descend into subdirectories')
+    parser.add_argument('--concurrency', type=int, default=BATCH_MAX_CONCURRENT_CALLS,
+                        help='Maximum concurrent model calls')
+    parser.add_argument('--decode-workers', type=int, default=BATCH_DECODE_WORKERS,
+                        help='Decode worker processes')
+    parser.add_argument('--sampling-mode', default='', help='uniform or motion')
+    parser.add_argument('--encoding-profile', default='', help='high, balanced or economy')
+    parser.add_argument('--long-video', action='store_true', help='Analyse long videos window by window')
+    parser.add_argument('--prefilter', action='store_true', help='Skip model calls on static clips')
+    parser.add_argument('--camera-profile', default='', help='Activity pre-filter thresholds to use')
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    from analyzers import create_analyzer
+    from video_pipeline import parse_options
+
+    try:
+        files = collect_video_files(args.paths, recursive=args.recursive)
+        options = parse_options({'sampling_mode': args.sampling_mode, 'encoding_profile': args.encoding_profile,
+                                 'long_video': 'true' if args.long_video else '',
+                                 'prefilter': 'true' if args.prefilter else '',
+                                 'camera_profile': args.camera_profile})
+    except ValueError as e:
+        parser.error(str(e))
+    if not files:
+        parser.error('No video files found')
+
+    analyzer = create_analyzer()
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    summary = {}
+    register_decode_processes(args.decode_workers)
+    decode_pool = ProcessPoolExecutor(max_workers=args.decode_workers,
+                                      mp_context=multiprocessing.get_context('spawn'))
+    try:
+        results = run_batch(files, args.prompt, analyzer, options, decode_pool=decode_pool,
+                            call_slots=threading.BoundedSemaphore(args.concurrency),
+                            max_in_flight=args.decode_workers + args.concurrency)
+        for line in iter_ndjson(results, summary):
+            out.write(line)
+            out.flush()
+    finally:
+        decode_pool.shutdown(wait=True, cancel_futures=True)
+        if out is not sys.stdout:
+            out.close()
+    return 1 if summary.get('failed') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""
+Video decoder backends for frame sampling.
+
+Two frame readers share one interface (``properties``, ``read_at``,
+``stats`` and ``release``):
+
+- ``OpenCVFrameReader`` uses ``cv2.VideoCapture``. Long gaps between sample
+  points are crossed with a container seek and short gaps with ``grab()``
+  (which skips colour conversion and the copy into a NumPy array);
+  containers that cannot seek accurately fall back to a sequential pass.
+- ``PyAVFrameReader`` uses PyAV (FFmpeg bindings). Frames that are only
+  stepped over are never converted, and kept frames are scaled during the
+  YUV to BGR conversion when a ``max_dimension`` is given, instead of
+  being converted at full resolution and resized afterwards.
+
+Both decode with ``DECODE_THREADS`` FFmpeg threads. The backend is chosen
+per container format (``select_backend``): PyAV handles the formats in
+``PYAV_FORMATS`` when it is installed, OpenCV everything else. PyAV
+measured as fast or faster than OpenCV on every supported container
+(``benchmarks/bench_decoders.py``), so by default it takes all of them and
+OpenCV remains the fallback for other formats or when PyAV is missing.
+"""
+import os
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import cv2
+
+try:
+    import av
+except ImportError:  # PyAV is optional; OpenCV decodes everything without it
+    av = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_OPENCV = 'opencv'
+BACKEND_PYAV = 'pyav'
+DECODER_BACKENDS = (BACKEND_OPENCV, BACKEND_PYAV)
+
+# auto, opencv or pyav; auto picks per container format
+DECODER_BACKEND = os.environ.get('DECODER_BACKEND', 'auto').lower()
+
+# Container formats decoded with PyAV when DECODER_BACKEND=auto
+PYAV_FORMATS = {ext.strip().lower() for ext in os.environ.get('PYAV_FORMATS', 'mp4,avi,mov,mkv,webm').split(',')
+                if ext.strip()}
+
+# FFmpeg decoding threads per video. 0 (default) shares the CPUs out between
+# the processes that decode at once on this host, at most AUTO_DECODE_THREADS_MAX
+DECODE_THREADS = int(os.environ.get('DECODE_THREADS', 0))
+AUTO_DECODE_THREADS_MAX = 4
+
+# Processes decoding concurrently on this host; set by the gunicorn config
+# and by ``register_decode_processes`` before decode process pools start
+DECODE_PROCESSES_VARIABLE = 'DECODE_PARALLEL_PROCESSES'
+
+# Gaps up to this many frames are crossed with grab() instead of a seek.
+# A seek lands on the preceding keyframe and decodes forward from there, so
+# for short gaps stepping the decoder directly is cheaper.
+DEFAULT_SEEK_THRESHOLD = int(os.environ.get('FRAME_SEEK_THRESHOLD', 48))
+
+STRATEGY_SEEK = 'seek'
+STRATEGY_SEQUENTIAL = 'sequential'
+
+
+def select_backend(video_path: str, backend: Optional[str] = None) -> str:
+    """
+    Return the decoder backend for ``video_path``.
+
+    Raises:
+        ValueError: If the backend is unknown, or PyAV is requested but not installed
+    """
+    backend = (backend or DECODER_BACKEND).lower()
+    if backend == 'auto':
+        extension = os.path.splitext(video_path)[1].lstrip('.').lower()
+        return BACKEND_PYAV if av is not None and extension in PYAV_FORMATS else BACKEND_OPENCV
+    if backend not in DECODER_BACKENDS:
+        raise ValueError(f"Unsupported decoder backend '{backend}'. Use auto or one of: {', '.join(DECODER_BACKENDS)}")
+    if backend == BACKEND_PYAV and av is None:
+        raise ValueError("The pyav decoder backend requires the 'av' package")
+    return backend
+
+
+def decode_threads(threads: Optional[int] = None) -> int:
+    threads = DECODE_THREADS if threads is None else threads
+    if threads > 0:
+        return threads
+    # Every gunicorn worker and decode pool process decodes at the same time,
+    # so one thread per CPU in each would oversubscribe the CPUs many times over
+    processes = max(1, int(os.environ.get(DECODE_PROCESSES_VARIABLE) or 1))
+    return max(1, min(AUTO_DECODE_THREADS_MAX, (os.cpu_count() or 1) // processes))
+
+
+def register_decode_processes(count: int):
+    """
+    Record that each process here starts ``count`` decoding processes.
+
+    Call before starting a decode process pool; spawned workers read the
+    total from the environment when sizing their decode threads.
+    """
+    current = max(1, int(os.environ.get(DECODE_PROCESSES_VARIABLE) or 1))
+    os.environ[DECODE_PROCESSES_VARIABLE] = str(current * max(1, count))
+
+
+def scaled_size(width: int, height: int, max_dimension: Optional[int]) -> Tuple[int, int]:
+    """Size of a ``width`` x ``height`` frame scaled to fit ``max_dimension`` (never upscaled)."""
+    if not max_dimension or max(width, height) <= max_dimension:
+        return width, height
+    scale = max_dimension / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _new_stats(allow_seek: bool, backend: str) -> Dict[str, Any]:
+    return {
+        'backend': backend,
+        'strategy': STRATEGY_SEEK if allow_seek else STRATEGY_SEQUENTIAL,
+        'frames_read': 0,
+        'frames_grabbed': 0,
+        'seeks': 0,
+        'seek_fallbacks': 0
+    }
+
+
+class OpenCVFrameReader:
+    """Reads selected frames from a video file with seek/grab and sequential fallback."""
+
+    def __init__(self, video_path: str, seek_threshold: int = DEFAULT_SEEK_THRESHOLD,
+                 allow_seek: bool = True, threads: Optional[int] = None,
+                 max_dimension: Optional[int] = None):
+        self.video_path = video_path
+        self.seek_threshold = max(1, seek_threshold)
+        self.can_seek = allow_seek
+        self.threads = decode_threads(threads)
+        self.max_dimension = max_dimension
+        self.position = 0  # Index of the next frame the decoder will return
+        self.stats = _new_stats(allow_seek, BACKEND_OPENCV)
+        self.cap = None
+        self._open()
+
+        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.properties = {
+            'total_frames': total_frames,
+            'fps': fps,
+            'duration': total_frames / fps if fps > 0 else 0,
+            'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        }
+
+    def _open(self):
+        """(Re)open the capture at the start of the file."""
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = cv2.VideoCapture(self.video_path, cv2.CAP_ANY, [cv2.CAP_PROP_N_THREADS, self.threads])
+        if not self.cap.isOpened():
+            raise ValueError("Cannot open video file")
+        self.position = 0
+
+    def _fall_back_to_sequential(self):
+        """Give up on seeking and restart decoding from the first frame."""
+        logger.info(f"Accurate seeking unavailable for {self.video_path}, falling back to sequential decode")
+        self.can_seek = False
+        self.stats['strategy'] = STRATEGY_SEQUENTIAL
+        self.stats['seek_fallbacks'] += 1
+        self._open()
+
+    def _seek(self, target: int) -> bool:
+        """Seek so that the next frame returned is ``target``."""
+        if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+            return False
+        if int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) != target:
+            return False
+        self.stats['seeks'] += 1
+        self.position = target
+        return True
+
+    def _skip_to(self, target: int) -> bool:
+        """Advance the decoder with grab() until ``target`` is the next frame."""
+        while self.position < target:
+            if not self.cap.grab():
+                return False
+            self.stats['frames_grabbed'] += 1
+            self.position += 1
+        return True
+
+    def read_at(self, target: int):
+        """
+        Return the decoded frame at ``target`` or None at end of stream.
+
+        Targets must be requested in increasing order.
+        """
+        if target < self.position:
+            raise ValueError("Frame indices must be requested in increasing order")
+
+        seeked = False
+        if self.can_seek and target - self.position > self.seek_threshold:
+            seeked = self._seek(target)
+            if not seeked:
+                self._fall_back_to_sequential()
+
+        if not seeked and not self._skip_to(target):
+            return None
+
+        ret, frame = self.cap.read()
+        if not ret and seeked:
+            # Seek reported success but the decoder could not deliver the
+            # frame; retry the same target sequentially before giving up.
+            self._fall_back_to_sequential()
+            if not self._skip_to(target):
+                return None
+            ret, frame = self.cap.read()
+
+        if not ret:
+            return None
+
+        self.stats['frames_read'] += 1
+        self.position = target + 1
+        height, width = frame.shape[:2]
+        size = scaled_size(width, height, self.max_dimension)
+        if size != (width, height):
+            # OpenCV cannot scale while decoding; shrink before the frame is kept
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def release(self):
+        """Release the underlying capture."""
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+def pyav_stream_properties(container, stream) -> Dict[str, Any]:
+    """Frame count, fps, duration and size of a PyAV video stream, read from the headers."""
+    rate = stream.average_rate or stream.guessed_rate
+    fps = float(rate) if rate else 0.0
+    if stream.duration is not None:
+        duration = float(stream.duration * stream.time_base)
+    elif container.duration is not None:
+        duration = container.duration / av.time_base
+    else:
+        duration = 0.0
+    # Matroska/WebM headers carry no frame count; derive it from the duration
+    total_frames = stream.frames or int(round(duration * fps))
+    return {
+        'total_frames': total_frames,
+        'fps': fps,
+        'duration': total_frames / fps if fps > 0 else duration,
+        'width': stream.codec_context.width,
+        'height': stream.codec_context.height
+    }
+
+
+class PyAVFrameReader:
+    """
+    Reads selected frames with PyAV, decoding only from the last keyframe before each target.
+
+    Packets are demuxed without decoding, and those before a keyframe that
+    precedes the next target are dropped undecoded. For intra-only codecs
+    such as MJPEG only the kept frames are decoded at all; for inter-coded
+    video the decoder starts at the nearest keyframe rather than at the
+    previously kept frame. Kept frames are scaled during the colour
+    conversion when ``max_dimension`` is set.
+    """
+
+    # Decode buffered packets once this many are waiting, bounding the
+    # memory used by videos with very long keyframe intervals
+    MAX_BUFFERED_PACKETS = 600
+
+    def __init__(self, video_path: str, seek_threshold: int = DEFAULT_SEEK_THRESHOLD,
+                 allow_seek: bool = True, threads: Optional[int] = None,
+                 max_dimension: Optional[int] = None):
+        if av is None:
+            raise ValueError("The pyav decoder backend requires the 'av' package")
+        self.video_path = video_path
+        # Skipping packets is cheap, so seeks only pay off for much longer gaps than with OpenCV
+        self.seek_threshold = max(1, seek_threshold) * 10
+        self.can_seek = allow_seek
+        self.threads = decode_threads(threads)
+        self.max_dimension = max_dimension
+        self.position = 0  # Index after the last frame returned
+        self.stats = _new_stats(allow_seek, BACKEND_PYAV)
+        self.stats['packets_skipped'] = 0
+        self.container = None
+        self._open()
+
+        self.properties = pyav_stream_properties(self.container, self.stream)
+        self._fps = self.properties['fps']
+
+    def _open(self):
+        """(Re)open the container at the start of the file."""
+        if self.container is not None:
+            self.container.close()
+        try:
+            self.container = av.open(self.video_path)
+        except av.AVError as e:
+            raise ValueError(f"Cannot open video file: {e}")
+        if not self.container.streams.video:
+            self.container.close()
+            self.container = None
+            raise ValueError("Cannot open video file: no video stream")
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        self.stream.codec_context.thread_count = self.threads
+        self._start = self.stream.start_time or 0
+        self._reset_demuxer()
+        self.position = 0
+
+    def _reset_demuxer(self):
+        self._packets = self.container.demux(self.stream)
+        self._buffered = []  # Packets not yet decoded, in decode order
+        self._decoded = []   # Decoded frames not yet returned
+        self._decoding = False
+        self._flushed = False
+
+    def _index(self, pts) -> Optional[int]:
+        if pts is None or not self._fps:
+            return None
+        return int(round(float((pts - self._start) * self.stream.time_base) * self._fps))
+
+    def _decode(self, packet, target: Optional[int] = None):
+        codec_context = self.stream.codec_context
+        if packet is not None and target is not None:
+            # Frames before the target that nothing references need not be decoded
+            index = self._index(packet.pts)
+            skip = 'NONREF' if index is not None and index < target else 'DEFAULT'
+            if codec_context.skip_frame != skip:
+                codec_context.skip_frame = skip
+        for frame in codec_context.decode(packet):
+            self._decoded.append(frame)
+
+    def _seek(self, target: int) -> bool:
+        """Seek to the keyframe at or before ``target``."""
+        offset = self._start + int(target / self._fps / self.stream.time_base)
+        try:
+            self.container.seek(offset, stream=self.stream, backward=True, any_frame=False)
+        except av.AVError:
+            return False
+        self._reset_demuxer()
+        self.stats['seeks'] += 1
+        return True
+
+    def _fall_back_to_sequential(self):
+        logger.info(f"Seeking failed for {self.video_path}, falling back to sequential decode")
+        self.can_seek = False
+        self.stats['strategy'] = STRATEGY_SEQUENTIAL
+        self.stats['seek_fallbacks'] += 1
+        self._open()
+
+    def _convert(self, frame):
+        width, height = scaled_size(frame.width, frame.height, self.max_dimension)
+        if (width, height) == (frame.width, frame.height):
+            return frame.to_ndarray(format='bgr24')
+        # swscale resizes during the colour conversion
+        return frame.reformat(width=width, height=height, format='bgr24',
+                              interpolation='AREA').to_ndarray()
+
+    def _take_decoded(self, target: int):
+        """Return the first decoded frame at or after ``target``, dropping earlier ones."""
+        while self._decoded:
+            frame = self._decoded.pop(0)
+            index = self._index(frame.pts)
+            if index is None:
+                # No timestamps: count frames in output order
+                index = self._next_index
+            self._next_index = index + 1
+            if index < target:
+                self.stats['frames_grabbed'] += 1
+                continue
+            self.position = index + 1
+            self.stats['frames_read'] += 1
+            return self._convert(frame)
+        return None
+
+    def read_at(self, target: int):
+        """
+        Return the decoded frame at ``target`` or None at end of stream.
+
+        Targets must be requested in increasing order.
+        """
+        if target < self.position:
+            raise ValueError("Frame indices must be requested in increasing order")
+
+        if self.can_seek and self._fps and target - self.position > self.seek_threshold:
+            if not self._seek(target):
+                self._fall_back_to_sequential()
+        self._next_index = self.position
+        # Buffered packets wait until it is known whether a later keyframe makes them unnecessary
+        self._decoding = False
+
+        try:
+            while True:
+                frame = self._take_decoded(target)
+                if frame is not None:
+                    return frame
+                if self._decoding and self._buffered:
+                    self._decode(self._buffered.pop(0), target)
+                    continue
+                if self._flushed:
+                    return None
+
+                packet = next(self._packets, None)
+                if packet is None or packet.size == 0:
+                    if self._buffered:
+                        # End of stream: the target is in what is left
+                        self._decoding = True
+                    else:
+                        # Drain the decoder
+                        self._decode(None)
+                        self._flushed = True
+                    continue
+
+                index = self._index(packet.pts)
+                if packet.is_keyframe and index is not None:
+                    if index <= target:
+                        # Everything before this keyframe is not needed
+                        self.stats['packets_skipped'] += len(self._buffered)
+                        self._buffered = []
+                        self._decoding = False
+                    else:
+                        # The target is in the buffered packets (or leads this keyframe)
+                        self._decoding = True
+                self._buffered.append(packet)
+                if len(self._buffered) >= self.MAX_BUFFERED_PACKETS:
+                    self._decoding = True
+        except av.AVError as e:
+            logger.warning(f"Decoding {self.video_path} stopped early: {e}")
+        return None
+
+    def release(self):
+        """Close the container."""
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+def open_frame_reader(video_path: str, backend: Optional[str] = None,
+                      seek_threshold: int = DEFAULT_SEEK_THRESHOLD, allow_seek: bool = True,
+                      threads: Optional[int] = None, max_dimension: Optional[int] = None):
+    """
+    Open a frame reader with the backend chosen for ``video_path``.
+
+    Raises:
+        ValueError: If the file cannot be opened or the backend is unavailable
+    """
+    reader_class = PyAVFrameReader if select_backend(video_path, backend) == BACKEND_PYAV else OpenCVFrameReader
+    return reader_class(video_path, seek_threshold=seek_threshold, allow_seek=allow_seek, threads=threads,
+                        max_dimension=max_dimension)
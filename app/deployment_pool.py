@@ -0,0 +1,347 @@
+"""
+Routing of model calls across several Azure OpenAI deployments.
+
+A single deployment's quota caps throughput, so AZURE_OPENAI_DEPLOYMENTS can
+list several endpoint/deployment pairs (e.g. the same model in several
+regions). ``DeploymentPool`` exposes the usual ``chat.completions.create``
+call and sends each request to one of them:
+
+- ``least_outstanding`` (default): the healthy deployment with the fewest
+  in-flight requests relative to its weight
+- ``weighted``: a random healthy deployment, in proportion to the weights
+
+A 429, 5xx or connection error puts the deployment in a cooldown (the
+Retry-After delay for 429s, otherwise doubling with consecutive failures)
+and the request fails over to another deployment straight away. Only when
+every healthy deployment has failed is the error raised, for
+``ResilientChatClient`` to back off and retry. When all deployments are
+cooling down, the one that recovers first is tried, so a request is never
+refused without a call. Per-deployment counters are reported on /health.
+"""
+import os
+import json
+import time
+import asyncio
+import random
+import logging
+import threading
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse
+
+import openai
+
+from resilient_client import is_retryable_error, retry_after_seconds
+from metrics import MODEL_CLIENT_EVENTS, MODEL_DEPLOYMENT_CALLS
+
+logger = logging.getLogger(__name__)
+
+ROUTING_STRATEGIES = ('least_outstanding', 'weighted')
+
+# How requests are spread over the deployments
+DEPLOYMENT_ROUTING = os.environ.get('AZURE_OPENAI_ROUTING', 'least_outstanding').lower()
+
+# Seconds a deployment is skipped after a 5xx/connection error (doubling per consecutive
+# failure, up to the maximum) or after a 429 without Retry-After
+DEPLOYMENT_COOLDOWN_SECONDS = float(os.environ.get('AZURE_OPENAI_DEPLOYMENT_COOLDOWN', 5.0))
+DEPLOYMENT_MAX_COOLDOWN_SECONDS = float(os.environ.get('AZURE_OPENAI_DEPLOYMENT_MAX_COOLDOWN', 60.0))
+
+# Weight of the latest call in each deployment's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+
+def load_deployment_configs(variable: str = 'AZURE_OPENAI_DEPLOYMENTS', require_api_key: bool = True,
+                            default_deployment: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Read the deployment pool from ``variable``: a JSON list, or the path of a JSON file holding one.
+
+    Each entry has an ``endpoint`` and optionally ``deployment`` (default
+    ``default_deployment`` or AZURE_OPENAI_DEPLOYMENT_NAME), ``api_key_env``
+    (name of the variable holding its key) or ``api_key`` (default
+    AZURE_OPENAI_API_KEY), ``weight`` (default 1) and ``name``. Other keys
+    are kept, e.g. for the fake backend's per-endpoint latency and error rates.
+
+    Returns:
+        The deployment configs, or an empty list when ``variable`` is unset
+
+    Raises:
+        ValueError: If the list is malformed or a deployment is incomplete
+    """
+    raw = os.environ.get(variable, '').strip()
+    if not raw:
+        return []
+    if not raw.startswith('['):
+        with open(raw, 'r', encoding='utf-8') as f:
+            raw = f.read()
+    try:
+        entries = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"{variable} is not valid JSON: {e}")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{variable} must be a non-empty JSON list of deployments")
+
+    configs = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get('endpoint'):
+            raise ValueError(f"{variable} entry {position} needs an endpoint")
+        config = dict(entry)
+        config['deployment'] = (entry.get('deployment') or default_deployment
+                                or os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME'))
+        if not config['deployment']:
+            raise ValueError(f"{variable} entry {position} needs a deployment (or set AZURE_OPENAI_DEPLOYMENT_NAME)")
+        if entry.get('api_key_env'):
+            config['api_key'] = os.environ.get(entry['api_key_env'])
+        else:
+            config['api_key'] = entry.get('api_key') or os.environ.get('AZURE_OPENAI_API_KEY')
+        if require_api_key and not config['api_key']:
+            raise ValueError(f"{variable} entry {position} has no API key; "
+                             f"set api_key_env, api_key or AZURE_OPENAI_API_KEY")
+        config['weight'] = float(entry.get('weight', 1))
+        if config['weight'] <= 0:
+            raise ValueError(f"{variable} entry {position} needs a positive weight")
+        host = urlparse(entry['endpoint']).hostname or entry['endpoint']
+        config['name'] = entry.get('name') or f"{config['deployment']}@{host}"
+        configs.append(config)
+
+    names = [config['name'] for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{variable} deployment names must be unique: {', '.join(names)}")
+    return configs
+
+
+class Deployment:
+    """One endpoint/deployment pair: its client, health and counters."""
+
+    def __init__(self, name: str, endpoint: str, deployment: str, client, weight: float = 1.0):
+        """
+        Args:
+            name: Label used in stats, logs and metrics
+            endpoint: Endpoint URL (for reporting)
+            deployment: Deployment name sent as the request's ``model``
+            client: Client exposing ``chat.completions.create``, without retries of its own
+            weight: Relative share of the traffic
+        """
+        self.name = name
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.client = client
+        self.weight = weight
+
+        self.outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.latency = None
+        self.last_error = None
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'endpoint': self.endpoint,
+            'deployment': self.deployment,
+            'weight': self.weight,
+            'healthy': self.cooldown_until <= now,
+            'cooldown_remaining': round(max(0.0, self.cooldown_until - now), 1),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'successes': self.successes,
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'consecutive_failures': self.consecutive_failures,
+            'avg_latency': round(self.latency, 3) if self.latency is not None else None,
+            'last_error': self.last_error
+        }
+
+
+class DeploymentPool:
+    """Chat completions client routing each request to one of several deployments, with failover."""
+
+    def __init__(self, deployments: List[Deployment], routing: str = DEPLOYMENT_ROUTING,
+                 cooldown: float = DEPLOYMENT_COOLDOWN_SECONDS,
+                 max_cooldown: float = DEPLOYMENT_MAX_COOLDOWN_SECONDS):
+        """
+        Args:
+            deployments: Deployments to route over
+            routing: ``least_outstanding`` or ``weighted``
+            cooldown: Seconds a failed deployment is skipped (doubling per consecutive failure)
+            max_cooldown: Cooldown cap in seconds
+        """
+        if not deployments:
+            raise ValueError("A deployment pool needs at least one deployment")
+        if routing not in ROUTING_STRATEGIES:
+            logger.warning(f"Unknown AZURE_OPENAI_ROUTING '{routing}', using least_outstanding")
+            routing = 'least_outstanding'
+        self.deployments = deployments
+        self.routing = routing
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def endpoints(self) -> str:
+        """The deployments' endpoints, for reporting."""
+        return ', '.join(dict.fromkeys(deployment.endpoint for deployment in self.deployments))
+
+    def _select(self, tried: List[Deployment]) -> Optional[Deployment]:
+        """Pick the deployment for the next attempt and count it as outstanding; None when all have failed."""
+        with self._lock:
+            now = time.monotonic()
+            healthy = [d for d in self.deployments if d not in tried and d.cooldown_until <= now]
+            if not healthy:
+                if tried:
+                    return None
+                # Everything is cooling down: probe the deployment that recovers first
+                healthy = [min(self.deployments, key=lambda d: d.cooldown_until)]
+            if self.routing == 'weighted':
+                deployment = self._random.choices(healthy, weights=[d.weight for d in healthy])[0]
+            else:
+                lowest = min(d.outstanding / d.weight for d in healthy)
+                deployment = self._random.choice([d for d in healthy if d.outstanding / d.weight == lowest])
+            deployment.outstanding += 1
+            deployment.requests += 1
+            if tried:
+                self.failovers += 1
+        if tried:
+            MODEL_CLIENT_EVENTS.labels(event='failovers').inc()
+            logger.warning(f"Failing over from {tried[-1].name} ({tried[-1].last_error}) to {deployment.name}")
+        return deployment
+
+    def _release(self, deployment: Deployment, started: float, error: Optional[Exception] = None):
+        """Record the end of a call on ``deployment`` and update its health."""
+        with self._lock:
+            deployment.outstanding -= 1
+            if error is None:
+                elapsed = time.perf_counter() - started
+                deployment.successes += 1
+                deployment.consecutive_failures = 0
+                deployment.cooldown_until = 0.0
+                deployment.latency = (elapsed if deployment.latency is None
+                                      else deployment.latency + LATENCY_SMOOTHING * (elapsed - deployment.latency))
+                outcome = 'success'
+            elif is_retryable_error(error):
+                deployment.consecutive_failures += 1
+                deployment.last_error = error.__class__.__name__
+                if isinstance(error, openai.RateLimitError):
+                    deployment.throttled += 1
+                    cooldown = retry_after_seconds(error) or self.cooldown
+                    outcome = 'throttled'
+                else:
+                    deployment.errors += 1
+                    cooldown = self.cooldown * 2 ** (deployment.consecutive_failures - 1)
+                    outcome = 'error'
+                deployment.cooldown_until = time.monotonic() + min(cooldown, self.max_cooldown)
+            else:
+                # Client errors (e.g. 400) come from the request, not the deployment's health
+                deployment.errors += 1
+                deployment.last_error = error.__class__.__name__
+                outcome = 'error'
+        MODEL_DEPLOYMENT_CALLS.labels(deployment=deployment.name, outcome=outcome).inc()
+
+    def _track_stream(self, deployment: Deployment, started: float, stream):
+        """Keep a streamed call outstanding until its last chunk has been read."""
+        error = None
+        try:
+            yield from stream
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(deployment, started, error)
+
+    def create(self, **kwargs):
+        """Same signature as ``client.chat.completions.create``; ``model`` is replaced by each deployment's name."""
+        tried = []
+        last_error = None
+        while True:
+            deployment = self._select(tried)
+            if deployment is None:
+                raise last_error
+            started = time.perf_counter()
+            try:
+                response = deployment.client.chat.completions.create(**dict(kwargs, model=deployment.deployment))
+            except Exception as e:
+                self._release(deployment, started, e)
+                if not is_retryable_error(e):
+                    raise
+                tried.append(deployment)
+                last_error = e
+                continue
+            if kwargs.get('stream'):
+                return self._track_stream(deployment, started, response)
+            self._release(deployment, started)
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing strategy, failovers and per-deployment health and counters."""
+        with self._lock:
+            now = time.monotonic()
+            deployments = [deployment.to_dict(now) for deployment in self.deployments]
+            return {
+                'routing': self.routing,
+                'healthy': sum(1 for deployment in deployments if deployment['healthy']),
+                'failovers': self.failovers,
+                'deployments': deployments
+            }
+
+
+class AsyncDeploymentPool(DeploymentPool):
+    """
+    Asyncio variant of ``DeploymentPool`` for ``AsyncAzureOpenAI`` clients.
+
+    There is no ``ResilientChatClient`` on the asyncio path, so when every
+    deployment has failed a request the pool itself waits for the first
+    deployment to recover and tries again, up to ``max_retries`` times.
+    """
+
+    def __init__(self, deployments: List[Deployment], max_retries: int = 5, **kwargs):
+        super().__init__(deployments, **kwargs)
+        self.max_retries = max_retries
+
+    def _seconds_to_recovery(self) -> float:
+        with self._lock:
+            first = min(deployment.cooldown_until for deployment in self.deployments)
+        return max(0.0, first - time.monotonic()) + random.uniform(0, 0.1)
+
+    async def create(self, **kwargs):
+        """Same signature as ``AsyncAzureOpenAI.chat.completions.create``; streams are not tracked."""
+        tried = []
+        last_error = None
+        retries = 0
+        while True:
+            deployment = self._select(tried)
+            if deployment is None:
+                if retries >= self.max_retries:
+                    raise last_error
+                retries += 1
+                delay = self._seconds_to_recovery()
+                logger.warning(f"All deployments failed ({last_error.__class__.__name__}), "
+                               f"retry {retries}/{self.max_retries} in {delay:.1f}s")
+                MODEL_CLIENT_EVENTS.labels(event='retries').inc()
+                await asyncio.sleep(delay)
+                tried = []
+                continue
+            started = time.perf_counter()
+            try:
+                response = await deployment.client.chat.completions.create(
+                    **dict(kwargs, model=deployment.deployment))
+            except Exception as e:
+                self._release(deployment, started, e)
+                if not is_retryable_error(e):
+                    raise
+                tried.append(deployment)
+                last_error = e
+                continue
+            self._release(deployment, started)
+            return response
+
+    async def close(self):
+        """Close every deployment's client."""
+        for deployment in self.deployments:
+            await deployment.client.close()
@@ -0,0 +1,305 @@
+"""
+Offline stand-in for Azure OpenAI, for load testing and benchmarks.
+
+``FakeChatClient`` mimics ``client.chat.completions.create`` and returns
+schema-valid anomaly JSON after a configurable latency. It can also inject
+server errors and 429 throttling (with a Retry-After header) as the real
+``openai`` exceptions. With ``stream=True`` the completion is returned as
+chunks spread over the latency, like a streamed completion.
+``FakeVideoAnalyzer`` runs the normal
+``AzureAIVideoAnalyzer`` prompt and parsing path on top of it;
+``AsyncFakeChatClient`` and ``AsyncFakeVideoAnalyzer`` are the asyncio
+counterparts used by the ASGI app. FAKE_ANALYZER_DEPLOYMENTS lists several
+fake endpoints, each with its own latency, error and throttle rates, to
+exercise deployment pool routing and failover locally.
+"""
+import os
+import re
+import asyncio
+import json
+import time
+import random
+import logging
+import threading
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional
+
+import httpx
+import openai
+
+from azure_ai_analyzer import AzureAIVideoAnalyzer
+from resilient_client import ResilientChatClient
+from deployment_pool import DeploymentPool, AsyncDeploymentPool, Deployment, load_deployment_configs
+from async_analyzer import AsyncAzureAIVideoAnalyzer, ASYNC_MAX_CONCURRENT_CALLS
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_PATTERN = re.compile(r'Timestamp: ([0-9.]+)s')
+
+# Streamed completions: share of the latency before the first chunk, and characters per chunk
+STREAM_FIRST_CHUNK_FRACTION = 0.25
+STREAM_CHUNK_CHARS = 16
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+class FakeChatClient:
+    """In-process fake of the ``AzureOpenAI`` chat completions client."""
+
+    def __init__(self, latency: Optional[float] = None, latency_jitter: Optional[float] = None,
+                 error_rate: Optional[float] = None, throttle_rate: Optional[float] = None,
+                 anomaly_rate: Optional[float] = None, retry_after: Optional[float] = None,
+                 endpoint: str = 'fake://local', seed: Optional[int] = None):
+        """
+        Args:
+            latency: Mean seconds per completion (FAKE_ANALYZER_LATENCY)
+            latency_jitter: Uniform +/- jitter in seconds (FAKE_ANALYZER_LATENCY_JITTER)
+            error_rate: Probability of a 500 error (FAKE_ANALYZER_ERROR_RATE)
+            throttle_rate: Probability of a 429 response (FAKE_ANALYZER_THROTTLE_RATE)
+            anomaly_rate: Probability that a result reports an anomaly (FAKE_ANALYZER_ANOMALY_RATE)
+            retry_after: Retry-After seconds sent with 429 responses (FAKE_ANALYZER_RETRY_AFTER)
+            endpoint: Name reported for this fake endpoint
+            seed: Random seed for reproducible runs
+        """
+        self.latency = latency if latency is not None else _env_float('FAKE_ANALYZER_LATENCY', 1.0)
+        self.latency_jitter = (latency_jitter if latency_jitter is not None
+                               else _env_float('FAKE_ANALYZER_LATENCY_JITTER', 0.2))
+        self.error_rate = error_rate if error_rate is not None else _env_float('FAKE_ANALYZER_ERROR_RATE', 0.0)
+        self.throttle_rate = (throttle_rate if throttle_rate is not None
+                              else _env_float('FAKE_ANALYZER_THROTTLE_RATE', 0.0))
+        self.anomaly_rate = (anomaly_rate if anomaly_rate is not None
+                             else _env_float('FAKE_ANALYZER_ANOMALY_RATE', 0.3))
+        self.retry_after = (retry_after if retry_after is not None
+                            else _env_float('FAKE_ANALYZER_RETRY_AFTER', 1.0))
+        self.endpoint = endpoint
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+        # Expose the same attribute path as the real client
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def _error_response(self, status_code: int, headers: Optional[Dict] = None) -> httpx.Response:
+        request = httpx.Request('POST', f'{self.endpoint}/chat/completions')
+        return httpx.Response(status_code, headers=headers or {}, request=request)
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            return max(0.0, self.latency + self._random.uniform(-self.latency_jitter, self.latency_jitter))
+
+    def create(self, model: str, messages, max_tokens: int = 2000, **kwargs):
+        """Return a completion shaped like ``openai`` ChatCompletion objects."""
+        if kwargs.get('stream'):
+            return self._stream(model, messages, self._delay(), self._include_usage(kwargs))
+        time.sleep(self._delay())
+        return self._complete(model, messages)
+
+    @staticmethod
+    def _include_usage(kwargs) -> bool:
+        stream_options = kwargs.get('stream_options') or (kwargs.get('extra_body') or {}).get('stream_options') or {}
+        return bool(stream_options.get('include_usage'))
+
+    def _stream_chunks(self, model: str, messages, include_usage: bool):
+        """The completion split into ``ChatCompletionChunk``-shaped objects."""
+        response = self._complete(model, messages)
+        text = response.choices[0].message.content
+        chunks = [
+            SimpleNamespace(model=model, usage=None, choices=[
+                SimpleNamespace(index=0, finish_reason=None,
+                                delta=SimpleNamespace(content=text[i:i + STREAM_CHUNK_CHARS]))
+            ])
+            for i in range(0, len(text), STREAM_CHUNK_CHARS)
+        ]
+        chunks[-1].choices[0].finish_reason = 'stop'
+        if include_usage:
+            chunks.append(SimpleNamespace(model=model, usage=response.usage, choices=[]))
+        return chunks
+
+    def _stream(self, model: str, messages, delay: float, include_usage: bool):
+        # Errors are raised by the create call, before any chunk, as with the real client
+        time.sleep(delay * STREAM_FIRST_CHUNK_FRACTION)
+        chunks = self._stream_chunks(model, messages, include_usage)
+
+        def generate():
+            interval = delay * (1 - STREAM_FIRST_CHUNK_FRACTION) / len(chunks)
+            for chunk in chunks:
+                yield chunk
+                time.sleep(interval)
+        return generate()
+
+    def _complete(self, model: str, messages):
+        """Produce the completion (or injected error) once the latency has elapsed."""
+        if self._draw() < self.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            raise openai.RateLimitError(
+                'Rate limit exceeded (fake)',
+                response=self._error_response(429, {'retry-after': str(self.retry_after)}),
+                body=None
+            )
+        if self._draw() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise openai.InternalServerError(
+                'Internal server error (fake)', response=self._error_response(500), body=None
+            )
+
+        content = messages[-1]['content']
+        if isinstance(content, str):
+            text = 'Connection test successful (fake backend)'
+            image_count = 0
+        else:
+            text = json.dumps(self._fake_result(content), ensure_ascii=False)
+            image_count = sum(1 for part in content if part.get('type') == 'image_url')
+
+        prompt_tokens = 200 + 85 * image_count
+        completion_tokens = max(1, len(text) // 4)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason='stop',
+                                     message=SimpleNamespace(role='assistant', content=text))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens)
+        )
+
+    def _fake_result(self, content) -> Dict[str, Any]:
+        """Build a result following the analysis prompt's JSON schema."""
+        timestamps = [
+            float(match.group(1))
+            for part in content if part.get('type') == 'text'
+            for match in [TIMESTAMP_PATTERN.search(part['text'])] if match
+        ]
+        has_anomaly = bool(timestamps) and self._draw() < self.anomaly_rate
+
+        if not has_anomaly:
+            return {
+                'has_anomaly': False,
+                'confidence_score': 0.9,
+                'anomaly_type': 'No anomaly detected',
+                'severity': 'low',
+                'detected_frames': [],
+                'timestamps': [],
+                'description': 'No anomalous activity observed (fake backend).',
+                'evidence': 'Synthetic result',
+                'recommendations': 'No special recommendations',
+                'false_positive_risk': 0.1
+            }
+
+        with self._lock:
+            start = self._random.randrange(len(timestamps))
+            count = self._random.randint(1, min(3, len(timestamps) - start))
+            severity = self._random.choice(['low', 'medium', 'high'])
+            confidence = round(self._random.uniform(0.5, 0.99), 2)
+        positions = list(range(start + 1, start + count + 1))
+        return {
+            'has_anomaly': True,
+            'confidence_score': confidence,
+            'anomaly_type': 'Synthetic anomaly',
+            'severity': severity,
+            'detected_frames': positions,
+            'timestamps': [timestamps[p - 1] for p in positions],
+            'description': 'Synthetic anomaly generated by the fake backend.',
+            'evidence': 'Synthetic result',
+            'recommendations': 'None - fake backend',
+            'false_positive_risk': round(1 - confidence, 2)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {'calls': self.calls, 'errors': self.errors, 'throttled': self.throttled}
+
+
+class AsyncFakeChatClient(FakeChatClient):
+    """Asyncio variant of ``FakeChatClient`` mimicking ``AsyncAzureOpenAI``."""
+
+    async def create(self, model: str, messages, max_tokens: int = 2000, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._complete(model, messages)
+
+    async def close(self):
+        """Nothing to release; mirrors ``AsyncAzureOpenAI.close``."""
+
+
+def fake_deployments(client_class=FakeChatClient) -> List[Deployment]:
+    """
+    Deployments listed in FAKE_ANALYZER_DEPLOYMENTS (same format as AZURE_OPENAI_DEPLOYMENTS).
+
+    Entries may set ``latency``, ``latency_jitter``, ``error_rate``,
+    ``throttle_rate`` and ``retry_after`` for their fake endpoint; unset
+    values come from the FAKE_ANALYZER_* variables.
+    """
+    configs = load_deployment_configs('FAKE_ANALYZER_DEPLOYMENTS', require_api_key=False,
+                                      default_deployment=os.environ.get('FAKE_ANALYZER_DEPLOYMENT_NAME', 'fake-gpt-4o'))
+    return [
+        Deployment(config['name'], config['endpoint'], config['deployment'],
+                   client_class(latency=config.get('latency'), latency_jitter=config.get('latency_jitter'),
+                                error_rate=config.get('error_rate'), throttle_rate=config.get('throttle_rate'),
+                                retry_after=config.get('retry_after'), endpoint=config['endpoint']),
+                   weight=config['weight'])
+        for config in configs
+    ]
+
+
+class FakeVideoAnalyzer(AzureAIVideoAnalyzer):
+    """``AzureAIVideoAnalyzer`` wired to ``FakeChatClient`` instead of Azure OpenAI."""
+
+    backend = 'fake'
+
+    def __init__(self, client: Optional[FakeChatClient] = None):
+        self.api_key = None
+        self.endpoint = client.endpoint if client is not None else 'fake://local'
+        self.api_version = 'fake'
+        self.deployment_name = os.environ.get('FAKE_ANALYZER_DEPLOYMENT_NAME', 'fake-gpt-4o')
+        self.tenant_id = None
+        self.client_id = None
+        self.client_secret = None
+        self.deployments = []
+        self.deployment_pool = None
+        deployments = fake_deployments() if client is None else []
+        if deployments:
+            self.deployment_pool = DeploymentPool(deployments)
+            self.endpoint = self.deployment_pool.endpoints
+        self.fake_client = self.deployment_pool or client or FakeChatClient()
+        # Wrapped like the real client so throttling behaviour can be load tested
+        self.client = ResilientChatClient.from_env(self.fake_client)
+
+    def _api_version_at_least(self, version: str) -> bool:
+        # The fake supports every request feature (structured outputs, stream usage)
+        return True
+
+
+class AsyncFakeVideoAnalyzer(AsyncAzureAIVideoAnalyzer):
+    """``AsyncAzureAIVideoAnalyzer`` wired to ``AsyncFakeChatClient`` instead of Azure OpenAI."""
+
+    backend = 'fake'
+
+    def __init__(self, client: Optional[AsyncFakeChatClient] = None,
+                 max_concurrent_calls: int = ASYNC_MAX_CONCURRENT_CALLS):
+        self.max_concurrent_calls = max_concurrent_calls
+        self._semaphore = None
+        self.api_key = None
+        self.endpoint = client.endpoint if client is not None else 'fake://local'
+        self.api_version = 'fake'
+        self.deployment_name = os.environ.get('FAKE_ANALYZER_DEPLOYMENT_NAME', 'fake-gpt-4o')
+        self.tenant_id = None
+        self.client_id = None
+        self.client_secret = None
+        self.deployments = []
+        self.deployment_pool = None
+        deployments = fake_deployments(AsyncFakeChatClient) if client is None else []
+        if deployments:
+            self.deployment_pool = AsyncDeploymentPool(
+                deployments, max_retries=int(os.environ.get('AZURE_OPENAI_MAX_RETRIES', 5)))
+            self.endpoint = self.deployment_pool.endpoints
+        self.client = self.deployment_pool or client or AsyncFakeChatClient()
+
+    def _api_version_at_least(self, version: str) -> bool:
+        return True
@@ -0,0 +1,86 @@
+"""
+Frame sampling engine for video anomaly detection.
+
+Only the frames selected for analysis are read from the decoder: long gaps
+between sample points are crossed with a container seek, short gaps by
+stepping the decoder without converting frames, and containers that cannot
+seek accurately fall back to a sequential pass. The decoder backends live
+in ``decoders``.
+"""
+import logging
+from typing import List, Dict, Any, Tuple, Optional, Callable
+
+from decoders import open_frame_reader, DEFAULT_SEEK_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+def compute_sample_indices(total_frames: int, max_frames: int) -> List[int]:
+    """
+    Compute the frame indices to sample, evenly spaced over the video.
+
+    Mirrors the original ``frame_count % frame_interval`` sampling so results
+    stay comparable. When the container does not report a frame count the
+    first ``max_frames`` frames are used.
+    """
+    if max_frames <= 0:
+        return []
+    if total_frames <= 0:
+        return list(range(max_frames))
+    if total_frames <= max_frames:
+        return list(range(total_frames))
+
+    frame_interval = total_frames // max_frames
+    return [i * frame_interval for i in range(max_frames)]
+
+
+def read_video_properties(video_path: str, backend: Optional[str] = None) -> Dict[str, Any]:
+    """Read frame count, frame rate, duration and frame size from the container without decoding."""
+    reader = open_frame_reader(video_path, backend=backend)
+    try:
+        return dict(reader.properties)
+    finally:
+        reader.release()
+
+
+def sample_frames(video_path: str, max_frames: int = 10,
+                  seek_threshold: int = DEFAULT_SEEK_THRESHOLD,
+                  allow_seek: bool = True,
+                  transform: Optional[Callable[[int, Any], Any]] = None,
+                  backend: Optional[str] = None,
+                  threads: Optional[int] = None,
+                  max_dimension: Optional[int] = None
+                  ) -> Tuple[List[Tuple[int, Any]], Dict[str, Any], Dict[str, Any]]:
+    """
+    Decode the evenly spaced sample frames of a video.
+
+    Args:
+        video_path: Path to the video file
+        max_frames: Maximum number of frames to return
+        seek_threshold: Gaps larger than this are crossed with a seek
+        allow_seek: Set False to force the sequential strategy
+        transform: Optional ``transform(frame_index, frame)`` applied to each
+            frame as soon as it is decoded, so the raw frame can be released
+            (e.g. encoded) before the next one is read
+        backend: Decoder backend (``auto``, ``opencv`` or ``pyav``; default DECODER_BACKEND)
+        threads: FFmpeg decoding threads (default DECODE_THREADS)
+        max_dimension: Scale frames down to fit this size while decoding, where the backend can
+
+    Returns:
+        Tuple of (list of (frame_index, BGR ndarray or transformed frame), video properties, sampling stats)
+    """
+    reader = open_frame_reader(video_path, backend=backend, seek_threshold=seek_threshold, allow_seek=allow_seek,
+                               threads=threads, max_dimension=max_dimension)
+    try:
+        properties = dict(reader.properties)
+
+        sampled = []
+        for index in compute_sample_indices(properties['total_frames'], max_frames):
+            frame = reader.read_at(index)
+            if frame is None:
+                break
+            sampled.append((index, transform(index, frame) if transform is not None else frame))
+
+        return sampled, properties, dict(reader.stats)
+    finally:
+        reader.release()
@@ -0,0 +1,236 @@
+"""
+Persistent store of sampled, encoded frames.
+
+Re-analysing a known video with a different prompt needs exactly the same
+frames, so they are kept on disk keyed on the video's content hash and the
+sampling settings. Each entry is a JPEG pack (the frames' bytes
+concatenated) plus a JSON index with every frame's offset, length, number,
+timestamp and detail, and the extraction's window count and video info.
+Packs are read through a memory map, and recently used entries are also
+held in memory, so a stored video skips decoding entirely.
+
+Demo videos use the store by default (``FRAME_STORE=demo``) and are warmed
+at startup; ``FRAME_STORE=all`` stores uploaded videos too. The directory
+can be shared by several worker processes.
+"""
+import os
+import json
+import mmap
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from frame_encoding import EncodedFrame
+from result_cache import eviction_target
+from video_pipeline import is_video_file, extract_frames_for_request
+from video_probe import check_video, VideoRejectedError
+
+logger = logging.getLogger(__name__)
+
+FRAME_STORE_SCOPES = ('demo', 'all', 'off')
+
+PACK_SUFFIX = '.frames'
+INDEX_SUFFIX = '.json'
+
+
+def build_store_key(file_hash: str, sampling: Dict[str, Any]) -> str:
+    """Key of a video's frames for one set of sampling settings."""
+    material = json.dumps({'video': file_hash, 'sampling': sampling}, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class FrameStore:
+    """
+    Disk-backed frame store with a small in-memory LRU in front.
+
+    Index files are written after their pack, so an index on disk always
+    refers to a complete pack. Index modification times track recency for
+    eviction, and a running entry count decides when to scan for it, as in
+    ``DiskResultCache``.
+    """
+
+    def __init__(self, directory: str, scope: str = 'demo', max_entries: int = 256, memory_entries: int = 16):
+        self.directory = directory
+        self.scope = scope
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._entries = self._count_entries()
+
+    def applies_to(self, is_demo: bool) -> bool:
+        """Whether videos of this kind are stored."""
+        return self.scope == 'all' or (self.scope == 'demo' and is_demo)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def _count_entries(self) -> int:
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(INDEX_SUFFIX))
+
+    def _remember(self, key: str, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Tuple[int, List[EncodedFrame], Dict[str, Any]]]:
+        index_path = self._path(key, INDEX_SUFFIX)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            frames = []
+            with open(self._path(key, PACK_SUFFIX), 'rb') as f:
+                if index['frames']:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pack:
+                        frames = [EncodedFrame(entry['frame_number'], entry['timestamp'],
+                                               pack[entry['offset']:entry['offset'] + entry['length']],
+                                               entry['detail'])
+                                  for entry in index['frames']]
+            os.utime(index_path)
+            return index['window_count'], frames, index['video_info']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable frame store entry {key}: {e}")
+            self._remove(key)
+            return None
+
+    def get(self, key: str) -> Optional[Tuple[int, List[EncodedFrame], Dict[str, Any]]]:
+        """
+        Return the stored (window count, frames, video info) for ``key``, or None.
+
+        The frames are shared between callers and must not be modified; the
+        video info is a copy.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        window_count, frames, video_info = entry
+        return window_count, list(frames), json.loads(json.dumps(video_info))
+
+    def put(self, key: str, window_count: int, frames: List[EncodedFrame], video_info: Dict[str, Any]):
+        """Store the frames extracted for ``key``. ``video_info`` must not hold stage timings."""
+        index = {'window_count': window_count, 'video_info': video_info, 'frames': []}
+        pack_path = self._path(key, PACK_SUFFIX)
+        index_path = self._path(key, INDEX_SUFFIX)
+        tmp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        offset = 0
+        with open(pack_path + tmp_suffix, 'wb') as f:
+            for frame in frames:
+                f.write(frame.jpeg)
+                index['frames'].append({'frame_number': frame.frame_number, 'timestamp': frame.timestamp,
+                                        'detail': frame.detail, 'offset': offset, 'length': len(frame.jpeg)})
+                offset += len(frame.jpeg)
+        with open(index_path + tmp_suffix, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        is_new = not os.path.exists(index_path)
+        os.replace(pack_path + tmp_suffix, pack_path)
+        os.replace(index_path + tmp_suffix, index_path)
+        self._remember(key, (window_count, list(frames), json.loads(json.dumps(video_info))))
+        if not is_new:
+            return
+        with self._lock:
+            self._entries += 1
+            over_limit = self._entries > self.max_entries
+        if over_limit:
+            self._evict()
+
+    def _remove(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        for suffix in (INDEX_SUFFIX, PACK_SUFFIX):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Remove the least recently used entries down to ``eviction_target`` and resync the count."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(INDEX_SUFFIX):
+                continue
+            try:
+                entries.append((os.path.getmtime(os.path.join(self.directory, name)), name[:-len(INDEX_SUFFIX)]))
+            except OSError:
+                continue
+        if len(entries) > self.max_entries:
+            entries.sort()
+            excess = len(entries) - eviction_target(self.max_entries)
+            for _, key in entries[:excess]:
+                self._remove(key)
+            entries = entries[excess:]
+        with self._lock:
+            self._entries = len(entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            memory_entries = len(self._memory)
+        return {
+            'scope': self.scope,
+            'entries': self._count_entries(),
+            'memory_entries': memory_entries,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def create_frame_store() -> Optional[FrameStore]:
+    """Create the frame store selected by FRAME_STORE (demo, all or off)."""
+    scope = os.environ.get('FRAME_STORE', 'demo').lower()
+    if scope not in FRAME_STORE_SCOPES:
+        logger.warning(f"Unknown FRAME_STORE '{scope}', storing demo video frames only")
+        scope = 'demo'
+    if scope == 'off':
+        return None
+    directory = os.environ.get('FRAME_STORE_DIR', os.path.join('uploads', '.frame-store'))
+    max_entries = int(os.environ.get('FRAME_STORE_MAX_ENTRIES', 256))
+    memory_entries = int(os.environ.get('FRAME_STORE_MEMORY_ENTRIES', 16))
+    logger.info(f"Using frame store at {directory} for {scope} videos")
+    return FrameStore(directory, scope=scope, max_entries=max_entries, memory_entries=memory_entries)
+
+
+def warm_frame_store(store: FrameStore, directory: str, file_hashes, settings: Dict[str, Any]) -> int:
+    """
+    Extract and store the frames of every video in ``directory`` not yet in the store.
+
+    Returns:
+        Number of videos whose frames are in the store afterwards
+    """
+    if not os.path.isdir(directory):
+        return 0
+    stored = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not is_video_file(name) or not os.path.isfile(path):
+            continue
+        try:
+            file_hash = file_hashes.hash(path)
+            key = build_store_key(file_hash, settings)
+            if store.get(key) is None:
+                window_count, frames, video_info = extract_frames_for_request(path, settings,
+                                                                              check_video(path, file_hash))
+                video_info.pop('timings', None)
+                store.put(key, window_count, frames, video_info)
+            stored += 1
+        except (VideoRejectedError, ValueError, OSError) as e:
+            logger.warning(f"Could not store frames of {path}: {e}")
+    logger.info(f"Frame store holds {stored} videos from {directory}")
+    return stored
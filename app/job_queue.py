@@ -0,0 +1,315 @@
+"""
+Asynchronous analysis jobs for video anomaly detection.
+
+Submitting a job returns its id immediately; a bounded worker pool runs the
+analysis and records status, progress and the final result in a pluggable
+job store (in-memory or SQLite).
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+FINISHED_STATUSES = {STATUS_SUCCEEDED, STATUS_FAILED}
+
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class JobStore:
+    """Base class for job state storage."""
+
+    def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resources held by the store."""
+
+
+class InMemoryJobStore(JobStore):
+    """Process-local job store; state is lost when the worker restarts."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job['job_id']] = dict(job)
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+
+class SQLiteJobStore(JobStore):
+    """SQLite-backed job store shared by all workers using the same database file."""
+
+    COLUMNS = ('job_id', 'kind', 'status', 'stage', 'progress', 'created_at', 'started_at',
+               'finished_at', 'updated_at', 'status_code', 'result', 'error', 'metadata')
+    JSON_COLUMNS = {'result', 'metadata'}
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            # WAL is a property of the database file, so it only needs setting once
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL,
+                    status_code INTEGER,
+                    result TEXT,
+                    error TEXT,
+                    metadata TEXT
+                )
+            """)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection for one transaction, committed and closed on exit."""
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    def _encode(self, column, value):
+        if column in self.JSON_COLUMNS and value is not None:
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def create(self, job: Dict[str, Any]) -> None:
+        columns = [c for c in self.COLUMNS if c in job]
+        placeholders = ', '.join('?' for _ in columns)
+        values = [self._encode(c, job[c]) for c in columns]
+        with self._connect() as conn:
+            conn.execute(f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({placeholders})", values)
+
+    def update(self, job_id: str, **fields) -> None:
+        columns = [c for c in fields if c in self.COLUMNS and c != 'job_id']
+        if not columns:
+            return
+        assignments = ', '.join(f'{c} = ?' for c in columns)
+        values = [self._encode(c, fields[c]) for c in columns] + [job_id]
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", values)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        for column in self.JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+
+def create_job_store() -> JobStore:
+    """Create the job store selected by JOB_STORE_BACKEND (memory or sqlite)."""
+    backend = (os.environ.get('JOB_STORE_BACKEND') or 'memory').lower()
+    if backend == 'sqlite':
+        path = os.environ.get('JOB_STORE_PATH', os.path.join('uploads', 'jobs.sqlite3'))
+        logger.info(f"Using SQLite job store at {path}")
+        return SQLiteJobStore(path)
+    if backend != 'memory':
+        logger.warning(f"Unknown JOB_STORE_BACKEND '{backend}', using in-memory job store")
+    return InMemoryJobStore()
+
+
+class JobManager:
+    """Runs analysis jobs on a bounded worker pool and tracks their state."""
+
+    def __init__(self, store: JobStore, max_workers: int = 2, max_pending: int = 20,
+                 stale_after: float = 3600):
+        """
+        Args:
+            store: Job state storage backend
+            max_workers: Number of jobs analysed concurrently
+            max_pending: Maximum queued plus running jobs before submissions are rejected
+            stale_after: Seconds without an update after which an unfinished job
+                is reported as interrupted (e.g. its worker was restarted)
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self._executor = None
+        self._pending = 0
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created lazily so that forked server workers each start their own threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='analysis-job')
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs queued or running in this process."""
+        return self._pending
+
+    def submit(self, func: Callable, *args, kind: str = 'analysis',
+               metadata: Optional[Dict] = None, cleanup_path: Optional[str] = None, **kwargs) -> str:
+        """
+        Queue ``func(*args, progress_callback=..., **kwargs)`` and return the job id.
+
+        ``func`` must return a ``(result, status_code)`` tuple. ``cleanup_path``
+        is a file ``func`` removes when it runs (e.g. the upload); it is
+        removed here instead if the job is cancelled before it starts.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError(f"Job queue is full ({self.max_pending} jobs pending)")
+            self._pending += 1
+            executor = self._get_executor()
+
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self.store.create({
+            'job_id': job_id,
+            'kind': kind,
+            'status': STATUS_QUEUED,
+            'stage': STATUS_QUEUED,
+            'progress': 0.0,
+            'created_at': now,
+            'updated_at': now,
+            'metadata': metadata or {}
+        })
+
+        try:
+            future = executor.submit(self._run, job_id, func, args, kwargs)
+            self._queued[job_id] = (future, cleanup_path)
+            future.add_done_callback(lambda _, job_id=job_id: self._queued.pop(job_id, None))
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self.store.update(job_id, status=STATUS_FAILED, error='Failed to schedule job',
+                              finished_at=time.time(), updated_at=time.time())
+            raise
+        return job_id
+
+    def _run(self, job_id: str, func: Callable, args, kwargs):
+        now = time.time()
+        self.store.update(job_id, status=STATUS_RUNNING, started_at=now, updated_at=now)
+
+        def progress_callback(stage: str, progress: float):
+            self.store.update(job_id, stage=stage, progress=round(progress, 3), updated_at=time.time())
+
+        try:
+            result, status_code = func(*args, progress_callback=progress_callback, **kwargs)
+            status = STATUS_SUCCEEDED if status_code < 400 else STATUS_FAILED
+            now = time.time()
+            self.store.update(job_id, status=status, stage='completed', progress=1.0,
+                              result=result, status_code=status_code,
+                              error=result.get('error') if isinstance(result, dict) else None,
+                              finished_at=now, updated_at=now)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            now = time.time()
+            self.store.update(job_id, status=STATUS_FAILED, stage='failed', error=str(e),
+                              status_code=500, finished_at=now, updated_at=now)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job record, marking unfinished jobs with no recent updates as interrupted."""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job['status'] not in FINISHED_STATUSES and self.stale_after:
+            if time.time() - (job.get('updated_at') or job.get('created_at') or 0) > self.stale_after:
+                now = time.time()
+                fields = {'status': STATUS_FAILED, 'stage': 'interrupted', 'status_code': 500,
+                          'error': 'Job was interrupted before completion', 'finished_at': now}
+                self.store.update(job_id, **fields)
+                job.update(fields)
+        return job
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        """
+        Stop accepting work and optionally wait for in-flight jobs.
+
+        With ``cancel_pending``, jobs that have not started yet are marked as
+        interrupted instead of being run before the process exits.
+        """
+        if self._executor is not None:
+            if cancel_pending:
+                for job_id, (future, cleanup_path) in list(self._queued.items()):
+                    if future.cancel():
+                        with self._lock:
+                            self._pending -= 1
+                        if cleanup_path and os.path.exists(cleanup_path):
+                            os.remove(cleanup_path)
+                        now = time.time()
+                        self.store.update(job_id, status=STATUS_FAILED, stage='interrupted', status_code=503,
+                                          error='Server shut down before the job started',
+                                          finished_at=now, updated_at=now)
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self.store.close()
+
+
+def create_job_manager() -> JobManager:
+    """Create a job manager configured from environment variables."""
+    return JobManager(
+        create_job_store(),
+        max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+        max_pending=int(os.environ.get('JOB_MAX_PENDING', 20)),
+        stale_after=float(os.environ.get('JOB_STALE_SECONDS', 3600))
+    )
+
+
+def job_status_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public status representation of a job (without the result payload)."""
+    return {
+        'job_id': job['job_id'],
+        'kind': job.get('kind'),
+        'status': job['status'],
+        'stage': job.get('stage'),
+        'progress': job.get('progress'),
+        'created_at': job.get('created_at'),
+        'started_at': job.get('started_at'),
+        'finished_at': job.get('finished_at'),
+        'error': job.get('error')
+    }
@@ -0,0 +1,248 @@
+"""
+Long-video analysis mode.
+
+A single model request is limited to ``FRAMES_PER_WINDOW`` frames, so long
+recordings are split into consecutive timeline windows. Each window is
+analysed as its own request, with a bounded number in flight, and the
+per-window results are merged into one analysis result.
+"""
+import os
+import math
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+
+from frame_encoding import EncodedFrame
+
+logger = logging.getLogger(__name__)
+
+# Frames sent per model request (matches the analyzer's per-request cap)
+FRAMES_PER_WINDOW = 10
+
+LONG_VIDEO_WINDOW_SECONDS = float(os.environ.get('LONG_VIDEO_WINDOW_SECONDS', 60))
+LONG_VIDEO_MAX_WINDOWS = int(os.environ.get('LONG_VIDEO_MAX_WINDOWS', 24))
+LONG_VIDEO_CONCURRENCY = int(os.environ.get('LONG_VIDEO_CONCURRENCY', 4))
+
+SEVERITY_RANK = {'low': 1, 'medium': 2, 'high': 3}
+
+
+def plan_window_count(duration: float, window_seconds: float = LONG_VIDEO_WINDOW_SECONDS,
+                      max_windows: int = LONG_VIDEO_MAX_WINDOWS) -> int:
+    """Number of timeline windows for a video of ``duration`` seconds."""
+    if duration <= 0 or window_seconds <= 0:
+        return 1
+    return max(1, min(max_windows, math.ceil(duration / window_seconds)))
+
+
+def split_windows(frames: List[EncodedFrame], window_count: int) -> List[List[EncodedFrame]]:
+    """Split time-ordered frames into ``window_count`` consecutive, near-equal windows."""
+    window_count = max(1, min(window_count, len(frames)))
+    size, remainder = divmod(len(frames), window_count)
+    windows = []
+    start = 0
+    for i in range(window_count):
+        end = start + size + (1 if i < remainder else 0)
+        windows.append(frames[start:end])
+        start = end
+    return windows
+
+
+def _severity_rank(result: Dict) -> int:
+    return SEVERITY_RANK.get(str(result.get('severity', '')).lower(), 0)
+
+
+def _global_frame_positions(detected_frames: List, offset: int, window_size: int) -> List:
+    """
+    Map detected frame positions inside a window to positions in the full sequence.
+
+    The prompt labels images "Frame i/N", so values within 1..N are treated as
+    window positions; anything else is passed through unchanged.
+    """
+    positions = []
+    for value in detected_frames:
+        if isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= window_size:
+            positions.append(offset + value)
+        else:
+            positions.append(value)
+    return positions
+
+
+def merge_window_results(window_results: List[Dict], windows: List[List[EncodedFrame]]) -> Dict[str, Any]:
+    """
+    Merge per-window analysis results into one result.
+
+    ``detected_frames`` and ``timestamps`` are unified across windows, the
+    anomaly type and severity come from the most severe anomalous window,
+    and the confidence is the highest confidence among anomalous windows
+    (or the mean confidence when no window found an anomaly).
+    """
+    succeeded = []
+    failed = []
+    offset = 0
+    window_summaries = []
+    detected_frames = []
+    timestamps = []
+
+    for index, (result, window) in enumerate(zip(window_results, windows)):
+        start_time = window[0].timestamp if window else 0
+        end_time = window[-1].timestamp if window else 0
+        summary = {
+            'window': index + 1,
+            'start_time': start_time,
+            'end_time': end_time,
+            'frames': len(window)
+        }
+
+        if 'error' in result:
+            summary['error'] = result['error']
+            failed.append(index + 1)
+        else:
+            succeeded.append(result)
+            summary.update({
+                'has_anomaly': result.get('has_anomaly', False),
+                'confidence_score': result.get('confidence_score', 0.0),
+                'severity': result.get('severity'),
+                'anomaly_type': result.get('anomaly_type')
+            })
+            if result.get('has_anomaly'):
+                detected_frames.extend(_global_frame_positions(result.get('detected_frames', []), offset, len(window)))
+                timestamps.extend(result.get('timestamps', []))
+
+        window_summaries.append(summary)
+        offset += len(window)
+
+    if not succeeded:
+        errors = '; '.join(str(r.get('error')) for r in window_results)
+        merged = dict(window_results[0]) if window_results else {}
+        merged['error'] = f'All {len(window_results)} windows failed: {errors}'
+        merged['windows'] = window_summaries
+        return merged
+
+    anomalous = [r for r in succeeded if r.get('has_anomaly')]
+    if anomalous:
+        primary = max(anomalous, key=lambda r: (_severity_rank(r), r.get('confidence_score', 0.0)))
+        confidence = max(r.get('confidence_score', 0.0) for r in anomalous)
+        description = '\n'.join(
+            f"[{s['start_time']:.1f}s-{s['end_time']:.1f}s] {r.get('description', '')}"
+            for s, r in zip(window_summaries, window_results)
+            if 'error' not in r and r.get('has_anomaly')
+        )
+    else:
+        primary = max(succeeded, key=lambda r: r.get('confidence_score', 0.0))
+        confidence = sum(r.get('confidence_score', 0.0) for r in succeeded) / len(succeeded)
+        description = primary.get('description', 'Analysis completed')
+
+    merged = dict(primary)
+    merged.update({
+        'has_anomaly': bool(anomalous),
+        'confidence_score': confidence,
+        'anomaly_type': primary.get('anomaly_type'),
+        'severity': primary.get('severity'),
+        'detected_frames': detected_frames,
+        'timestamps': sorted(timestamps, key=lambda t: t if isinstance(t, (int, float)) else 0),
+        'description': description,
+        'windows': window_summaries
+    })
+    if failed:
+        merged['failed_windows'] = failed
+
+    merged['analysis_metadata'] = {
+        'mode': 'long_video',
+        'windows': len(windows),
+        'failed_windows': len(failed),
+        'frames_analyzed': sum(
+            r.get('analysis_metadata', {}).get('frames_analyzed', 0) for r in succeeded
+        ),
+        'model_used': primary.get('analysis_metadata', {}).get('model_used'),
+        'api_version': primary.get('analysis_metadata', {}).get('api_version')
+    }
+    # Stage timings and token usage are totals over all windows
+    timings = {}
+    usage = {}
+    for result in succeeded:
+        metadata = result.get('analysis_metadata', {})
+        for stage, seconds in (metadata.get('timings') or {}).items():
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+        for key, count in (metadata.get('usage') or {}).items():
+            usage[key] = usage.get(key, 0) + (count or 0)
+    if timings:
+        merged['analysis_metadata']['timings'] = timings
+    if usage:
+        merged['analysis_metadata']['usage'] = usage
+    return merged
+
+
+def _window_info(video_info: Dict, window: List[EncodedFrame]) -> Dict:
+    """Per-window copy of ``video_info``; the activity verdict was already applied to the whole video."""
+    window_info = {key: value for key, value in video_info.items() if key != 'activity'}
+    window_info['extracted_frames'] = len(window)
+    return window_info
+
+
+def analyze_long_video(analyzer, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict,
+                       window_count: int, max_concurrency: int = LONG_VIDEO_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Analyse frames window by window with at most ``max_concurrency`` requests in flight.
+
+    Args:
+        analyzer: Analyzer providing ``analyze_frames``
+        frames: Time-ordered frames covering the whole video
+        anomaly_prompt: User-specified anomaly types to detect
+        video_info: Video metadata information
+        window_count: Number of windows to split the frames into
+        max_concurrency: Maximum concurrent model requests
+
+    Returns:
+        Merged analysis result
+    """
+    # The activity verdict covers the whole video: check it once per request, not per window
+    skipped = analyzer.prefilter_result(frames, video_info)
+    if skipped:
+        return skipped
+
+    windows = split_windows(frames, window_count)
+    logger.info(f"Analyzing {len(frames)} frames in {len(windows)} windows "
+                f"(concurrency {max_concurrency})")
+
+    def analyze_window(window):
+        window_info = _window_info(video_info, window)
+        try:
+            return analyzer.analyze_frames(window, anomaly_prompt, window_info)
+        except Exception as e:
+            logger.error(f"Window analysis failed: {e}")
+            return {'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(windows))),
+                            thread_name_prefix='long-video-window') as executor:
+        window_results = list(executor.map(analyze_window, windows))
+
+    merged = merge_window_results(window_results, windows)
+    merged.setdefault('analysis_metadata', {})['concurrency'] = max_concurrency
+    return merged
+
+
+async def analyze_long_video_async(analyzer, frames: List[EncodedFrame], anomaly_prompt: str, video_info: Dict,
+                                   window_count: int,
+                                   max_concurrency: int = LONG_VIDEO_CONCURRENCY) -> Dict[str, Any]:
+    """Asyncio counterpart of ``analyze_long_video`` for analyzers with ``analyze_frames_async``."""
+    skipped = analyzer.prefilter_result(frames, video_info)
+    if skipped:
+        return skipped
+
+    windows = split_windows(frames, window_count)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def analyze_window(window):
+        window_info = _window_info(video_info, window)
+        async with semaphore:
+            try:
+                return await analyzer.analyze_frames_async(window, anomaly_prompt, window_info)
+            except Exception as e:
+                logger.error(f"Window analysis failed: {e}")
+                return {'error': str(e)}
+
+    window_results = await asyncio.gather(*(analyze_window(window) for window in windows))
+    merged = merge_window_results(list(window_results), windows)
+    merged.setdefault('analysis_metadata', {})['concurrency'] = max_concurrency
+    return merged
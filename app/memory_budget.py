@@ -0,0 +1,106 @@
+"""
+Per-process memory budget for video decoding.
+
+Decoded frames are large (a 1080p BGR frame is about 6 MB) and motion
+sampling holds several candidates per kept frame, so a burst of concurrent
+requests on large videos can exhaust memory. Each decode reserves its
+estimated peak before it starts and waits while the process's budget is
+spent. A single decode larger than the whole budget is refused; callers
+shrink the work (e.g. hold fewer motion candidates) until it fits.
+"""
+import os
+import logging
+import threading
+import contextlib
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Memory available to concurrent decodes in one process (0 disables the limit)
+DECODE_MEMORY_BUDGET_MB = int(os.environ.get('DECODE_MEMORY_BUDGET_MB', 1024))
+
+# Frames the decoder keeps internally (reference frames and conversion buffers)
+DECODER_OVERHEAD_FRAMES = 4
+
+
+def estimate_decode_bytes(width: int, height: int, frames_held: int, held_size: Optional[Tuple[int, int]] = None,
+                          threads: int = 1) -> int:
+    """
+    Estimated peak memory of a decode that holds ``frames_held`` raw BGR frames at once.
+
+    The decoder's own buffers are full-resolution YUV 4:2:0 frames, one more
+    per decoding thread; held frames are ``held_size`` when they are scaled
+    while decoding.
+    """
+    width, height = max(1, width), max(1, height)
+    held_width, held_height = held_size or (width, height)
+    decoder_bytes = width * height * 3 // 2 * (DECODER_OVERHEAD_FRAMES + max(1, threads))
+    return decoder_bytes + max(1, held_width) * max(1, held_height) * 3 * frames_held
+
+
+class MemoryBudgetExceededError(ValueError):
+    """Raised when one reservation is larger than the whole budget."""
+
+
+class MemoryBudget:
+    """Counting limit on bytes reserved by concurrent work in this process."""
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.in_use = 0
+        self.peak = 0
+        self.waiting = 0
+        self.waits = 0
+        self._changed = threading.Condition()
+
+    def fits(self, nbytes: int) -> bool:
+        """Whether a reservation of ``nbytes`` can ever be granted."""
+        return self.limit_bytes <= 0 or nbytes <= self.limit_bytes
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes: int):
+        """
+        Hold ``nbytes`` of the budget for the enclosed block, waiting until it is available.
+
+        Raises:
+            MemoryBudgetExceededError: If ``nbytes`` is larger than the whole budget
+        """
+        if self.limit_bytes <= 0:
+            yield
+            return
+
+        if nbytes > self.limit_bytes:
+            raise MemoryBudgetExceededError(
+                f"Decoding this video needs about {nbytes / 2**20:.0f} MB, more than the "
+                f"{self.limit_bytes / 2**20:.0f} MB decode memory budget (DECODE_MEMORY_BUDGET_MB)")
+        with self._changed:
+            if self.in_use + nbytes > self.limit_bytes:
+                self.waits += 1
+                self.waiting += 1
+                logger.info(f"Waiting for {nbytes / 2**20:.0f} MB of decode memory "
+                            f"({self.in_use / 2**20:.0f} of {self.limit_bytes / 2**20:.0f} MB in use)")
+                try:
+                    self._changed.wait_for(lambda: self.in_use + nbytes <= self.limit_bytes)
+                finally:
+                    self.waiting -= 1
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield
+        finally:
+            with self._changed:
+                self.in_use -= nbytes
+                self._changed.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._changed:
+            return {
+                'budget_mb': round(self.limit_bytes / 2**20, 1) if self.limit_bytes > 0 else None,
+                'in_use_mb': round(self.in_use / 2**20, 1),
+                'peak_mb': round(self.peak / 2**20, 1),
+                'waiting': self.waiting,
+                'waits': self.waits
+            }
+
+
+decode_budget = MemoryBudget(DECODE_MEMORY_BUDGET_MB * 2**20)
@@ -0,0 +1,127 @@
+"""
+Prometheus metrics for the analysis pipeline.
+
+Requests are timed per stage (upload, probe, cache lookup, decode, selection,
+encoding, activity check, model call and response parsing), alongside
+frames decoded versus kept, image payload bytes, token usage from
+``response.usage``, model client error/throttle/retry counters, call
+outcomes per pooled deployment and the time until a request's anomaly
+verdict is known (streamed or buffered). The metrics are served in the
+Prometheus text format on ``/metrics``.
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+writable directory so samples from all workers are aggregated.
+"""
+import os
+import time
+import contextlib
+from typing import Dict, Optional
+
+from prometheus_client import (Counter, Histogram, CollectorRegistry, generate_latest, multiprocess,
+                               REGISTRY, CONTENT_TYPE_LATEST)
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6)
+
+STAGE_SECONDS = Histogram('video_analysis_stage_seconds', 'Time spent in each pipeline stage',
+                          ['stage'], buckets=STAGE_BUCKETS)
+REQUESTS = Counter('video_analysis_requests_total', 'Analysis requests by entry point and outcome',
+                   ['endpoint', 'outcome'])
+FRAMES = Counter('video_analysis_frames_total', 'Frames decoded from videos versus kept for analysis',
+                 ['kind'])
+PAYLOAD_BYTES = Histogram('video_analysis_payload_bytes', 'Base64 image bytes sent per model request',
+                          buckets=BYTES_BUCKETS)
+MODEL_CALLS = Counter('model_calls_total', 'Model calls by outcome (success, error, skipped)', ['outcome'])
+MODEL_TOKENS = Counter('model_tokens_total', 'Tokens reported in response.usage', ['type'])
+MODEL_CLIENT_EVENTS = Counter('model_client_events_total',
+                              'Model client events: upstream calls, throttled, retries, failures, coalesced, failovers',
+                              ['event'])
+MODEL_DEPLOYMENT_CALLS = Counter('model_deployment_calls_total',
+                                 'Model calls per pooled deployment by outcome (success, throttled, error)',
+                                 ['deployment', 'outcome'])
+
+FIRST_VERDICT_SECONDS = Histogram('video_analysis_first_verdict_seconds',
+                                  'Time from the start of an analysis until its has_anomaly verdict is known',
+                                  ['mode'], buckets=STAGE_BUCKETS)
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def observe_stage(stage: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+    """Record ``seconds`` for ``stage``, also adding it to a per-request ``timings`` dict."""
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+
+
+@contextlib.contextmanager
+def timed(stage: str, timings: Optional[Dict[str, float]] = None):
+    """Time the enclosed block as ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, timings)
+
+
+@contextlib.contextmanager
+def stage_timer(timings: Dict[str, float], stage: str):
+    """
+    Time the enclosed block into ``timings`` only.
+
+    Used where code may run in a decode worker process; the parent records
+    the collected timings with ``record_extraction``.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(timings.get(stage, 0.0) + time.perf_counter() - start, 4)
+
+
+def record_extraction(video_info: Dict, timings: Optional[Dict[str, float]] = None):
+    """
+    Record frame extraction stage timings and frame counts reported in ``video_info``.
+
+    The timings are removed from ``video_info`` (and added to ``timings``) so
+    they are not returned or cached with the video metadata.
+    """
+    for stage, seconds in (video_info.pop('timings', None) or {}).items():
+        observe_stage(stage, seconds, timings)
+    sampling = video_info.get('sampling') or {}
+    FRAMES.labels(kind='decoded').inc(sampling.get('frames_read', 0) + sampling.get('frames_grabbed', 0))
+    FRAMES.labels(kind='kept').inc(video_info.get('extracted_frames', 0))
+
+
+def pop_analysis_timings(analysis_result: Dict, timings: Optional[Dict[str, float]] = None):
+    """Move model call stage timings out of an analysis result's metadata into ``timings``."""
+    stages = (analysis_result.get('analysis_metadata') or {}).pop('timings', None) or {}
+    if timings is not None:
+        timings.update(stages)
+
+
+def record_usage(usage):
+    """Record token usage from a chat completion's ``usage`` (if the response has one)."""
+    if usage is None:
+        return
+    MODEL_TOKENS.labels(type='prompt').inc(getattr(usage, 'prompt_tokens', 0) or 0)
+    MODEL_TOKENS.labels(type='completion').inc(getattr(usage, 'completion_tokens', 0) or 0)
+
+
+def usage_dict(usage) -> Optional[Dict[str, int]]:
+    if usage is None:
+        return None
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'total_tokens': getattr(usage, 'total_tokens', None)
+    }
+
+
+def render_metrics() -> bytes:
+    """Render all metrics in the Prometheus text format, aggregating worker processes when configured."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
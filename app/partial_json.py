@@ -0,0 +1,85 @@
+"""
+Incremental parsing of a JSON object streamed in fragments.
+
+The model streams its analysis as one JSON object, token by token.
+``IncrementalObjectParser`` scans each fragment once and reports every
+top-level field as soon as its value is complete (the member is closed by
+a comma or the final brace), so e.g. ``has_anomaly`` is known long before
+the description has finished streaming. Text before the opening brace,
+such as a Markdown code fence, is skipped.
+"""
+import json
+from typing import Dict, Any
+
+
+class IncrementalObjectParser:
+    """Feeds on fragments of a JSON object and returns the top-level fields completed by each."""
+
+    def __init__(self):
+        self.fields = {}
+        self.complete = False
+        self._text = ''
+        self._position = 0
+        self._member_start = None  # Index after the '{' or ',' that opened the current member
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return self._text
+
+    def feed(self, fragment: str) -> Dict[str, Any]:
+        """
+        Add the next fragment of the stream.
+
+        Returns:
+            Top-level fields whose values were completed by this fragment
+        """
+        self._text += fragment
+        completed = {}
+        text = self._text
+        for index in range(self._position, len(text)):
+            if self.complete:
+                break
+            char = text[index]
+            if self._member_start is None:
+                if char == '{':
+                    self._member_start = index + 1
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._add_member(text[self._member_start:index], completed)
+                    self.complete = True
+            elif char == ',' and self._depth == 1:
+                self._add_member(text[self._member_start:index], completed)
+                self._member_start = index + 1
+        self._position = len(text)
+        return completed
+
+    def _add_member(self, member: str, completed: Dict[str, Any]):
+        if not member.strip():
+            return
+        try:
+            parsed = json.loads('{' + member + '}')
+        except ValueError:
+            # Not valid JSON; the full-text parse reports the problem
+            return
+        for key, value in parsed.items():
+            if key not in self.fields:
+                self.fields[key] = value
+                completed[key] = value
@@ -0,0 +1,290 @@
+"""
+Rate-limit-aware wrapper around the chat completions client.
+
+``ResilientChatClient`` exposes the same ``chat.completions.create`` call as
+``AzureOpenAI`` and adds:
+
+- token buckets sized to the deployment's RPM and TPM quota
+- retries on 429/5xx/connection errors with jittered exponential backoff
+  that honors Retry-After
+- coalescing of identical in-flight requests (same frames and prompt)
+- counters for queue depth, throttling and retries
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+from typing import Dict, Any, Optional
+
+import openai
+
+from metrics import MODEL_CLIENT_EVENTS
+from frame_encoding import estimate_image_tokens, TYPICAL_FRAME_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Token estimate for text used to charge requests against the TPM bucket
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """Block until ``amount`` tokens are available and take them."""
+        # A single request larger than the bucket would wait forever
+        amount = min(amount, self.capacity)
+        with self._condition:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                self._condition.wait((amount - self.tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Drain the bucket so no request is released for ``seconds`` (after a 429)."""
+        with self._condition:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def estimate_request_tokens(kwargs: Dict[str, Any]) -> int:
+    """Rough prompt plus completion token estimate for a chat completions request."""
+    tokens = kwargs.get('max_tokens') or 0
+    for message in kwargs.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            tokens += len(content) // CHARS_PER_TOKEN
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                tokens += len(part['text']) // CHARS_PER_TOKEN
+            elif part.get('type') == 'image_url':
+                tokens += estimate_image_tokens(*TYPICAL_FRAME_SIZE, part['image_url'].get('detail', 'auto'))
+    return tokens
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract the server-requested delay from a Retry-After(-ms) header."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether ``error`` is a 429, 5xx or connection error, worth retrying."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def coalescing_key(kwargs: Dict[str, Any]) -> str:
+    """
+    Key identifying a chat completions request for coalescing.
+
+    Message text and each image's data URL are fed to one digest as they
+    are, instead of serializing the whole request (several MB of base64
+    frames) to JSON first; only the small remaining arguments are
+    serialized.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    for message in kwargs.get('messages', []):
+        digest.update(f"\x00{message.get('role')}\x00".encode('utf-8'))
+        content = message.get('content')
+        parts = [{'type': 'text', 'text': content}] if isinstance(content, str) else content or []
+        for part in parts:
+            if part.get('type') == 'text':
+                text = part['text'].encode('utf-8')
+                # Length-prefixed so adjacent parts cannot run into each other
+                digest.update(f"\x01{len(text)}\x01".encode('ascii') + text)
+            elif part.get('type') == 'image_url':
+                image = part['image_url']
+                digest.update(f"\x02{image.get('detail', 'auto')}\x02".encode('utf-8'))
+                digest.update(image['url'].encode('utf-8'))
+            else:
+                digest.update(b'\x03' + json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+    rest = {key: value for key, value in kwargs.items() if key != 'messages'}
+    digest.update(b'\x04' + json.dumps(rest, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResilientChatClient:
+    """Chat completions client with rate limiting, retries and request coalescing."""
+
+    def __init__(self, client, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 30.0, coalesce: bool = True):
+        """
+        Args:
+            client: Client exposing ``chat.completions.create``
+            requests_per_minute: RPM quota (None disables the request bucket)
+            tokens_per_minute: TPM quota (None disables the token bucket)
+            max_retries: Retries after the first attempt for retryable errors
+            base_delay: Initial backoff in seconds
+            max_delay: Backoff cap in seconds
+            coalesce: Share one upstream call between identical in-flight requests
+        """
+        self.client = client
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.coalesce = coalesce
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._counters = {
+            'requests': 0,
+            'upstream_calls': 0,
+            'coalesced': 0,
+            'throttled': 0,
+            'retries': 0,
+            'failures': 0
+        }
+        self._queue_depth = 0
+        self._active = 0
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @classmethod
+    def from_env(cls, client) -> 'ResilientChatClient':
+        """Wrap ``client`` using the AZURE_OPENAI_* rate limit settings."""
+        rpm = os.environ.get('AZURE_OPENAI_RPM_LIMIT')
+        tpm = os.environ.get('AZURE_OPENAI_TPM_LIMIT')
+        return cls(
+            client,
+            requests_per_minute=float(rpm) if rpm else None,
+            tokens_per_minute=float(tpm) if tpm else None,
+            max_retries=int(os.environ.get('AZURE_OPENAI_MAX_RETRIES', 5)),
+            base_delay=float(os.environ.get('AZURE_OPENAI_RETRY_BASE_DELAY', 1.0)),
+            max_delay=float(os.environ.get('AZURE_OPENAI_RETRY_MAX_DELAY', 30.0)),
+            coalesce=os.environ.get('AZURE_OPENAI_COALESCE_REQUESTS', 'true').lower() in ('1', 'true', 'yes')
+        )
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+        MODEL_CLIENT_EVENTS.labels(event=name).inc(amount)
+
+    def create(self, **kwargs):
+        """Same signature as ``client.chat.completions.create``."""
+        self._count('requests')
+        if not self.coalesce or kwargs.get('stream'):
+            return self._call_with_retries(kwargs)
+
+        key = coalescing_key(kwargs)
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self._counters['coalesced'] += 1
+        if not leader:
+            MODEL_CLIENT_EVENTS.labels(event='coalesced').inc()
+            return future.result()
+
+        try:
+            response = self._call_with_retries(kwargs)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _wait_for_quota(self, kwargs):
+        with self._lock:
+            self._queue_depth += 1
+        try:
+            if self.request_bucket is not None:
+                self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(estimate_request_tokens(kwargs))
+        finally:
+            with self._lock:
+                self._queue_depth -= 1
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # Honor the server's delay, with a little jitter to avoid a thundering herd
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1))
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _call_with_retries(self, kwargs):
+        attempt = 0
+        while True:
+            self._wait_for_quota(kwargs)
+            with self._lock:
+                self._active += 1
+                self._counters['upstream_calls'] += 1
+            MODEL_CLIENT_EVENTS.labels(event='upstream_calls').inc()
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if isinstance(e, openai.RateLimitError):
+                    self._count('throttled')
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                delay = self._backoff(attempt, e)
+                if isinstance(e, openai.RateLimitError) and self.request_bucket is not None:
+                    # Hold back every caller, not just this one, while throttled
+                    self.request_bucket.penalize(delay)
+                logger.warning(f"Model call failed ({e.__class__.__name__}), "
+                               f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                self._count('retries')
+                attempt += 1
+            finally:
+                with self._lock:
+                    self._active -= 1
+            # Sleep outside the call so backing-off retries do not count as in flight
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing deployments: queue depth, in-flight calls, throttling and retries."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                'queue_depth': self._queue_depth,
+                'in_flight': self._active,
+                'coalescing_keys': len(self._in_flight),
+                'rpm_limit': self.request_bucket.rate * 60 if self.request_bucket else None,
+                'tpm_limit': self.token_bucket.rate * 60 if self.token_bucket else None
+            })
+        return stats
@@ -0,0 +1,266 @@
+"""
+Content-addressed cache for video analysis results.
+
+Results are keyed on a streaming hash of the video bytes, the normalized
+anomaly prompt, the model deployment and the frame sampling settings, so a
+repeated clip skips both OpenCV decoding and the Azure OpenAI call.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Share of max_entries freed by each disk eviction pass, so the directory is
+# only scanned again after that many new entries
+EVICTION_HEADROOM = 0.1
+
+
+def eviction_target(max_entries: int) -> int:
+    """Entries to keep after a disk eviction pass."""
+    return max(1, max_entries - max(1, int(max_entries * EVICTION_HEADROOM)))
+
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Compute the SHA-256 of a file without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileHashMemo:
+    """Remembers file hashes by path, size and mtime so unchanged files (e.g. demo videos) are hashed once."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _memo_key(path: str):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def remember(self, path: str, file_hash: str) -> None:
+        """Record a hash computed elsewhere (e.g. while the file was being uploaded)."""
+        memo_key = self._memo_key(path)
+        with self._lock:
+            self._hashes[memo_key] = file_hash
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+
+    def hash(self, path: str) -> str:
+        memo_key = self._memo_key(path)
+        with self._lock:
+            if memo_key in self._hashes:
+                self._hashes.move_to_end(memo_key)
+                return self._hashes[memo_key]
+
+        file_hash = hash_file(path)
+        self.remember(path, file_hash)
+        return file_hash
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize an anomaly prompt so trivially different spellings share a cache entry."""
+    return ' '.join(prompt.split()).lower()
+
+
+def build_cache_key(file_hash: str, anomaly_prompt: str, deployment_name: str,
+                    sampling: Dict[str, Any]) -> str:
+    """Build the cache key for one analysis request."""
+    material = json.dumps({
+        'video': file_hash,
+        'prompt': normalize_prompt(anomaly_prompt),
+        'deployment': deployment_name,
+        'sampling': sampling
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Base class for analysis result caches."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for ``key`` or None, recording hit/miss counts."""
+        value = self._lookup(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.backend, 'hits': self.hits, 'misses': self.misses}
+
+
+class InMemoryResultCache(ResultCache):
+    """Process-local LRU cache with TTL expiry."""
+
+    backend = 'memory'
+
+    def __init__(self, max_entries: int = 256, ttl: float = 86400):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        # Stored serialized so callers cannot mutate cached results
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._entries[key] = (time.time(), serialized)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['entries'] = len(self._entries)
+        return stats
+
+
+class DiskResultCache(ResultCache):
+    """
+    Disk-backed cache storing one JSON file per key.
+
+    File modification times track recency: reads touch the file, and the
+    least recently used files are removed when ``max_entries`` is exceeded.
+    The directory can be shared by several worker processes.
+
+    Each process keeps a running count of the entries instead of listing the
+    directory on every write; the directory is only scanned when the count
+    goes over ``max_entries``, and each scan frees some headroom and
+    resynchronises the count with the entries other processes wrote.
+    """
+
+    backend = 'disk'
+
+    def __init__(self, directory: str, max_entries: int = 1024, ttl: float = 86400):
+        super().__init__()
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._entries = self._count_entries()
+        self._entries_lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _count_entries(self) -> int:
+        return sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        is_new = not os.path.exists(path)
+        os.replace(tmp_path, path)
+        if not is_new:
+            return
+        with self._entries_lock:
+            self._entries += 1
+            over_limit = self._entries > self.max_entries
+        if over_limit:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries down to ``eviction_target`` and resync the count."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        if len(entries) > self.max_entries:
+            entries.sort()
+            excess = len(entries) - eviction_target(self.max_entries)
+            for _, path in entries[:excess]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            entries = entries[excess:]
+        with self._entries_lock:
+            self._entries = len(entries)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats['entries'] = self._count_entries()
+        return stats
+
+
+def create_result_cache() -> Optional[ResultCache]:
+    """Create the result cache selected by RESULT_CACHE_BACKEND (memory, disk or none)."""
+    backend = (os.environ.get('RESULT_CACHE_BACKEND') or 'memory').lower()
+    max_entries = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+    ttl = float(os.environ.get('RESULT_CACHE_TTL', 86400))
+
+    if backend in ('none', 'off', 'disabled'):
+        return None
+    if backend == 'disk':
+        directory = os.environ.get('RESULT_CACHE_DIR', os.path.join('uploads', '.result-cache'))
+        logger.info(f"Using disk result cache at {directory}")
+        return DiskResultCache(directory, max_entries=max_entries, ttl=ttl)
+    if backend != 'memory':
+        logger.warning(f"Unknown RESULT_CACHE_BACKEND '{backend}', using in-memory result cache")
+    return InMemoryResultCache(max_entries=max_entries, ttl=ttl)
@@ -0,0 +1,520 @@
+"""
+Continuous anomaly monitoring of live video streams.
+
+A ``StreamMonitor`` reads an RTSP/HTTP stream (or a local file played in a
+loop, for testing) with ``cv2.VideoCapture`` and keeps a bounded ring buffer
+of recently sampled, already encoded frames. At a fixed cadence the frames
+captured since the previous analysis are sent to the analyzer as one window.
+
+Each monitor has at most one model call in flight. Cadence ticks that pass
+while a call is running are merged into the next window, and frames that
+leave the ring buffer before they were analysed are counted as dropped, so
+slow model calls never grow memory. Results are published as events for
+server-sent event subscribers.
+
+Stream URLs are opened by the server, so sources resolving to loopback,
+private, link-local or other non-public addresses are refused unless their
+host or network is listed in STREAM_SOURCE_ALLOWLIST. Monitors live in the
+process that started them; STREAM_MONITORING turns the feature off, as the
+gunicorn configuration does when it runs several workers.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import ipaddress
+import logging
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+from activity_filter import measure_activity_thumbnails, ACTIVITY_THUMBNAIL_WIDTH
+from frame_selection import make_thumbnails
+from frame_encoding import resolve_encoding_settings, encode_to_frame, EncodingStats
+from long_video import FRAMES_PER_WINDOW
+from video_pipeline import is_video_file
+
+logger = logging.getLogger(__name__)
+
+# Frames per second kept from the stream, and seconds between analyses
+STREAM_SAMPLE_FPS = float(os.environ.get('STREAM_SAMPLE_FPS', 2))
+STREAM_ANALYSIS_INTERVAL = float(os.environ.get('STREAM_ANALYSIS_INTERVAL', 10))
+STREAM_WINDOW_FRAMES = int(os.environ.get('STREAM_WINDOW_FRAMES', FRAMES_PER_WINDOW))
+
+# Ring buffer capacity (frames) and number of results kept for late subscribers
+STREAM_BUFFER_FRAMES = int(os.environ.get('STREAM_BUFFER_FRAMES', 60))
+STREAM_RESULT_HISTORY = int(os.environ.get('STREAM_RESULT_HISTORY', 100))
+
+STREAM_MAX_MONITORS = int(os.environ.get('STREAM_MAX_MONITORS', 4))
+STREAM_RECONNECT_DELAY = float(os.environ.get('STREAM_RECONNECT_DELAY', 5))
+
+# Local files are only accepted as sources when explicitly enabled (testing)
+STREAM_ALLOW_FILE_SOURCES = os.environ.get('STREAM_ALLOW_FILE_SOURCES', 'false').lower() in ('1', 'true', 'yes')
+
+STREAM_URL_SCHEMES = ('rtsp', 'rtsps', 'rtmp', 'http', 'https')
+
+# Comma-separated hosts and CIDR networks stream URLs may use. Empty accepts any
+# host resolving to public addresses; listed ones may be private (e.g. 192.168.10.0/24)
+STREAM_SOURCE_ALLOWLIST = [entry.strip().lower() for entry in os.environ.get('STREAM_SOURCE_ALLOWLIST', '').split(',')
+                           if entry.strip()]
+
+# Stream monitors run in this process; false refuses /streams requests (empty = true)
+STREAM_MONITORING = (os.environ.get('STREAM_MONITORING') or 'true').lower() in ('1', 'true', 'yes')
+
+STATE_CONNECTING = 'connecting'
+STATE_RUNNING = 'running'
+STATE_RECONNECTING = 'reconnecting'
+STATE_STOPPED = 'stopped'
+
+SSE_KEEPALIVE_SECONDS = 15
+
+
+class StreamLimitError(Exception):
+    """Raised when the maximum number of stream monitors is already running."""
+
+
+def _is_public_address(address) -> bool:
+    # is_global excludes loopback, private, link-local, shared (CGNAT) and reserved ranges
+    return address.is_global and not address.is_multicast
+
+
+def check_stream_host(host: str, allowlist: Optional[List[str]] = None):
+    """
+    Check that a stream URL's host may be connected to from the server.
+
+    With an allowlist, the host must be listed by name or resolve into a
+    listed network. Without one, every address it resolves to must be public.
+
+    Raises:
+        ValueError: If the host cannot be resolved or is not allowed
+    """
+    allowlist = STREAM_SOURCE_ALLOWLIST if allowlist is None else allowlist
+    host = (host or '').lower().rstrip('.')
+    if not host:
+        raise ValueError("The stream URL has no host")
+    try:
+        addresses = {ipaddress.ip_address(info[4][0].split('%')[0])
+                     for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f"Cannot resolve stream host {host}")
+
+    if allowlist:
+        if host in allowlist:
+            return
+        networks = []
+        for entry in allowlist:
+            try:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                continue  # A host name
+        if addresses and all(any(address in network for network in networks) for address in addresses):
+            return
+        raise ValueError(f"Stream host {host} is not in STREAM_SOURCE_ALLOWLIST")
+
+    if not all(_is_public_address(address) for address in addresses):
+        raise ValueError(f"Stream host {host} resolves to a private or local address; "
+                         f"list it in STREAM_SOURCE_ALLOWLIST to allow it")
+
+
+def validate_stream_source(source: str, allow_files: bool = STREAM_ALLOW_FILE_SOURCES,
+                           allowlist: Optional[List[str]] = None) -> str:
+    """
+    Check that ``source`` is a supported stream URL (or an allowed local file).
+
+    Raises:
+        ValueError: If the source is not supported or its host is not allowed
+    """
+    source = (source or '').strip()
+    if not source:
+        raise ValueError("A stream source is required")
+    parsed = urlparse(source)
+    if parsed.scheme.lower() in STREAM_URL_SCHEMES:
+        try:
+            host = parsed.hostname
+        except ValueError:
+            raise ValueError("Invalid stream URL")
+        check_stream_host(host, allowlist)
+        return source
+    if allow_files and os.path.isfile(source) and is_video_file(source):
+        return source
+    raise ValueError(f"Unsupported stream source. Use a URL with one of: {', '.join(STREAM_URL_SCHEMES)}")
+
+
+def _evenly_spaced(items: List, count: int) -> List:
+    """Pick ``count`` items evenly spread over ``items``, always keeping the newest."""
+    if len(items) <= count:
+        return list(items)
+    if count == 1:
+        return [items[-1]]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
+
+
+def format_sse(data: Dict[str, Any], event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """Format one server-sent event."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class StreamMonitor:
+    """Reads one stream continuously and analyses sliding windows of it."""
+
+    def __init__(self, source: str, anomaly_prompt: str, analyzer,
+                 sample_fps: float = STREAM_SAMPLE_FPS,
+                 interval: float = STREAM_ANALYSIS_INTERVAL,
+                 window_frames: int = STREAM_WINDOW_FRAMES,
+                 buffer_frames: int = STREAM_BUFFER_FRAMES,
+                 encoding: Optional[Dict[str, Any]] = None,
+                 camera_profile: Optional[str] = None,
+                 reconnect_delay: float = STREAM_RECONNECT_DELAY):
+        """
+        Args:
+            source: Stream URL, or a local file that is played in a loop in real time
+            anomaly_prompt: User-specified anomaly types to detect
+            analyzer: Analyzer providing ``analyze_frames``
+            sample_fps: Frames per second kept from the stream
+            interval: Seconds between analyses
+            window_frames: Maximum frames sent per analysis
+            buffer_frames: Ring buffer capacity in frames
+            encoding: Frame encoding settings (default: the configured profile)
+            camera_profile: Activity pre-filter profile; quiet windows skip the model call (None disables)
+            reconnect_delay: Seconds to wait before reopening a failed stream
+        """
+        self.monitor_id = uuid.uuid4().hex
+        self.source = source
+        self.anomaly_prompt = anomaly_prompt
+        self.analyzer = analyzer
+        self.sample_fps = sample_fps
+        self.interval = interval
+        self.window_frames = max(1, min(window_frames, buffer_frames))
+        self.encoding = encoding or resolve_encoding_settings()
+        self.camera_profile = camera_profile
+        self.reconnect_delay = reconnect_delay
+        self.loop_file = os.path.isfile(source)
+
+        self.state = STATE_CONNECTING
+        self.created_at = time.time()
+        self._started = time.monotonic()
+        self._stop = threading.Event()
+        self._buffer = deque(maxlen=max(1, buffer_frames))
+        self._buffer_lock = threading.Lock()
+        self._next_seq = 0
+        self._last_analyzed_seq = -1
+        self._encoding_stats = EncodingStats(self.encoding)
+
+        self._events = deque(maxlen=STREAM_RESULT_HISTORY)
+        self._next_event_id = 1
+        self._events_changed = threading.Condition()
+
+        self.stats = {
+            'frames_read': 0,
+            'frames_sampled': 0,
+            'frames_dropped': 0,
+            'windows_analyzed': 0,
+            'windows_merged': 0,
+            'analysis_errors': 0,
+            'reconnects': 0,
+            'loops': 0,
+            'last_analysis_seconds': None
+        }
+
+        self._reader = threading.Thread(target=self._read_loop, name=f'stream-reader-{self.monitor_id[:8]}',
+                                        daemon=True)
+        self._worker = threading.Thread(target=self._analysis_loop, name=f'stream-analysis-{self.monitor_id[:8]}',
+                                        daemon=True)
+
+    def start(self) -> 'StreamMonitor':
+        self._reader.start()
+        self._worker.start()
+        logger.info(f"Started stream monitor {self.monitor_id} for {self.source}")
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stop reading and analysing; a model call already in flight is allowed to finish."""
+        self._stop.set()
+        for thread in (self._reader, self._worker):
+            if thread.is_alive() and thread is not threading.current_thread():
+                thread.join(timeout)
+        self.state = STATE_STOPPED
+        with self._events_changed:
+            self._events_changed.notify_all()
+        logger.info(f"Stopped stream monitor {self.monitor_id}")
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def _stream_time(self) -> float:
+        return time.monotonic() - self._started
+
+    def _buffer_frame(self, frame):
+        timestamp = self._stream_time()
+        entry = {
+            'seq': self._next_seq,
+            'captured_at': time.time(),
+            'timestamp': timestamp,
+            'frame': encode_to_frame(frame, self._next_seq, timestamp, self.encoding, self._encoding_stats)
+        }
+        if self.camera_profile:
+            # A small grayscale copy for the activity pre-filter
+            entry['thumbnail'] = make_thumbnails([frame], ACTIVITY_THUMBNAIL_WIDTH)[0].astype(np.uint8)
+        self._next_seq += 1
+        with self._buffer_lock:
+            if len(self._buffer) == self._buffer.maxlen and self._buffer[0]['seq'] > self._last_analyzed_seq:
+                # Evicted before any window included it
+                self.stats['frames_dropped'] += 1
+            self._buffer.append(entry)
+        self.stats['frames_sampled'] += 1
+
+    def _read_loop(self):
+        sample_period = 1.0 / self.sample_fps
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                cap.release()
+                self.state = STATE_RECONNECTING
+                self.stats['reconnects'] += 1
+                logger.warning(f"Cannot open stream {self.source}; retrying in {self.reconnect_delay}s")
+                self._stop.wait(self.reconnect_delay)
+                continue
+
+            self.state = STATE_RUNNING
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0
+            opened = time.monotonic()
+            frames_this_pass = 0
+            next_sample = opened
+            try:
+                while not self._stop.is_set():
+                    # grab() keeps up with live streams cheaply; only sampled frames are decoded
+                    if not cap.grab():
+                        break
+                    frames_this_pass += 1
+                    self.stats['frames_read'] += 1
+
+                    now = time.monotonic()
+                    if self.loop_file and fps > 0:
+                        # Play files back in real time so they behave like a camera
+                        delay = opened + frames_this_pass / fps - now
+                        if delay > 0:
+                            self._stop.wait(delay)
+                            now = time.monotonic()
+
+                    if now >= next_sample:
+                        ret, frame = cap.retrieve()
+                        if ret:
+                            self._buffer_frame(frame)
+                        next_sample = max(next_sample + sample_period, now)
+            except Exception as e:
+                logger.error(f"Stream {self.monitor_id} read failed: {e}")
+            finally:
+                cap.release()
+
+            if self._stop.is_set():
+                break
+            if self.loop_file:
+                self.stats['loops'] += 1
+            else:
+                self.state = STATE_RECONNECTING
+                self.stats['reconnects'] += 1
+                logger.warning(f"Stream {self.source} ended; reconnecting in {self.reconnect_delay}s")
+                self._stop.wait(self.reconnect_delay)
+
+    def _pending_frames(self) -> List[Dict]:
+        with self._buffer_lock:
+            return [entry for entry in self._buffer if entry['seq'] > self._last_analyzed_seq]
+
+    def _analysis_loop(self):
+        next_tick = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_tick - time.monotonic())):
+            now = time.monotonic()
+            # Ticks that passed while the previous call was running are merged into this window
+            missed = int((now - next_tick) // self.interval)
+            self.stats['windows_merged'] += missed
+            next_tick += (missed + 1) * self.interval
+
+            pending = self._pending_frames()
+            if not pending:
+                continue
+            window = _evenly_spaced(pending, self.window_frames)
+            self._last_analyzed_seq = pending[-1]['seq']
+            self._analyze_window(window, pending, merged_ticks=missed)
+
+    def _analyze_window(self, window: List[Dict], pending: List[Dict], merged_ticks: int):
+        frames = [entry['frame'] for entry in window]
+        duration = pending[-1]['timestamp'] - pending[0]['timestamp']
+        video_info = {
+            'total_frames': len(pending),
+            'fps': self.sample_fps,
+            'duration': duration,
+            'extracted_frames': len(frames)
+        }
+        if self.camera_profile:
+            video_info['activity'] = measure_activity_thumbnails(
+                np.stack([entry['thumbnail'] for entry in pending]), self.camera_profile)
+
+        start = time.perf_counter()
+        try:
+            analysis = self.analyzer.analyze_frames(frames, self.anomaly_prompt, video_info)
+        except Exception as e:
+            logger.error(f"Stream {self.monitor_id} analysis failed: {e}")
+            analysis = {'error': str(e)}
+        elapsed = time.perf_counter() - start
+
+        self.stats['windows_analyzed'] += 1
+        self.stats['last_analysis_seconds'] = round(elapsed, 3)
+        if 'error' in analysis:
+            self.stats['analysis_errors'] += 1
+
+        self._publish({
+            'monitor_id': self.monitor_id,
+            'window': {
+                'start': pending[0]['captured_at'],
+                'end': pending[-1]['captured_at'],
+                'start_time': pending[0]['timestamp'],
+                'end_time': pending[-1]['timestamp'],
+                'frames': len(frames),
+                'frames_available': len(pending),
+                'merged_ticks': merged_ticks
+            },
+            'analysis': analysis,
+            'analysis_seconds': round(elapsed, 3)
+        })
+
+    def _publish(self, event: Dict[str, Any]):
+        with self._events_changed:
+            event['event_id'] = self._next_event_id
+            self._next_event_id += 1
+            self._events.append(event)
+            self._events_changed.notify_all()
+
+    def events_since(self, last_event_id: int = 0, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return events newer than ``last_event_id``, waiting up to ``timeout`` seconds for one."""
+        with self._events_changed:
+            self._events_changed.wait_for(
+                lambda: self._next_event_id - 1 > last_event_id or self._stop.is_set(), timeout)
+            return [event for event in self._events if event['event_id'] > last_event_id]
+
+    def event_stream(self, last_event_id: int = 0, keepalive: float = SSE_KEEPALIVE_SECONDS):
+        """Yield server-sent events for results after ``last_event_id`` until the monitor stops."""
+        yield f"retry: {int(self.reconnect_delay * 1000)}\n\n"
+        while True:
+            events = self.events_since(last_event_id, timeout=keepalive)
+            for event in events:
+                last_event_id = event['event_id']
+                yield format_sse(event, event='analysis', event_id=last_event_id)
+            if self.stopped:
+                yield format_sse({'monitor_id': self.monitor_id, 'state': STATE_STOPPED}, event='end')
+                return
+            if not events:
+                yield ': keepalive\n\n'
+
+    def status(self) -> Dict[str, Any]:
+        with self._buffer_lock:
+            buffered = len(self._buffer)
+        with self._events_changed:
+            last_event = self._events[-1] if self._events else None
+        return {
+            'monitor_id': self.monitor_id,
+            'source': self.source,
+            'state': self.state,
+            'anomaly_prompt': self.anomaly_prompt,
+            'created_at': self.created_at,
+            'settings': {
+                'sample_fps': self.sample_fps,
+                'interval': self.interval,
+                'window_frames': self.window_frames,
+                'buffer_frames': self._buffer.maxlen,
+                'camera_profile': self.camera_profile,
+                'loop_file': self.loop_file
+            },
+            'buffered_frames': buffered,
+            'stats': dict(self.stats),
+            'encoding': self._encoding_stats.to_dict(),
+            'last_event': last_event
+        }
+
+
+class StreamMonitorManager:
+    """Registry of the stream monitors running in this process."""
+
+    def __init__(self, max_monitors: int = STREAM_MAX_MONITORS, enabled: bool = True):
+        self.max_monitors = max_monitors
+        self.enabled = enabled
+        self._monitors = {}
+        self._lock = threading.Lock()
+
+    def start(self, source: str, anomaly_prompt: str, analyzer, **settings) -> StreamMonitor:
+        """
+        Start monitoring ``source``.
+
+        Raises:
+            StreamLimitError: If ``max_monitors`` monitors are already running, or monitoring is disabled
+        """
+        if not self.enabled:
+            raise StreamLimitError("Stream monitoring is disabled in this process")
+        with self._lock:
+            running = sum(1 for monitor in self._monitors.values() if not monitor.stopped)
+            if running >= self.max_monitors:
+                raise StreamLimitError(f"Stream monitor limit reached ({self.max_monitors} running)")
+            monitor = StreamMonitor(source, anomaly_prompt, analyzer, **settings)
+            self._monitors[monitor.monitor_id] = monitor
+        return monitor.start()
+
+    def get(self, monitor_id: str) -> Optional[StreamMonitor]:
+        return self._monitors.get(monitor_id)
+
+    def list(self) -> List[StreamMonitor]:
+        return list(self._monitors.values())
+
+    def remove(self, monitor_id: str) -> Optional[StreamMonitor]:
+        """Stop a monitor and forget it."""
+        with self._lock:
+            monitor = self._monitors.pop(monitor_id, None)
+        if monitor is not None:
+            monitor.stop()
+        return monitor
+
+    def shutdown(self):
+        for monitor_id in list(self._monitors):
+            self.remove(monitor_id)
+
+
+def parse_stream_settings(values) -> Dict[str, Any]:
+    """
+    Read per-monitor cadence settings from form/query values.
+
+    Raises:
+        ValueError: If a setting has an invalid value
+    """
+    def number(name, cast, default, minimum, maximum):
+        raw = (values.get(name, '') or '').strip()
+        if not raw:
+            return default
+        try:
+            value = cast(raw)
+        except ValueError:
+            raise ValueError(f"{name} must be a number")
+        if not minimum <= value <= maximum:
+            raise ValueError(f"{name} must be between {minimum} and {maximum}")
+        return value
+
+    return {
+        'sample_fps': number('sample_fps', float, STREAM_SAMPLE_FPS, 0.1, 30),
+        'interval': number('interval', float, STREAM_ANALYSIS_INTERVAL, 1, 3600),
+        'window_frames': number('window_frames', int, STREAM_WINDOW_FRAMES, 1, FRAMES_PER_WINDOW)
+    }
+
+
+def create_stream_manager() -> StreamMonitorManager:
+    """Create a stream monitor registry configured from environment variables."""
+    return StreamMonitorManager(max_monitors=STREAM_MAX_MONITORS, enabled=STREAM_MONITORING)
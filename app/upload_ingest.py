@@ -0,0 +1,116 @@
+"""
+Streaming upload ingestion.
+
+Uploaded video bodies are hashed and spooled straight into the upload
+folder while the multipart body is being parsed, instead of being buffered
+by Werkzeug and then copied again with ``FileStorage.save``. Files that are
+not claimed by the request handler are removed when the request ends.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+
+from flask import Request
+
+logger = logging.getLogger(__name__)
+
+SPOOL_PREFIX = 'upload-'
+SPOOL_SUFFIX = '.part'
+
+
+class HashingSpoolFile:
+    """Writable temp file in the upload folder that hashes data as it is written."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix=SPOOL_PREFIX,
+                                                 suffix=SPOOL_SUFFIX, delete=False)
+        self.path = self._file.name
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self.claimed = False
+
+    def write(self, data) -> int:
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        """Hex SHA-256 of everything written so far."""
+        return self._digest.hexdigest()
+
+    def claim(self, destination: str) -> str:
+        """
+        Close the spool and move it to ``destination`` (same filesystem, no copy).
+
+        After claiming, the caller is responsible for removing the file.
+        """
+        self._file.close()
+        os.replace(self.path, destination)
+        self.path = destination
+        self.claimed = True
+        return destination
+
+    def discard(self):
+        """Close and remove the spool unless it has been claimed."""
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        if not self.claimed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # read/seek/flush/etc. are served by the underlying temp file
+        return getattr(self._file, name)
+
+
+class IngestRequest(Request):
+    """Flask request that spools uploaded files through ``HashingSpoolFile``."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from flask import current_app
+        spool = HashingSpoolFile(current_app.config['UPLOAD_FOLDER'])
+        self.spooled_uploads.append(spool)
+        return spool
+
+    @property
+    def spooled_uploads(self):
+        """Spool files created while parsing this request."""
+        if '_spooled_uploads' not in self.__dict__:
+            self.__dict__['_spooled_uploads'] = []
+        return self.__dict__['_spooled_uploads']
+
+    def discard_unclaimed_uploads(self):
+        """Remove spooled files that no handler claimed."""
+        for spool in self.spooled_uploads:
+            spool.discard()
+
+
+def init_streaming_ingest(app):
+    """Install the spooling request class and per-request cleanup on ``app``."""
+    app.request_class = IngestRequest
+
+    @app.teardown_request
+    def _discard_unclaimed_uploads(exc):
+        from flask import request
+        if isinstance(request._get_current_object(), IngestRequest):
+            request.discard_unclaimed_uploads()
+
+
+def claim_upload(file_storage, destination: str):
+    """
+    Move an uploaded file to ``destination`` and return its SHA-256.
+
+    Uses the spool written during parsing when available; otherwise falls
+    back to ``FileStorage.save`` and returns None for the hash.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, HashingSpoolFile):
+        stream.claim(destination)
+        return stream.sha256
+
+    file_storage.save(destination)
+    return None
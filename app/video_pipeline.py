@@ -0,0 +1,259 @@
+"""
+Video processing pipeline shared by the Flask app, the ASGI app and background workers.
+
+Holds frame extraction (sampling, selection and encoding) and the parsing
+of per-request analysis options. The module does not import the web app,
+so process pool workers can import it cheaply.
+"""
+import os
+import time
+import logging
+from typing import Dict, Any, List, Tuple, Mapping
+
+import numpy as np
+
+from frame_sampler import sample_frames, read_video_properties
+from decoders import select_backend, decode_threads, scaled_size
+from frame_selection import (select_motion_frames, make_thumbnails, SAMPLING_MODES, SAMPLING_MODE_UNIFORM,
+                             SAMPLING_MODE_MOTION, MOTION_CANDIDATE_FACTOR)
+from frame_encoding import resolve_encoding_settings, encode_to_frame, EncodedFrame, EncodingStats
+from activity_filter import (measure_activity_thumbnails, resolve_camera_profile, ACTIVITY_PREFILTER,
+                             ACTIVITY_THUMBNAIL_WIDTH)
+from memory_budget import decode_budget, estimate_decode_bytes
+from metrics import stage_timer
+from long_video import (plan_window_count, FRAMES_PER_WINDOW, LONG_VIDEO_WINDOW_SECONDS,
+                        LONG_VIDEO_MAX_WINDOWS)
+
+logger = logging.getLogger(__name__)
+
+# Number of frames sampled from each video for analysis
+MAX_FRAMES_FOR_ANALYSIS = 10
+
+# Default frame sampling mode (uniform or motion), overridable per request
+DEFAULT_SAMPLING_MODE = os.environ.get('SAMPLING_MODE', 'uniform').lower()
+
+# Video file extensions accepted for analysis
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+
+
+def is_video_file(filename: str) -> bool:
+    """Check whether ``filename`` has a supported video extension."""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
+
+
+def extract_frames_from_video(video_path, max_frames=10, sampling_mode=SAMPLING_MODE_UNIFORM,
+                              encoding=None, camera_profile=None,
+                              properties=None) -> Tuple[List[EncodedFrame], Dict[str, Any]]:
+    """
+    Extract frames from video for analysis.
+
+    With a ``camera_profile`` the decoded frames are also checked by the
+    activity pre-filter, and the verdict is returned in ``video_info['activity']``.
+    Stream ``properties`` from an earlier probe (see ``video_probe``) save
+    reopening the file to read them.
+
+    The decode reserves its estimated peak memory from the process's
+    ``decode_budget`` first. In uniform mode each frame is encoded as soon
+    as it is decoded, so only one raw frame is held at a time; motion mode
+    holds all candidates until the eventful ones are selected, and decodes
+    fewer candidates (or falls back to uniform sampling) when the full pool
+    would not fit the budget.
+
+    Frames are scaled to the encoding's ``max_dimension`` while decoding
+    (see ``decoders``), so the raw frames held are already at upload size.
+    """
+    encoding = encoding or resolve_encoding_settings()
+    timings = {}
+    encoding_stats = EncodingStats(encoding)
+    thumbnails = []
+
+    backend = select_backend(video_path)
+    threads = decode_threads()
+    max_dimension = encoding.get('max_dimension')
+    properties = properties or read_video_properties(video_path, backend=backend)
+    fps = properties['fps']
+
+    def timestamp(frame_number):
+        return frame_number / fps if fps > 0 else 0
+
+    def encode(frame_number, frame):
+        if camera_profile:
+            with stage_timer(timings, 'activity'):
+                thumbnails.append(make_thumbnails([frame], ACTIVITY_THUMBNAIL_WIDTH)[0])
+        with stage_timer(timings, 'encode'):
+            # Resized/recompressed per the encoding settings
+            return encode_to_frame(frame, frame_number, timestamp(frame_number), encoding, encoding_stats)
+
+    held_size = scaled_size(properties['width'], properties['height'], max_dimension)
+
+    def decode_bytes(frames_held):
+        return estimate_decode_bytes(properties['width'], properties['height'], frames_held,
+                                     held_size=held_size, threads=threads)
+
+    motion = sampling_mode == SAMPLING_MODE_MOTION
+    candidate_count = max_frames * MOTION_CANDIDATE_FACTOR
+    if motion and not decode_budget.fits(decode_bytes(candidate_count)):
+        # Hold as many candidates as the budget allows rather than exceed it
+        frame_bytes = decode_bytes(1) - decode_bytes(0)
+        candidate_count = (decode_budget.limit_bytes - decode_bytes(0)) // frame_bytes
+        if candidate_count <= max_frames:
+            logger.warning("Motion candidates do not fit the decode memory budget; sampling uniformly")
+            motion = False
+        else:
+            logger.info(f"Decoding {candidate_count} motion candidates to fit the decode memory budget")
+
+    with decode_budget.reserve(decode_bytes(candidate_count if motion else 1)):
+        if motion:
+            # Decode a larger evenly spaced pool and keep the most eventful frames
+            with stage_timer(timings, 'decode'):
+                candidates, properties, sampling_stats = sample_frames(
+                    video_path, max_frames=candidate_count, backend=backend,
+                    threads=threads, max_dimension=max_dimension)
+            with stage_timer(timings, 'select'):
+                sampled, selection_stats = select_motion_frames(candidates, max_frames)
+            # Judge activity on every decoded frame, not just the selected ones
+            if camera_profile:
+                with stage_timer(timings, 'activity'):
+                    thumbnails = list(make_thumbnails([frame for _, frame in candidates], ACTIVITY_THUMBNAIL_WIDTH))
+            del candidates
+            with stage_timer(timings, 'encode'):
+                frames = [encode_to_frame(frame, frame_number, timestamp(frame_number), encoding, encoding_stats)
+                          for frame_number, frame in sampled]
+            del sampled
+        else:
+            # Only the sampled frames are decoded; see frame_sampler for the seek strategy
+            started = time.perf_counter()
+            encoded, properties, sampling_stats = sample_frames(video_path, max_frames=max_frames,
+                                                                transform=encode, backend=backend,
+                                                                threads=threads, max_dimension=max_dimension)
+            frames = [frame for _, frame in encoded]
+            # Encoding and activity thumbnails happened between reads
+            timings['decode'] = round(time.perf_counter() - started - timings.get('encode', 0.0)
+                                      - timings.get('activity', 0.0), 4)
+            selection_stats = {'mode': SAMPLING_MODE_UNIFORM, 'selected': len(frames)}
+
+    activity = None
+    if camera_profile:
+        with stage_timer(timings, 'activity'):
+            activity = measure_activity_thumbnails(np.stack(thumbnails) if thumbnails else
+                                                   np.empty((0, 1, 1), np.uint8), camera_profile)
+
+    video_info = {
+        'total_frames': properties['total_frames'],
+        'fps': fps,
+        'duration': properties['duration'],
+        'extracted_frames': len(frames),
+        'sampling': sampling_stats,
+        'selection': selection_stats,
+        'encoding': encoding_stats.to_dict(),
+        # Stage timings; popped and recorded by metrics.record_extraction in the serving process
+        'timings': timings
+    }
+    if activity is not None:
+        video_info['activity'] = activity
+    return frames, video_info
+
+
+def parse_flag(values: Mapping, name: str) -> bool:
+    """Read a boolean form/query flag; accepts 1/true/yes/on (what an HTML checkbox sends)."""
+    value = values.get(name, '') or ''
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _optional_int(values: Mapping, name: str):
+    value = (values.get(name, '') or '').strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def parse_options(values: Mapping) -> Dict[str, Any]:
+    """
+    Collect per-request analysis options from form/query values.
+
+    Raises:
+        ValueError: If an option has an invalid value
+    """
+    sampling_mode = (values.get('sampling_mode', '') or '').strip().lower() or DEFAULT_SAMPLING_MODE
+    if sampling_mode not in SAMPLING_MODES:
+        raise ValueError(f"Unsupported sampling_mode '{sampling_mode}'. Use one of: {', '.join(SAMPLING_MODES)}")
+
+    encoding_overrides = {
+        'max_dimension': _optional_int(values, 'max_dimension'),
+        'jpeg_quality': _optional_int(values, 'jpeg_quality'),
+        'detail': (values.get('detail', '') or '').strip().lower() or None,
+        'grayscale': parse_flag(values, 'grayscale') if 'grayscale' in values else None
+    }
+    encoding = resolve_encoding_settings((values.get('encoding_profile', '') or '').strip() or None,
+                                         encoding_overrides)
+
+    # The activity pre-filter is named by its camera profile; None disables it
+    prefilter = parse_flag(values, 'prefilter') if (values.get('prefilter', '') or '').strip() else ACTIVITY_PREFILTER
+    camera_profile = None
+    if prefilter:
+        camera_profile, _ = resolve_camera_profile((values.get('camera_profile', '') or '').strip() or None)
+
+    return {
+        'long_video': parse_flag(values, 'long_video'),
+        'sampling_mode': sampling_mode,
+        'encoding': encoding,
+        'camera_profile': camera_profile,
+        # Include a per-stage timing breakdown in the response
+        'timings': parse_flag(values, 'timings')
+    }
+
+
+def build_sampling_settings(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Frame sampling and encoding settings for a request (also part of the result cache key)."""
+    settings = {
+        'max_frames': MAX_FRAMES_FOR_ANALYSIS,
+        'sampling_mode': options.get('sampling_mode', SAMPLING_MODE_UNIFORM),
+        'encoding': options.get('encoding') or resolve_encoding_settings()
+    }
+    if options.get('camera_profile'):
+        settings['camera_profile'] = options['camera_profile']
+    if options.get('long_video'):
+        settings.update({
+            'mode': 'long_video',
+            'window_seconds': LONG_VIDEO_WINDOW_SECONDS,
+            'max_windows': LONG_VIDEO_MAX_WINDOWS
+        })
+    return settings
+
+
+def plan_frame_budget(video_path: str, settings: Dict[str, Any], properties: Dict[str, Any] = None) -> int:
+    """
+    Return the number of analysis windows and size ``settings['max_frames']`` to match.
+
+    Regular requests use a single window; long-video requests get one
+    window of frames per model request across the whole timeline.
+    """
+    if settings.get('mode') != 'long_video':
+        return 1
+    window_count = plan_window_count((properties or read_video_properties(video_path))['duration'])
+    settings['max_frames'] = window_count * FRAMES_PER_WINDOW
+    return window_count
+
+
+def extract_frames_for_request(video_path: str, settings: Dict[str, Any],
+                               properties: Dict[str, Any] = None) -> Tuple[int, List[EncodedFrame], Dict[str, Any]]:
+    """
+    Plan the frame budget and extract frames for one request.
+
+    Self-contained so it can run in a process pool worker. ``properties``
+    are the video's probed stream properties, if already known.
+
+    Returns:
+        Tuple of (window count, frames, video info)
+    """
+    settings = dict(settings)
+    window_count = plan_frame_budget(video_path, settings, properties)
+    frames, video_info = extract_frames_from_video(video_path, max_frames=settings['max_frames'],
+                                                   sampling_mode=settings['sampling_mode'],
+                                                   encoding=settings['encoding'],
+                                                   camera_profile=settings.get('camera_profile'),
+                                                   properties=properties)
+    return window_count, frames, video_info
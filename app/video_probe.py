@@ -0,0 +1,209 @@
+"""
+Fast video validation from container headers.
+
+Before any frame is decoded, a probe reads the container and stream headers
+(with PyAV when it is the file's decoder backend, otherwise by opening an
+OpenCV capture) to get the codec, frame count, frame rate, duration and
+resolution. Unreadable files, files without a decodable video stream,
+zero-fps or empty streams and videos beyond the configured duration or
+resolution limits are rejected with ``VideoRejectedError`` so requests fail
+fast instead of part-way through extraction.
+
+Probe results are cached by file content hash, so re-uploads and demo
+videos (pre-probed at startup) are validated without reopening the file,
+and the probed properties are handed to frame extraction.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import cv2
+
+from decoders import av, select_backend, pyav_stream_properties, BACKEND_PYAV
+from video_pipeline import is_video_file
+
+logger = logging.getLogger(__name__)
+
+# Longest video accepted for analysis, in seconds (0 = no limit)
+MAX_VIDEO_DURATION_SECONDS = float(os.environ.get('MAX_VIDEO_DURATION_SECONDS', 7200))
+
+# Largest accepted frame width or height, in pixels (0 = no limit)
+MAX_VIDEO_DIMENSION = int(os.environ.get('MAX_VIDEO_DIMENSION', 4096))
+
+# Comma-separated codec names to accept (e.g. h264,hevc,vp9); empty accepts any decodable codec
+SUPPORTED_VIDEO_CODECS = {codec.strip().lower() for codec in os.environ.get('SUPPORTED_VIDEO_CODECS', '').split(',')
+                          if codec.strip()}
+
+# Probe results kept per process, keyed by file hash
+PROBE_CACHE_MAX_ENTRIES = int(os.environ.get('PROBE_CACHE_MAX_ENTRIES', 1024))
+
+
+class VideoRejectedError(ValueError):
+    """Raised when a video fails probing or validation; ``status_code`` is the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _probe_pyav(video_path: str) -> Dict[str, Any]:
+    try:
+        container = av.open(video_path)
+    except av.AVError as e:
+        # strerror leaves out the (server-side) file name
+        raise VideoRejectedError(f"Cannot read video file: {getattr(e, 'strerror', None) or e}")
+    try:
+        if not container.streams.video:
+            raise VideoRejectedError("Video file has no video stream")
+        stream = container.streams.video[0]
+        codec = stream.codec_context.name
+        try:
+            av.Codec(codec, 'r')
+        except Exception:
+            raise VideoRejectedError(f"Unsupported video codec '{codec}'", 415)
+        probe = pyav_stream_properties(container, stream)
+        probe.update({'codec': codec, 'container': container.format.name})
+        return probe
+    finally:
+        container.close()
+
+
+def _probe_opencv(video_path: str) -> Dict[str, Any]:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise VideoRejectedError("Cannot read video file")
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return {
+            'total_frames': total_frames,
+            'fps': fps,
+            'duration': total_frames / fps if fps > 0 else 0,
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'codec': fourcc.to_bytes(4, 'little').decode('ascii', 'replace').strip('\x00 ').lower() or None,
+            'container': os.path.splitext(video_path)[1].lstrip('.').lower() or None
+        }
+    finally:
+        cap.release()
+
+
+def probe_video(video_path: str, backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read a video's codec and stream properties from its headers, without decoding frames.
+
+    Returns:
+        Dict with total_frames, fps, duration, width, height, codec, container and backend
+
+    Raises:
+        VideoRejectedError: If the file cannot be read or has no decodable video stream
+    """
+    backend = select_backend(video_path, backend)
+    probe = _probe_pyav(video_path) if backend == BACKEND_PYAV else _probe_opencv(video_path)
+    probe['backend'] = backend
+    return probe
+
+
+def validate_probe(probe: Dict[str, Any]):
+    """
+    Check probed properties against the accepted codecs and the size limits.
+
+    Raises:
+        VideoRejectedError: With status 400 for empty or broken streams, 415 for
+            codecs not in SUPPORTED_VIDEO_CODECS and 413 for videos over the limits
+    """
+    if probe['fps'] <= 0:
+        raise VideoRejectedError("Video has no valid frame rate")
+    if probe['total_frames'] <= 0:
+        raise VideoRejectedError("Video contains no frames")
+    if probe['width'] <= 0 or probe['height'] <= 0:
+        raise VideoRejectedError("Video has no valid resolution")
+    if SUPPORTED_VIDEO_CODECS and (probe.get('codec') or '') not in SUPPORTED_VIDEO_CODECS:
+        raise VideoRejectedError(f"Unsupported video codec '{probe.get('codec')}'. "
+                                 f"Supported: {', '.join(sorted(SUPPORTED_VIDEO_CODECS))}", 415)
+    if MAX_VIDEO_DURATION_SECONDS and probe['duration'] > MAX_VIDEO_DURATION_SECONDS:
+        raise VideoRejectedError(f"Video is {probe['duration']:.0f} seconds long; "
+                                 f"the maximum is {MAX_VIDEO_DURATION_SECONDS:.0f} seconds", 413)
+    if MAX_VIDEO_DIMENSION and max(probe['width'], probe['height']) > MAX_VIDEO_DIMENSION:
+        raise VideoRejectedError(f"Video resolution {probe['width']}x{probe['height']} exceeds "
+                                 f"the maximum dimension of {MAX_VIDEO_DIMENSION} pixels", 413)
+
+
+class ProbeCache:
+    """Process-local LRU of probe results keyed by file hash."""
+
+    def __init__(self, max_entries: int = PROBE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            probe = self._entries.get(file_hash)
+            if probe is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(file_hash)
+            return dict(probe)
+
+    def set(self, file_hash: str, probe: Dict[str, Any]):
+        with self._lock:
+            self._entries[file_hash] = dict(probe)
+            self._entries.move_to_end(file_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+probe_cache = ProbeCache()
+
+
+def check_video(video_path: str, file_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Probe (or look up the cached probe of) a video and validate it.
+
+    Returns:
+        The probe dict, whose properties can be passed on to frame extraction
+
+    Raises:
+        VideoRejectedError: If the video cannot be read or is not accepted
+    """
+    probe = probe_cache.get(file_hash) if file_hash else None
+    if probe is None:
+        probe = probe_video(video_path)
+        if file_hash:
+            probe_cache.set(file_hash, probe)
+    validate_probe(probe)
+    return probe
+
+
+def preprobe_videos(directory: str, file_hashes) -> int:
+    """
+    Probe every video in ``directory`` into the probe cache (e.g. the demo videos at startup).
+
+    Returns:
+        Number of videos probed
+    """
+    if not os.path.isdir(directory):
+        return 0
+    probed = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not is_video_file(name) or not os.path.isfile(path):
+            continue
+        try:
+            check_video(path, file_hashes.hash(path))
+            probed += 1
+        except (VideoRejectedError, OSError) as e:
+            logger.warning(f"Video {path} failed probing: {e}")
+    logger.info(f"Pre-probed {probed} videos in {directory}")
+    return probed
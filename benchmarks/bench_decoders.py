@@ -0,0 +1,94 @@
+"""
+Benchmark: OpenCV vs. PyAV decoding, decode threads and decode-time scaling.
+
+For each codec a synthetic clip is sampled with every decoder backend, at
+one thread and at DECODE_THREADS threads, at full resolution and scaled to
+--max-dimension. Both backends must return the same frame indices.
+Thread gains need several CPUs; on a single-CPU machine both thread
+settings measure the same.
+
+Usage:
+    python benchmarks/bench_decoders.py --codecs h264 mp4v MJPG --max-frames 10 40
+"""
+import argparse
+import json
+import os
+import time
+
+from synthetic_video import temp_video, CODEC_EXTENSIONS
+from decoders import av, decode_threads, BACKEND_OPENCV, BACKEND_PYAV
+from frame_sampler import sample_frames
+
+
+def run_case(video_path, backend, max_frames, threads, max_dimension, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sampled, _, stats = sample_frames(video_path, max_frames=max_frames, backend=backend, threads=threads,
+                                          max_dimension=max_dimension)
+        timings.append(time.perf_counter() - start)
+    height, width = sampled[0][1].shape[:2] if sampled else (0, 0)
+    return {
+        'seconds': round(min(timings), 4),
+        'frames_decoded': stats['frames_read'] + stats['frames_grabbed'],
+        'packets_skipped': stats.get('packets_skipped', 0),
+        'seeks': stats['seeks'],
+        'output_size': f'{width}x{height}',
+        'frame_indices': [index for index, _ in sampled]
+    }
+
+
+def run(video_path, max_frames, max_dimension, repeats):
+    backends = [BACKEND_OPENCV] + ([BACKEND_PYAV] if av is not None else [])
+    results = {}
+    for threads in sorted({1, decode_threads()}):
+        for dimension in (None, max_dimension):
+            for backend in backends:
+                label = f'{backend}/threads={threads}/max_dimension={dimension or "full"}'
+                results[label] = run_case(video_path, backend, max_frames, threads, dimension, repeats)
+
+            baseline = results[f'{BACKEND_OPENCV}/threads={threads}/max_dimension={dimension or "full"}']
+            for backend in backends[1:]:
+                result = results[f'{backend}/threads={threads}/max_dimension={dimension or "full"}']
+                if result['frame_indices'] != baseline['frame_indices']:
+                    raise AssertionError(f"{backend} sampled different frames than {BACKEND_OPENCV}")
+                result['speedup_vs_opencv'] = round(baseline['seconds'] / result['seconds'], 2)
+
+    for result in results.values():
+        result.pop('frame_indices')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codecs', nargs='+', default=sorted(CODEC_EXTENSIONS), choices=sorted(CODEC_EXTENSIONS))
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--max-frames', type=int, nargs='+', default=[10, 40])
+    parser.add_argument('--max-dimension', type=int, default=768)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    args = parser.parse_args()
+
+    report = {'cpus': os.cpu_count(), 'pyav': av.__version__ if av is not None else None, 'codecs': {}}
+    for codec in args.codecs:
+        video_path = temp_video(args.seconds, args.fps, args.width, args.height, codec)
+        try:
+            report['codecs'][codec] = {
+                f'max_frames={max_frames}': run(video_path, max_frames, args.max_dimension, args.repeats)
+                for max_frames in args.max_frames
+            }
+        finally:
+            os.remove(video_path)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
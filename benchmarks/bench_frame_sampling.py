@@ -0,0 +1,96 @@
+"""
+Benchmark: seek-based frame sampling vs. the original decode-every-frame loop.
+
+Usage:
+    python benchmarks/bench_frame_sampling.py --seconds 120 --width 1920 --height 1080
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+
+from synthetic_video import temp_video, CODEC_EXTENSIONS
+from frame_sampler import sample_frames
+
+
+def legacy_extract(video_path, max_frames=10):
+    """The original extract_frames_from_video loop, without JPEG encoding."""
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_interval = 1 if total_frames <= max_frames else total_frames // max_frames
+
+    kept = []
+    frame_count = 0
+    while cap.isOpened() and len(kept) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_count % frame_interval == 0:
+            kept.append(frame_count)
+        frame_count += 1
+    cap.release()
+    return kept, frame_count
+
+
+def run(video_path, max_frames, repeats):
+    results = {}
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        kept, decoded = legacy_extract(video_path, max_frames)
+        timings.append(time.perf_counter() - start)
+    results['legacy'] = {'seconds': min(timings), 'frames_decoded': decoded, 'frame_indices': kept}
+
+    for label, allow_seek in (('seek', True), ('sequential', False)):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            sampled, _, stats = sample_frames(video_path, max_frames=max_frames, allow_seek=allow_seek)
+            timings.append(time.perf_counter() - start)
+        results[label] = {
+            'seconds': min(timings),
+            # Frames the decoder had to produce for us; seeks add the
+            # keyframe-to-target decode that happens inside FFmpeg.
+            'frames_decoded': stats['frames_read'] + stats['frames_grabbed'],
+            'frames_converted': stats['frames_read'],
+            'seeks': stats['seeks'],
+            'strategy': stats['strategy'],
+            'frame_indices': [index for index, _ in sampled]
+        }
+
+    for label in ('seek', 'sequential'):
+        if results[label]['frame_indices'] != results['legacy']['frame_indices']:
+            raise AssertionError(f"{label} sampled different frames than the legacy loop")
+        results[label]['speedup'] = results['legacy']['seconds'] / results[label]['seconds']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', help='Existing video to benchmark (default: generate one)')
+    parser.add_argument('--seconds', type=int, default=60)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--codec', default='mp4v', choices=sorted(CODEC_EXTENSIONS))
+    parser.add_argument('--max-frames', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    video_path = args.video or temp_video(args.seconds, args.fps, args.width, args.height, args.codec)
+    try:
+        results = run(video_path, args.max_frames, args.repeats)
+    finally:
+        if not args.video:
+            os.remove(video_path)
+
+    for label, result in results.items():
+        result.pop('frame_indices')
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
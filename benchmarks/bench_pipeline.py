@@ -0,0 +1,351 @@
+"""
+Benchmark suite for the video ingestion and analysis pipeline.
+
+Generates synthetic videos of varied length, resolution and codec, then
+measures:
+
+- extraction: ``extract_frames_from_video`` wall time, throughput and stage
+  breakdown (decode/select/encode) per video and sampling mode, with peak
+  memory measured in a fresh process per case
+- encoding: JPEG/base64 cost and payload size per frame for each encoding profile
+- upload: end-to-end ``/upload`` latency in-process against the fake analyzer,
+  with the per-stage breakdown from ``timings=true``
+- scaling: ``/upload`` throughput at increasing client concurrency
+
+Results are written as JSON. Pass ``--compare`` with an earlier result file
+to list the metrics that regressed by more than ``--threshold``; the exit
+code is 1 when any did.
+
+Usage:
+    python benchmarks/bench_pipeline.py --output baseline.json
+    python benchmarks/bench_pipeline.py --output current.json --compare baseline.json
+    python benchmarks/bench_pipeline.py --quick --suites extraction,encoding
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from synthetic_video import generate_video, CODEC_EXTENSIONS
+import decoders
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUITES = ('extraction', 'encoding', 'upload', 'scaling')
+
+# name: (seconds, fps, width, height, codec)
+VIDEO_CASES = {
+    'short-480p-mp4v': (10, 30, 854, 480, 'mp4v'),
+    'medium-720p-mjpg': (30, 30, 1280, 720, 'MJPG'),
+    'medium-720p-xvid': (30, 30, 1280, 720, 'XVID'),
+    'medium-720p-h264': (30, 30, 1280, 720, 'h264'),
+    'medium-720p-vp8': (30, 30, 1280, 720, 'vp8'),
+    'long-1080p-mp4v': (120, 30, 1920, 1080, 'mp4v'),
+}
+QUICK_VIDEO_CASES = {
+    'short-480p-mp4v': (5, 30, 854, 480, 'mp4v'),
+    'short-720p-mjpg': (5, 30, 1280, 720, 'MJPG'),
+}
+
+# Video used for the upload and scaling suites
+UPLOAD_CASE = 'short-480p-mp4v'
+
+# Metrics compared by --compare: (path suffix, True when higher is better)
+COMPARED_METRICS = (
+    ('seconds_median', False),
+    ('peak_rss_mb', False),
+    ('traced_peak_mb', False),
+    ('frames_per_second', True),
+    ('ms_per_frame', False),
+    ('latency_p50', False),
+    ('latency_p95', False),
+    ('requests_per_second', True),
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def prepare_videos(cases, video_dir):
+    """Generate the synthetic videos (reusing ones from an earlier run) and return {name: path}."""
+    os.makedirs(video_dir, exist_ok=True)
+    paths = {}
+    for name, (seconds, fps, width, height, codec) in cases.items():
+        # The parameters are part of the name so edited cases never reuse a stale file
+        path = os.path.join(video_dir, f'{name}-{seconds}s{fps}fps{width}x{height}{CODEC_EXTENSIONS[codec]}')
+        if not os.path.exists(path):
+            print(f"Generating {name} ({seconds}s {width}x{height} {codec})", file=sys.stderr)
+            generate_video(path + '.tmp' + CODEC_EXTENSIONS[codec], seconds=seconds, fps=fps, width=width,
+                           height=height, codec=codec)
+            os.replace(path + '.tmp' + CODEC_EXTENSIONS[codec], path)
+        paths[name] = path
+    return paths
+
+
+def _extract_case(video_path, max_frames, sampling_mode, repeats):
+    """Run in a fresh process so peak RSS belongs to this case alone."""
+    from video_pipeline import extract_frames_from_video
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        frames, video_info = extract_frames_from_video(video_path, max_frames=max_frames,
+                                                       sampling_mode=sampling_mode)
+        seconds.append(time.perf_counter() - start)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    sampling = video_info['sampling']
+    decoded = sampling.get('frames_read', 0) + sampling.get('frames_grabbed', 0)
+    median = statistics.median(seconds)
+    return {
+        'seconds_median': round(median, 4),
+        'seconds_min': round(min(seconds), 4),
+        'frames_per_second': round(len(frames) / median, 2) if median else None,
+        'decoded_frames_per_second': round(decoded / median, 2) if median else None,
+        'frames_kept': len(frames),
+        'frames_decoded': decoded,
+        'stages': video_info.get('timings'),
+        'payload_bytes': sum(frame.base64_size for frame in frames),
+        'peak_rss_mb': round(peak_rss / 1024, 1),
+        'rss_growth_mb': round((peak_rss - baseline_rss) / 1024, 1),
+        'traced_peak_mb': round(traced_peak / 1024 / 1024, 2),
+    }
+
+
+def bench_extraction(videos, max_frames, repeats):
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name, path in videos.items():
+        for sampling_mode in ('uniform', 'motion'):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results[f'{name}/{sampling_mode}'] = pool.submit(
+                    _extract_case, path, max_frames, sampling_mode, repeats).result()
+    return results
+
+
+def bench_encoding(videos, repeats):
+    from frame_encoding import ENCODING_PROFILES, resolve_encoding_settings, encode_to_frame
+
+    results = {}
+    for name, path in videos.items():
+        cap = cv2.VideoCapture(path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) // 2)
+        ok, frame = cap.read()
+        cap.release()
+        if not ok:
+            raise RuntimeError(f"Could not decode a frame from {path}")
+        for profile in ENCODING_PROFILES:
+            settings = resolve_encoding_settings(profile)
+            seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                # JPEG encode plus the data URL built for the model request
+                encoded = encode_to_frame(frame, 0, 0.0, settings)
+                encoded.data_url()
+                seconds.append(time.perf_counter() - start)
+            results[f'{name}/{profile}'] = {
+                'ms_per_frame': round(statistics.median(seconds) * 1000, 3),
+                'base64_bytes': encoded.base64_size,
+            }
+    return results
+
+
+def _upload(flask_app, video_bytes, extra=None):
+    data = {'video': (io.BytesIO(video_bytes), 'bench.mp4'), 'anomaly_prompt': 'fire, smoke'}
+    data.update(extra or {})
+    start = time.perf_counter()
+    response = flask_app.test_client().post('/upload', data=data, content_type='multipart/form-data')
+    return response.status_code, time.perf_counter() - start, response.get_json()
+
+
+def bench_upload(flask_app, video_bytes, requests):
+    latencies = []
+    stages = {}
+    statuses = {}
+    for _ in range(requests):
+        status, latency, body = _upload(flask_app, video_bytes, {'timings': 'true'})
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status != 200:
+            continue
+        latencies.append(latency)
+        for stage, seconds in (body.get('timings') or {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        'requests': requests,
+        'statuses': statuses,
+        'latency_p50': round(percentile(latencies, 0.5), 4) if latencies else None,
+        'latency_p95': round(percentile(latencies, 0.95), 4) if latencies else None,
+        'stages_median': {stage: round(statistics.median(values), 4) for stage, values in sorted(stages.items())},
+    }
+
+
+def bench_scaling(flask_app, video_bytes, levels, requests_per_level):
+    results = {}
+    base_rate = None
+    for level in levels:
+        requests = max(requests_per_level, level)
+        with ThreadPoolExecutor(level) as pool:
+            start = time.perf_counter()
+            outcomes = list(pool.map(lambda _: _upload(flask_app, video_bytes)[:2], range(requests)))
+            elapsed = time.perf_counter() - start
+        latencies = [latency for status, latency in outcomes if status == 200]
+        rate = len(latencies) / elapsed if elapsed else 0.0
+        base_rate = base_rate or rate
+        results[f'concurrency-{level}'] = {
+            'requests': requests,
+            'failed': requests - len(latencies),
+            'requests_per_second': round(rate, 2),
+            'latency_p50': round(percentile(latencies, 0.5), 4) if latencies else None,
+            # 1.0 means throughput grew linearly with concurrency
+            'scaling_efficiency': round(rate / (base_rate * level), 3) if base_rate else None,
+        }
+    return results
+
+
+def load_app(fake_latency, upload_dir):
+    """Import the Flask app configured with the fake analyzer and no result cache."""
+    os.environ.update({
+        'ANALYZER_BACKEND': 'fake',
+        'FAKE_ANALYZER_LATENCY': str(fake_latency),
+        'FAKE_ANALYZER_LATENCY_JITTER': '0',
+        'FAKE_ANALYZER_ERROR_RATE': '0',
+        'FAKE_ANALYZER_THROTTLE_RATE': '0',
+        'RESULT_CACHE_BACKEND': 'none',
+        'UPLOAD_FOLDER': upload_dir,
+    })
+    import app as flask_module
+    return flask_module.app
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'pyav': decoders.av.__version__ if decoders.av is not None else None,
+        'decoder_backend': decoders.DECODER_BACKEND,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        path = f'{prefix}/{key}' if prefix else key
+        if isinstance(value, dict):
+            yield from _flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(current, baseline, threshold):
+    """Return the compared metrics that got worse by more than ``threshold`` (a fraction)."""
+    previous = dict(_flatten(baseline.get('results', {})))
+    regressions = []
+    for path, value in _flatten(current['results']):
+        rule = next((higher for suffix, higher in COMPARED_METRICS if path.endswith('/' + suffix)), None)
+        old = previous.get(path)
+        if rule is None or not old:
+            continue
+        change = (value - old) / old
+        if (-change if rule else change) > threshold:
+            regressions.append({'metric': path, 'baseline': old, 'current': value,
+                                'change': f'{change:+.1%}'})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', default=','.join(SUITES), help=f"Comma-separated suites ({', '.join(SUITES)})")
+    parser.add_argument('--quick', action='store_true', help='Short videos and fewer repeats, for smoke runs')
+    parser.add_argument('--video-dir', default=os.path.join(REPO_DIR, 'benchmarks', '.videos'),
+                        help='Where generated videos are kept between runs')
+    parser.add_argument('--max-frames', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=None, help='Repeats per extraction/encoding case')
+    parser.add_argument('--requests', type=int, default=None, help='Requests for the upload and scaling suites')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='Concurrency levels for the scaling suite')
+    parser.add_argument('--fake-latency', type=float, default=0.2, help='Fake model latency in seconds')
+    parser.add_argument('--output', help='Write the JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='Earlier result file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Regression threshold (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    suites = [suite.strip() for suite in args.suites.split(',') if suite.strip()]
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(unknown)}")
+    repeats = args.repeats or (2 if args.quick else 5)
+    requests = args.requests or (10 if args.quick else 40)
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    videos = prepare_videos(QUICK_VIDEO_CASES if args.quick else VIDEO_CASES, args.video_dir)
+    output = {
+        'environment': environment_info(),
+        'settings': {'quick': args.quick, 'max_frames': args.max_frames, 'repeats': repeats,
+                     'requests': requests, 'fake_latency': args.fake_latency,
+                     'videos': QUICK_VIDEO_CASES if args.quick else VIDEO_CASES},
+        'results': {},
+    }
+
+    if 'extraction' in suites:
+        output['results']['extraction'] = bench_extraction(videos, args.max_frames, repeats)
+    if 'encoding' in suites:
+        output['results']['encoding'] = bench_encoding(videos, repeats * 4)
+    if 'upload' in suites or 'scaling' in suites:
+        upload_dir = os.path.join(args.video_dir, 'uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        flask_app = load_app(args.fake_latency, upload_dir)
+        with open(videos.get(UPLOAD_CASE) or next(iter(videos.values())), 'rb') as f:
+            video_bytes = f.read()
+        if 'upload' in suites:
+            output['results']['upload'] = bench_upload(flask_app, video_bytes, requests)
+        if 'scaling' in suites:
+            output['results']['scaling'] = bench_scaling(flask_app, video_bytes, levels, requests)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(output, json.load(f), args.threshold)
+        output['regressions'] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+                  f"({regression['change']})", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    serialized = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(serialized + '\n')
+    else:
+        print(serialized)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark: upload throughput of the Flask dev server vs. gunicorn (and uvicorn).
+
+Each server is started against the fake analyzer backend, so no Azure calls
+are made, and receives concurrent uploads of the same synthetic clip. The
+result cache is disabled so every request decodes and "calls" the model.
+
+Usage:
+    python benchmarks/bench_serving.py --requests 100 --concurrency 20 --servers dev,gunicorn
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from synthetic_video import temp_video
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # The original Docker CMD
+    'dev': lambda port: [sys.executable, 'app/app.py'],
+    'gunicorn': lambda port: [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+                              '--bind', f'127.0.0.1:{port}'],
+    'uvicorn': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:app', '--app-dir', 'app',
+                             '--port', str(port), '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, port, env, startup_timeout=60):
+    process = subprocess.Popen(SERVERS[name](port), cwd=REPO_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} server exited with code {process.returncode}")
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/health', timeout=2).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"{name} server did not become healthy within {startup_timeout}s")
+
+
+def stop_server(process):
+    # The dev server's reloader runs the app in a child process, so signal the group
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_load(port, video_bytes, requests, concurrency, timeout):
+    url = f'http://127.0.0.1:{port}/upload'
+
+    def upload(_):
+        start = time.perf_counter()
+        try:
+            response = client.post(url, files={'video': ('bench.mp4', video_bytes, 'video/mp4')},
+                                   data={'anomaly_prompt': 'fire, smoke'})
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        return status, time.perf_counter() - start
+
+    limits = httpx.Limits(max_connections=concurrency)
+    with httpx.Client(timeout=timeout, limits=limits) as client, ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        outcomes = list(pool.map(upload, range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for status, latency in outcomes if status == 200]
+    statuses = {}
+    for status, _ in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'statuses': statuses,
+        'latency_p50': percentile(latencies, 0.5) if latencies else None,
+        'latency_p95': percentile(latencies, 0.95) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', default='dev,gunicorn',
+                        help=f"Comma-separated servers to compare ({', '.join(SERVERS)})")
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=1.0, help='Fake model latency in seconds')
+    parser.add_argument('--seconds', type=int, default=10, help='Length of the synthetic clip')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    servers = [name.strip() for name in args.servers.split(',') if name.strip()]
+    unknown = [name for name in servers if name not in SERVERS]
+    if unknown:
+        parser.error(f"Unknown servers: {', '.join(unknown)}")
+
+    video_path = temp_video(args.seconds, 30, args.width, args.height)
+    with open(video_path, 'rb') as f:
+        video_bytes = f.read()
+    os.remove(video_path)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as upload_dir:
+        for name in servers:
+            port = free_port()
+            env = dict(os.environ, PORT=str(port), UPLOAD_FOLDER=upload_dir, ANALYZER_BACKEND='fake',
+                       FAKE_ANALYZER_LATENCY=str(args.latency), FAKE_ANALYZER_LATENCY_JITTER='0',
+                       FAKE_ANALYZER_ERROR_RATE='0', FAKE_ANALYZER_THROTTLE_RATE='0',
+                       RESULT_CACHE_BACKEND='none', GUNICORN_ACCESS_LOG='')
+            process = start_server(name, port, env)
+            try:
+                results[name] = run_load(port, video_bytes, args.requests, args.concurrency, args.timeout)
+            finally:
+                stop_server(process)
+
+    baseline = results.get('dev')
+    if baseline and baseline['requests_per_second']:
+        for name, result in results.items():
+            result['speedup'] = result['requests_per_second'] / baseline['requests_per_second']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
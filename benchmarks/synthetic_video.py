@@ -0,0 +1,90 @@
+"""
+Synthetic video generation for benchmarks.
+
+Videos are rendered with OpenCV (PyAV for h264 and vp8, which OpenCV's
+writer usually lacks) so the benchmarks need no sample footage:
+a moving rectangle over a noisy gradient gives the encoder realistic
+inter-frame changes without depending on external files.
+"""
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+# Make the application modules importable (they live in app/ with flat imports)
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+CODEC_EXTENSIONS = {
+    'mp4v': '.mp4',
+    'MJPG': '.avi',
+    'XVID': '.avi',
+    'h264': '.mkv',
+    'vp8': '.webm',
+}
+
+# Codecs OpenCV's writer usually lacks; these are encoded with PyAV
+PYAV_ENCODERS = {
+    'h264': 'libx264',
+    'vp8': 'libvpx',
+}
+
+
+class _PyAVWriter:
+    """Minimal ``cv2.VideoWriter`` lookalike backed by PyAV."""
+
+    def __init__(self, path, codec, fps, size):
+        import av
+        self.container = av.open(path, 'w')
+        self.stream = self.container.add_stream(PYAV_ENCODERS[codec], rate=fps)
+        self.stream.width, self.stream.height = size
+        self.stream.pix_fmt = 'yuv420p'
+        self._frame_class = av.VideoFrame
+
+    def write(self, frame):
+        for packet in self.stream.encode(self._frame_class.from_ndarray(frame, format='bgr24')):
+            self.container.mux(packet)
+
+    def release(self):
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+
+def generate_video(path, seconds=10, fps=30, width=1280, height=720, codec='mp4v', seed=0):
+    """Write a synthetic clip to ``path`` and return the number of frames written."""
+    if codec in PYAV_ENCODERS:
+        writer = _PyAVWriter(path, codec, fps, (width, height))
+    else:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+        if not writer.isOpened():
+            raise RuntimeError(f"OpenCV cannot encode codec {codec} to {path}")
+
+    rng = np.random.default_rng(seed)
+    gradient = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    background = cv2.merge([gradient, np.flipud(gradient), np.full_like(gradient, 96)])
+    box = max(16, min(width, height) // 8)
+
+    total = int(seconds * fps)
+    for i in range(total):
+        frame = background.copy()
+        noise = rng.integers(0, 24, size=(height // 8, width // 8, 3), dtype=np.uint8)
+        frame = cv2.add(frame, cv2.resize(noise, (width, height), interpolation=cv2.INTER_NEAREST))
+        x = int((width - box) * (i / max(1, total - 1)))
+        y = (height - box) // 2
+        cv2.rectangle(frame, (x, y), (x + box, y + box), (0, 0, 255), -1)
+        cv2.putText(frame, str(i), (16, 48), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+        writer.write(frame)
+    writer.release()
+    return total
+
+
+def temp_video(seconds=10, fps=30, width=1280, height=720, codec='mp4v', directory=None):
+    """Generate a synthetic clip in a temporary file and return its path."""
+    fd, path = tempfile.mkstemp(suffix=CODEC_EXTENSIONS.get(codec, '.avi'), dir=directory)
+    os.close(fd)
+    generate_video(path, seconds=seconds, fps=fps, width=width, height=height, codec=codec)
+    return path
@@ -0,0 +1,133 @@
+"""
+Gunicorn configuration for production serving.
+
+Run from the repository root:
+    gunicorn --config gunicorn.conf.py
+
+The Flask app is preloaded in the master process, so OpenCV and the
+analyzer client are imported and initialised once and shared by the forked
+workers. Each setting can be overridden with the GUNICORN_* variable next
+to it.
+"""
+import os
+import sys
+import shutil
+import multiprocessing
+
+from dotenv import load_dotenv
+
+# The app loads .env itself, but the settings below are read before it is imported
+load_dotenv()
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+
+def _env_flag(name, default):
+    return (os.environ.get(name) or default).strip().lower() in ('1', 'true', 'yes')
+
+
+# Application: the Flask app by default; set GUNICORN_APP=asgi:app with
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker for the asyncio path
+wsgi_app = os.environ.get('GUNICORN_APP', 'app:app')
+pythonpath = 'app'
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 8080)}")
+
+# Requests spend most of their time waiting on the model API, so each worker
+# serves several requests on threads; extra workers add decoding parallelism
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = _env_int('GUNICORN_WORKERS', min(multiprocessing.cpu_count(), 4))
+threads = _env_int('GUNICORN_THREADS', 16)
+preload_app = _env_flag('GUNICORN_PRELOAD', 'true')
+
+# Workers decode at the same time, so automatic decode threads (DECODE_THREADS=0)
+# share the CPUs out between them instead of each taking one per CPU
+os.environ['DECODE_PARALLEL_PROCESSES'] = str(workers)
+
+# Load-balanced requests land on any worker, so with several workers the job
+# store and result cache default to the shared sqlite and disk backends. A
+# per-process job store would lose most job polls, so it is refused. Stream
+# monitors cannot be shared at all: monitoring is off unless there is one worker
+if workers > 1:
+    os.environ['JOB_STORE_BACKEND'] = os.environ.get('JOB_STORE_BACKEND') or 'sqlite'
+    os.environ['RESULT_CACHE_BACKEND'] = os.environ.get('RESULT_CACHE_BACKEND') or 'disk'
+    if os.environ['JOB_STORE_BACKEND'].lower() == 'memory':
+        raise RuntimeError(f"JOB_STORE_BACKEND=memory keeps jobs per process and cannot be used with "
+                           f"{workers} workers; use JOB_STORE_BACKEND=sqlite or GUNICORN_WORKERS=1")
+    if _env_flag('STREAM_MONITORING', 'false'):
+        raise RuntimeError(f"STREAM_MONITORING keeps monitors per process and cannot be used with "
+                           f"{workers} workers; use GUNICORN_WORKERS=1 for stream monitoring")
+    os.environ['STREAM_MONITORING'] = 'false'
+
+# A synchronous analysis (decode plus model calls with retries) can take
+# minutes. The worker timeout matches nginx's proxy_read_timeout, and a
+# graceful shutdown waits as long for in-flight analyses to finish
+timeout = _env_int('GUNICORN_TIMEOUT', 300)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', timeout)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Recycle workers periodically to bound memory growth from video decoding (0 disables)
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 0)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 0)
+
+# Heartbeat files on tmpfs avoid worker timeouts when the container disk is slow
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None  # empty disables access logs
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# Workers write metric samples to PROMETHEUS_MULTIPROC_DIR; files left by a
+# previous run would be added to this run's counters. Prepared here rather
+# than in on_starting because the preloaded app creates its metrics first
+_metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if _metrics_dir:
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def on_starting(server):
+    os.makedirs(os.environ.get('UPLOAD_FOLDER', 'uploads'), exist_ok=True)
+
+
+def when_ready(server):
+    server.log.info(f"Serving {wsgi_app} with {workers} {worker_class} workers x {threads} threads "
+                    f"(timeout {timeout}s, graceful {graceful_timeout}s, preload {preload_app})")
+    if workers > 1:
+        server.log.info(f"Sharing state between workers: JOB_STORE_BACKEND={os.environ['JOB_STORE_BACKEND']}, "
+                        f"RESULT_CACHE_BACKEND={os.environ['RESULT_CACHE_BACKEND']}")
+        server.log.info("Stream monitoring is disabled with several workers (GUNICORN_WORKERS=1 enables it)")
+        if os.environ['RESULT_CACHE_BACKEND'].lower() == 'memory':
+            server.log.warning("RESULT_CACHE_BACKEND=memory: each worker keeps its own result cache; "
+                               "use disk to share it")
+        if os.environ.get('AZURE_OPENAI_RPM_LIMIT') or os.environ.get('AZURE_OPENAI_TPM_LIMIT'):
+            server.log.warning("AZURE_OPENAI_RPM_LIMIT/TPM_LIMIT are enforced per worker process")
+
+
+def worker_exit(server, worker):
+    # Let running background jobs finish within the graceful timeout, mark
+    # jobs that never started as interrupted rather than losing them silently,
+    # and stop live stream monitors and batch decode workers
+    flask_module = sys.modules.get('app')
+    job_manager = getattr(flask_module, 'job_manager', None)
+    if job_manager is not None:
+        job_manager.shutdown(wait=True, cancel_pending=True)
+    stream_monitors = getattr(flask_module, 'stream_monitors', None)
+    if stream_monitors is not None:
+        stream_monitors.shutdown()
+    batch_module = sys.modules.get('batch')
+    if batch_module is not None:
+        batch_module.shutdown_decode_pool()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_abort(worker):
+    worker.log.warning(f"Worker {worker.pid} exceeded the {timeout}s timeout; "
+                       "raise GUNICORN_TIMEOUT if analyses legitimately take longer")
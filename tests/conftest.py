@@ -0,0 +1,5 @@
+"""Test configuration: the application modules live in ``app/`` and use flat imports."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
@@ -0,0 +1,233 @@
+"""Tests for routing, failover and cooldown in DeploymentPool and AsyncDeploymentPool."""
+import json
+import time
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from deployment_pool import DeploymentPool, AsyncDeploymentPool, Deployment
+from fake_analyzer import FakeChatClient, AsyncFakeChatClient, fake_deployments
+
+MESSAGES = [{'role': 'user', 'content': 'ping'}]
+
+
+def deployment_entry(name, **settings):
+    return dict({'endpoint': f'https://{name}.example.com', 'name': name, 'latency': 0, 'latency_jitter': 0},
+                **settings)
+
+
+def make_pool(monkeypatch, entries, pool_class=DeploymentPool, client_class=FakeChatClient, **kwargs):
+    monkeypatch.setenv('FAKE_ANALYZER_DEPLOYMENTS', json.dumps(entries))
+    return pool_class(fake_deployments(client_class), **kwargs)
+
+
+def by_name(pool):
+    return {deployment.name: deployment for deployment in pool.deployments}
+
+
+def call_until_tried(pool, deployment, attempts=64):
+    """Route requests until ``deployment`` has been picked (routing among healthy ties is random)."""
+    for _ in range(attempts):
+        pool.create(model='ignored', messages=MESSAGES)
+        if deployment.requests:
+            return
+    pytest.fail(f"{deployment.name} was never selected")
+
+
+def test_model_is_replaced_by_the_deployment_name(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('a', deployment='gpt-a')])
+    response = pool.create(model='ignored', messages=MESSAGES)
+    assert response.model == 'gpt-a'
+    assert pool.stats()['deployments'][0]['successes'] == 1
+
+
+def test_throttled_deployment_fails_over_and_honours_retry_after(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('throttled', throttle_rate=1, retry_after=30),
+                                   deployment_entry('healthy')])
+    deployments = by_name(pool)
+    call_until_tried(pool, deployments['throttled'])
+
+    # The 429 failed over within the same request; the deployment now cools down for Retry-After
+    assert deployments['throttled'].throttled == 1
+    assert pool.failovers == 1
+    stats = {entry['name']: entry for entry in pool.stats()['deployments']}
+    assert not stats['throttled']['healthy']
+    assert 25 < stats['throttled']['cooldown_remaining'] <= 30
+    assert stats['throttled']['last_error'] == 'RateLimitError'
+
+    # While cooling down it is skipped
+    successes = deployments['healthy'].successes
+    for _ in range(20):
+        pool.create(model='ignored', messages=MESSAGES)
+    assert deployments['throttled'].requests == 1
+    assert deployments['healthy'].successes == successes + 20
+    assert pool.stats()['healthy'] == 1
+
+
+def test_server_error_cooldown_and_restore(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('flaky', error_rate=1), deployment_entry('healthy')],
+                     cooldown=0.2, max_cooldown=1.0)
+    deployments = by_name(pool)
+    flaky = deployments['flaky']
+    call_until_tried(pool, flaky)
+    assert flaky.errors == 1
+    assert flaky.consecutive_failures == 1
+    assert flaky.last_error == 'InternalServerError'
+
+    for _ in range(10):
+        pool.create(model='ignored', messages=MESSAGES)
+    assert flaky.requests == 1
+
+    # Once the cooldown has passed the deployment is routed to again and recovers on success
+    flaky.client.error_rate = 0
+    time.sleep(0.25)
+    assert pool.stats()['healthy'] == 2
+    successes = flaky.successes
+    for _ in range(64):
+        pool.create(model='ignored', messages=MESSAGES)
+        if flaky.successes > successes:
+            break
+    assert flaky.successes > successes
+    assert flaky.consecutive_failures == 0
+    assert flaky.cooldown_until == 0.0
+
+
+def test_cooldown_doubles_per_consecutive_failure_up_to_the_maximum():
+    pool = DeploymentPool([Deployment('only', 'fake://only', 'gpt', FakeChatClient(latency=0, error_rate=1))],
+                          cooldown=1.0, max_cooldown=3.0)
+    only = pool.deployments[0]
+    remaining = []
+    for _ in range(3):
+        only.cooldown_until = 0.0
+        with pytest.raises(openai.InternalServerError):
+            pool.create(model='ignored', messages=MESSAGES)
+        remaining.append(only.cooldown_until - time.monotonic())
+    assert [round(value) for value in remaining] == [1, 2, 3]
+
+
+def test_all_deployments_failing_raises_then_probes_the_first_to_recover(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('slow', throttle_rate=1, retry_after=30),
+                                   deployment_entry('fast', throttle_rate=1, retry_after=5)])
+    deployments = by_name(pool)
+    with pytest.raises(openai.RateLimitError):
+        pool.create(model='ignored', messages=MESSAGES)
+    assert deployments['slow'].requests == 1
+    assert deployments['fast'].requests == 1
+    assert pool.stats()['healthy'] == 0
+
+    # Everything is cooling down: the request still goes to the one that recovers first
+    with pytest.raises(openai.RateLimitError):
+        pool.create(model='ignored', messages=MESSAGES)
+    assert deployments['fast'].requests == 2
+    assert deployments['slow'].requests == 1
+
+
+class BadRequestClient:
+    """Client whose every call is rejected with a 400."""
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        request = httpx.Request('POST', 'https://bad.example.com/chat/completions')
+        raise openai.BadRequestError('Bad request', response=httpx.Response(400, request=request), body=None)
+
+
+def test_client_errors_do_not_fail_over_or_cool_down():
+    client = BadRequestClient()
+    pool = DeploymentPool([Deployment('bad', 'fake://bad', 'gpt', client),
+                           Deployment('other', 'fake://other', 'gpt', BadRequestClient())],
+                          routing='weighted')
+    pool.deployments[1].weight = 1e-9
+    with pytest.raises(openai.BadRequestError):
+        pool.create(model='ignored', messages=MESSAGES)
+    assert client.calls == 1
+    assert pool.failovers == 0
+    assert pool.deployments[0].cooldown_until == 0.0
+    assert pool.stats()['healthy'] == 2
+
+
+def test_weighted_routing_follows_the_weights(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('heavy', weight=3), deployment_entry('light', weight=1)],
+                     routing='weighted')
+    for _ in range(400):
+        pool.create(model='ignored', messages=MESSAGES)
+    deployments = by_name(pool)
+    assert deployments['heavy'].requests + deployments['light'].requests == 400
+    assert 0.65 < deployments['heavy'].requests / 400 < 0.85
+
+
+def test_streamed_calls_stay_outstanding_until_consumed(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('a')])
+    stream = pool.create(model='ignored', messages=MESSAGES, stream=True)
+    assert pool.deployments[0].outstanding == 1
+    chunks = list(stream)
+    assert chunks
+    assert pool.deployments[0].outstanding == 0
+    assert pool.deployments[0].successes == 1
+
+
+def test_async_pool_fails_over_and_skips_cooling_deployments(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('throttled', throttle_rate=1, retry_after=30),
+                                   deployment_entry('healthy')],
+                     pool_class=AsyncDeploymentPool, client_class=AsyncFakeChatClient, max_retries=0)
+    deployments = by_name(pool)
+
+    async def run():
+        for _ in range(64):
+            await pool.create(model='ignored', messages=MESSAGES)
+            if deployments['throttled'].requests:
+                break
+        for _ in range(10):
+            await pool.create(model='ignored', messages=MESSAGES)
+        await pool.close()
+
+    asyncio.run(run())
+    assert deployments['throttled'].requests == 1
+    assert deployments['throttled'].throttled == 1
+    assert deployments['healthy'].successes == deployments['healthy'].requests
+    assert pool.stats()['healthy'] == 1
+
+
+def test_async_pool_waits_for_recovery_then_gives_up(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('a', error_rate=1), deployment_entry('b', error_rate=1)],
+                     pool_class=AsyncDeploymentPool, client_class=AsyncFakeChatClient,
+                     max_retries=2, cooldown=0.05, max_cooldown=0.05)
+
+    async def run():
+        started = time.perf_counter()
+        with pytest.raises(openai.InternalServerError):
+            await pool.create(model='ignored', messages=MESSAGES)
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(run())
+    # Each of the two retries waits for a cooldown before trying both deployments again
+    assert sum(deployment.requests for deployment in pool.deployments) == 6
+    assert elapsed >= 0.1
+
+
+def test_async_pool_recovers_after_cooldown(monkeypatch):
+    pool = make_pool(monkeypatch, [deployment_entry('only', error_rate=1)],
+                     pool_class=AsyncDeploymentPool, client_class=AsyncFakeChatClient,
+                     max_retries=3, cooldown=0.05, max_cooldown=0.05)
+    only = pool.deployments[0]
+
+    async def run():
+        async def heal():
+            await asyncio.sleep(0.02)
+            only.client.error_rate = 0
+        healing = asyncio.ensure_future(heal())
+        response = await pool.create(model='ignored', messages=MESSAGES)
+        await healing
+        return response
+
+    response = asyncio.run(run())
+    assert response.choices[0].message.content
+    assert only.errors == 1
+    assert only.successes == 1
+    assert pool.stats()['healthy'] == 1
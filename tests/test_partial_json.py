@@ -0,0 +1,116 @@
+"""Tests for the incremental JSON object parser used for streamed model output."""
+import json
+
+from partial_json import IncrementalObjectParser
+
+
+def feed_all(parser, fragments):
+    completed = {}
+    for fragment in fragments:
+        completed.update(parser.feed(fragment))
+    return completed
+
+
+def test_reports_each_field_once_its_value_is_closed():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"has_anomaly": true') == {}
+    assert parser.feed(', "confidence_score": 0.9, "desc') == {'has_anomaly': True, 'confidence_score': 0.9}
+    assert parser.feed('ription": "smoke"}') == {'description': 'smoke'}
+    assert parser.complete
+    assert parser.fields == {'has_anomaly': True, 'confidence_score': 0.9, 'description': 'smoke'}
+
+
+def test_one_character_at_a_time_matches_full_parse():
+    document = {'has_anomaly': False, 'anomaly_type': None, 'detected_frames': [1, 2, 3],
+                'description': 'A quiet corridor', 'analysis_metadata': {'frames': 3, 'tags': ['a', 'b']}}
+    text = json.dumps(document)
+    parser = IncrementalObjectParser()
+    feed_all(parser, list(text))
+    assert parser.complete
+    assert parser.fields == document
+    assert parser.text == text
+
+
+def test_escaped_quotes_and_delimiters_inside_strings():
+    text = r'{"description": "He said \"stop, now\" {at} [the] gate\\", "has_anomaly": true}'
+    parser = IncrementalObjectParser()
+    completed = parser.feed(text[:40])
+    assert completed == {}
+    completed = parser.feed(text[40:])
+    assert completed == json.loads(text)
+    assert parser.fields['description'] == 'He said "stop, now" {at} [the] gate\\'
+
+
+def test_escape_split_across_fragments():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"description": "a \\') == {}
+    assert parser.feed('", b", "x": 1}') == {'description': 'a ", b', 'x': 1}
+
+
+def test_unicode_text_and_escapes():
+    text = '{"description": "Person près de la porte — \\u00e9t\\u00e9 \U0001F525", "x": 1}'
+    parser = IncrementalObjectParser()
+    completed = feed_all(parser, [text[i:i + 5] for i in range(0, len(text), 5)])
+    assert completed == {'description': 'Person près de la porte — été 🔥', 'x': 1}
+
+
+def test_key_split_across_chunks():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"has_an') == {}
+    assert parser.feed('omaly": fa') == {}
+    assert parser.feed('lse, "anomaly_') == {'has_anomaly': False}
+    assert parser.feed('type": null}') == {'anomaly_type': None}
+
+
+def test_nested_objects_are_reported_whole():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"meta": {"a": 1, "b": {"c": [1, {"d": 2}]}}') == {}
+    assert parser.fields == {}
+    assert parser.feed(', "x": 2}') == {'meta': {'a': 1, 'b': {'c': [1, {'d': 2}]}}, 'x': 2}
+
+
+def test_text_before_the_object_is_skipped():
+    parser = IncrementalObjectParser()
+    completed = feed_all(parser, ['```json\n', '{"x": 1}', '\n```'])
+    assert completed == {'x': 1}
+    assert parser.complete
+
+
+def test_truncated_input_reports_only_completed_fields():
+    parser = IncrementalObjectParser()
+    completed = feed_all(parser, ['{"has_anomaly": true, ', '"description": "cut o'])
+    assert completed == {'has_anomaly': True}
+    assert not parser.complete
+    assert 'description' not in parser.fields
+
+
+def test_truncated_before_opening_brace():
+    parser = IncrementalObjectParser()
+    assert parser.feed('```json\n') == {}
+    assert parser.fields == {}
+    assert not parser.complete
+
+
+def test_invalid_member_is_skipped():
+    parser = IncrementalObjectParser()
+    completed = feed_all(parser, ['{"x": tru, "y": 2}'])
+    assert completed == {'y': 2}
+
+
+def test_input_after_the_closing_brace_is_ignored():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"x": 1}, "y": 2}') == {'x': 1}
+    assert parser.feed('{"z": 3}') == {}
+    assert parser.fields == {'x': 1}
+
+
+def test_duplicate_keys_keep_the_first_value():
+    parser = IncrementalObjectParser()
+    assert feed_all(parser, ['{"x": 1, ', '"x": 2}']) == {'x': 1}
+    assert parser.fields == {'x': 1}
+
+
+def test_empty_object():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{ }') == {}
+    assert parser.complete